@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import DailyPostStats, DailyUserStats
+
+
+@admin.register(DailyPostStats)
+class DailyPostStatsAdmin(admin.ModelAdmin):
+    list_display = ['day', 'type', 'posts_count', 'likes_count', 'comments_count', 'shares_count']
+    list_filter = ['type']
+    date_hierarchy = 'day'
+
+
+@admin.register(DailyUserStats)
+class DailyUserStatsAdmin(admin.ModelAdmin):
+    list_display = ['day', 'new_users']
+    date_hierarchy = 'day'
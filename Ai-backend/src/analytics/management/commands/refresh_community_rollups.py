@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from analytics.rollups import REFRESH_DAYS, refresh_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute daily community rollups (counts and engagement sums) from posts and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=REFRESH_DAYS, help='Recompute the last N days')
+        parser.add_argument('--all', action='store_true', help='Rebuild every day (initial backfill)')
+
+    def handle(self, *args, **options):
+        post_rows, user_rows = refresh_rollups(days=options['days'], full=options['all'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {post_rows} post rollup rows and {user_rows} user rollup rows"))
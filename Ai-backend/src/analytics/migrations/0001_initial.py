@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('new_users', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyPostStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('type', models.CharField(max_length=20)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('likes_count', models.PositiveBigIntegerField(default=0)),
+                ('comments_count', models.PositiveBigIntegerField(default=0)),
+                ('shares_count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', 'type'],
+                'unique_together': {('day', 'type')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import migrations
+
+from analytics.rollups import rebuild_rollups
+
+
+def backfill_rollups(apps, schema_editor):
+    # Posts and users created before the rollups existed; the signals keep the rows current from here
+    user_app, user_model = settings.AUTH_USER_MODEL.split('.')
+    rebuild_rollups(
+        apps.get_model('social_media', 'Post'),
+        apps.get_model(user_app, user_model),
+        apps.get_model('analytics', 'DailyPostStats'),
+        apps.get_model('analytics', 'DailyUserStats'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('social_media', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,31 @@
 from django.db import models
 
-# Create your models here.
+
+class DailyPostStats(models.Model):
+    """Posts created per day and type, with the engagement those posts have received"""
+    day = models.DateField()
+    type = models.CharField(max_length=20)  # Post.type
+    posts_count = models.PositiveIntegerField(default=0)
+    # Engagement sums over the day's posts, refreshed by refresh_community_rollups
+    likes_count = models.PositiveBigIntegerField(default=0)
+    comments_count = models.PositiveBigIntegerField(default=0)
+    shares_count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['day', 'type']
+        ordering = ['-day', 'type']
+
+    def __str__(self):
+        return f"{self.day} {self.type}: {self.posts_count} posts"
+
+
+class DailyUserStats(models.Model):
+    """New users per day"""
+    day = models.DateField(unique=True)
+    new_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"{self.day}: {self.new_users} new users"
@@ -0,0 +1,140 @@
+"""
+Daily rollups behind the community stats endpoint.
+
+Post and user creation and deletion adjust the rows of their day as they happen,
+via the signals in ``signals.py``. Migration 0002 fills the rows of data that
+existed before the rollups did. Engagement sums change on every reaction, so
+they are not pushed from the hot counter path. ``refresh_rollups`` recomputes
+them, together with exact counts for the recent days, from the source tables.
+It also corrects any drift. ``community_stats`` then reads a few weeks of
+pre-aggregated rows however large the posts and users tables grow.
+"""
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from social_media.models import Post
+
+from .models import DailyPostStats, DailyUserStats
+
+User = get_user_model()
+
+REFRESH_DAYS = 14  # This week and last week, as compared by community_stats
+
+
+def _adjust(model, lookup, field, delta):
+    # Create the day's row if needed, then adjust it in place so concurrent writers never lose a count
+    model.objects.bulk_create([model(**lookup)], ignore_conflicts=True)
+    model.objects.filter(**lookup).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def record_post_created(post):
+    _adjust(DailyPostStats, {'day': timezone.localdate(post.created_at), 'type': post.type}, 'posts_count', 1)
+
+
+def record_post_deleted(post):
+    _adjust(DailyPostStats, {'day': timezone.localdate(post.created_at), 'type': post.type}, 'posts_count', -1)
+
+
+def record_user_created(user):
+    _adjust(DailyUserStats, {'day': timezone.localdate(user.created_at)}, 'new_users', 1)
+
+
+def record_user_deleted(user):
+    _adjust(DailyUserStats, {'day': timezone.localdate(user.created_at)}, 'new_users', -1)
+
+
+def refresh_rollups(days=REFRESH_DAYS, full=False):
+    """Recompute the rollup rows of the last `days` days (or all of them) from the source tables"""
+    since = None if full else timezone.localdate() - timedelta(days=days - 1)
+    return rebuild_rollups(Post, User, DailyPostStats, DailyUserStats, since)
+
+
+def rebuild_rollups(post_model, user_model, post_stats_model, user_stats_model, since=None):
+    """Replace the rollup rows from `since` on (all rows for None); takes models so migrations can pass theirs"""
+    posts = post_model.objects.all()
+    users = user_model.objects.all()
+    if since is not None:
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        posts = posts.filter(created_at__gte=start)
+        users = users.filter(created_at__gte=start)
+
+    post_rows = [
+        post_stats_model(
+            day=row['day'], type=row['type'], posts_count=row['posts'],
+            likes_count=row['likes'] or 0, comments_count=row['comments'] or 0, shares_count=row['shares'] or 0
+        )
+        for row in posts.annotate(day=TruncDate('created_at')).values('day', 'type').annotate(
+            posts=Count('id'), likes=Sum('likes_count'), comments=Sum('comments_count'), shares=Sum('shares_count')
+        ).order_by()
+    ]
+    user_rows = [
+        user_stats_model(day=row['day'], new_users=row['new_users'])
+        for row in users.annotate(day=TruncDate('created_at')).values('day').annotate(
+            new_users=Count('id')
+        ).order_by()
+    ]
+
+    with transaction.atomic():
+        stale_posts = post_stats_model.objects.all()
+        stale_users = user_stats_model.objects.all()
+        if since is not None:
+            stale_posts = stale_posts.filter(day__gte=since)
+            stale_users = stale_users.filter(day__gte=since)
+        stale_posts.delete()
+        stale_users.delete()
+        post_stats_model.objects.bulk_create(post_rows, batch_size=1000)
+        user_stats_model.objects.bulk_create(user_rows, batch_size=1000)
+    return len(post_rows), len(user_rows)
+
+
+def community_stats():
+    """The community stats payload, from rollup rows only"""
+    today = timezone.localdate()
+    week_ago = today - timedelta(days=7)
+
+    totals = DailyPostStats.objects.aggregate(posts=Sum('posts_count'))
+    total_users = DailyUserStats.objects.aggregate(users=Sum('new_users'))['users'] or 0
+
+    posts_today = posts_this_week = posts_last_week = 0
+    week_posts = week_likes = week_comments = week_shares = 0
+    posts_by_type = {}
+    for row in DailyPostStats.objects.filter(day__gte=week_ago - timedelta(days=7)):
+        if row.day == today:
+            posts_today += row.posts_count
+        if row.day >= week_ago:
+            posts_this_week += row.posts_count
+            week_posts += row.posts_count
+            week_likes += row.likes_count
+            week_comments += row.comments_count
+            week_shares += row.shares_count
+            posts_by_type[row.type] = posts_by_type.get(row.type, 0) + row.posts_count
+        else:
+            posts_last_week += row.posts_count
+
+    # Average likes + 2x comments + 3x shares per recent post, scaled down by 10
+    if week_posts:
+        engagement_rate = (week_likes + week_comments * 2 + week_shares * 3) / week_posts / 10
+    else:
+        engagement_rate = 0
+
+    trending_type = max(posts_by_type, key=posts_by_type.get) if any(posts_by_type.values()) else None
+
+    if posts_last_week > 0:
+        growth_rate = ((posts_this_week - posts_last_week) / posts_last_week) * 100
+        weekly_growth = f"+{growth_rate:.1f}%" if growth_rate > 0 else f"{growth_rate:.1f}%"
+    else:
+        weekly_growth = "+100%" if posts_this_week > 0 else "0%"
+
+    return {
+        'total_posts': totals['posts'] or 0,
+        'total_users': total_users,
+        'posts_today': posts_today,
+        'engagement_rate': round(engagement_rate, 1),
+        'trending_category': trending_type.title() if trending_type else 'Wellness',
+        'weekly_growth': weekly_growth
+    }
@@ -1,3 +1,46 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from social_media.models import Post
+
+from .models import DailyPostStats, DailyUserStats
+from .rollups import community_stats
+
+User = get_user_model()
+
+
+class RollupTests(TestCase):
+    def create_user(self, i):
+        return User.objects.create_user(email=f"user{i}@example.com", name=f"User {i}", password='pw')
+
+    def test_signals_track_creates_and_deletes(self):
+        author, other = self.create_user(0), self.create_user(1)
+        Post.objects.create(user=author, content='Run', type='fitness')
+        Post.objects.create(user=other, content='Salad', type='nutrition')
+
+        stats = community_stats()
+        self.assertEqual((stats['total_posts'], stats['total_users'], stats['posts_today']), (2, 2, 2))
+
+        # Deleting a user uncounts the user and the posts that cascade with them
+        author.delete()
+        stats = community_stats()
+        self.assertEqual((stats['total_posts'], stats['total_users']), (1, 1))
+        self.assertEqual(stats['trending_category'], 'Nutrition')
+
+    def test_migration_backfills_existing_rows(self):
+        author = self.create_user(0)
+        Post.objects.create(user=author, content='Run', type='fitness', likes_count=4)
+        Post.objects.create(user=author, content='Yoga', type='fitness', likes_count=1)
+        DailyPostStats.objects.all().delete()
+        DailyUserStats.objects.all().delete()
+
+        migration = import_module('analytics.migrations.0002_backfill_rollups')
+        migration.backfill_rollups(apps, None)
 
-# Create your tests here.
+        row = DailyPostStats.objects.get()
+        self.assertEqual((row.day, row.type, row.posts_count, row.likes_count), (timezone.localdate(), 'fitness', 2, 5))
+        self.assertEqual(DailyUserStats.objects.get().new_users, 1)
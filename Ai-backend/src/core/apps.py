@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Register @task functions from every app's tasks.py so workers can run them
+        from django.utils.module_loading import autodiscover_modules
+        autodiscover_modules('tasks')
@@ -0,0 +1,120 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.task_queue import claim_tasks, execute_task, renew_leases
+
+
+def run_claimed_task(row):
+    try:
+        return execute_task(row)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks with a pool of worker threads (and optionally processes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queues', default='default,email,fanout,maintenance',
+                            help='Comma-separated queues to work, in priority order')
+        parser.add_argument('--concurrency', type=int, default=4, help='Worker threads per process')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when idle')
+        parser.add_argument('--burst', action='store_true', help='Exit once no tasks are due')
+
+    def handle(self, *args, **options):
+        if options['processes'] > 1:
+            return self.run_processes(options)
+
+        queues = [queue.strip() for queue in options['queues'].split(',') if queue.strip()]
+        concurrency = options['concurrency']
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+        self.stdout.write(f"Worker {worker_id} running {concurrency} threads on queues {', '.join(queues)}")
+        in_flight = {}  # future -> task id
+        succeeded = failed = 0
+        last_renewal = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='task-worker') as pool:
+            try:
+                while not stopping.is_set():
+                    for future in [future for future in in_flight if future.done()]:
+                        in_flight.pop(future)
+                        if self.task_succeeded(future):
+                            succeeded += 1
+                        else:
+                            failed += 1
+
+                    claimed = []
+                    if len(in_flight) < concurrency:
+                        claimed = claim_tasks(queues, concurrency - len(in_flight), worker_id)
+                        for row in claimed:
+                            in_flight[pool.submit(run_claimed_task, row)] = row.id
+
+                    if time.monotonic() - last_renewal > settings.TASK_QUEUE_LEASE_SECONDS / 3:
+                        renew_leases(list(in_flight.values()), worker_id)
+                        last_renewal = time.monotonic()
+                    close_old_connections()
+
+                    if not claimed:
+                        if options['burst'] and not in_flight:
+                            break
+                        stopping.wait(options['poll_interval'] if not in_flight else 0.05)
+            except KeyboardInterrupt:
+                pass
+            # Leaving the pool waits for in-flight tasks; unstarted work stays queued in the database
+            for future in in_flight:
+                if self.task_succeeded(future):
+                    succeeded += 1
+                else:
+                    failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker_id} stopped: {succeeded} succeeded, {failed} failed"))
+
+    def task_succeeded(self, future):
+        try:
+            return future.result()
+        except Exception as e:
+            # execute_task records task failures itself; this is the bookkeeping write failing
+            self.stderr.write(f"Task bookkeeping error: {str(e)}")
+            return False
+
+    def run_processes(self, options):
+        command = [
+            sys.executable, sys.argv[0], 'run_task_worker',
+            '--queues', options['queues'],
+            '--concurrency', str(options['concurrency']),
+            '--poll-interval', str(options['poll_interval']),
+        ]
+        if options['burst']:
+            command.append('--burst')
+
+        children = [subprocess.Popen(command) for _ in range(options['processes'])]
+
+        def stop_children(*_):
+            # Each child finishes its in-flight tasks on SIGTERM before exiting
+            for child in children:
+                if child.poll() is None:
+                    child.terminate()
+
+        signal.signal(signal.SIGTERM, stop_children)
+        try:
+            for child in children:
+                child.wait()
+        except KeyboardInterrupt:
+            stop_children()
+            for child in children:
+                child.wait()
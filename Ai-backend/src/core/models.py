@@ -1,3 +1,47 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 
-# Create your models here.
+
+class Task(models.Model):
+    """A unit of background work, claimed by run_task_worker with SELECT ... FOR UPDATE SKIP LOCKED"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)  # Registered task name, see core.task_queue
+    queue = models.CharField(max_length=50, default='default')
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # At most one queued or running task per key; enqueueing a duplicate is a no-op
+    dedupe_key = models.CharField(max_length=255, null=True, blank=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)  # Not claimed before this time (retry backoff)
+    locked_until = models.DateTimeField(null=True, blank=True)  # Worker lease, renewed while running
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['queue', 'status', 'run_at'], name='core_task_claim_idx'),
+            models.Index(fields=['status', 'locked_until'], name='core_task_lease_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=Q(status__in=['queued', 'running']),
+                name='core_task_active_dedupe_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.queue}] ({self.status})"
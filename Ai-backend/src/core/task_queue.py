@@ -0,0 +1,204 @@
+"""
+Background tasks stored in the database, no broker needed.
+
+Functions decorated with ``@task`` are registered by name and queued with
+``.delay(...)``. Queueing inside a transaction commits the task with the rest of
+the work, so a task is never lost and never runs against uncommitted rows.
+``run_task_worker`` claims due tasks with ``SELECT ... FOR UPDATE SKIP LOCKED``,
+never runs more than ``TASK_QUEUE_CONCURRENCY[queue]`` tasks of a queue at once
+across all workers, renews leases while tasks run, and retries failures with
+exponential backoff. A task whose worker died is claimed again once its lease
+expires. Deployments without a worker (``TASK_QUEUE_WORKER`` unset) run tasks of
+``TASK_QUEUE_EAGER_QUEUES`` in-process right after the commit that queued them;
+other queues, such as fan-out, wait for a worker.
+"""
+import logging
+import random
+import zlib
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class TaskFunction:
+    """A registered task; call it to run inline, or use .delay() to queue it"""
+
+    def __init__(self, func, name, queue, max_attempts):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return enqueue(self.name, args=args, kwargs=kwargs)
+
+    def enqueue(self, args=(), kwargs=None, dedupe_key=None, countdown=0, queue=None):
+        return enqueue(
+            self.name, args=args, kwargs=kwargs, dedupe_key=dedupe_key, countdown=countdown, queue=queue
+        )
+
+
+def task(name=None, queue='default', max_attempts=None):
+    """Register a function as a background task; arguments must be JSON serializable"""
+    def register(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        task_function = TaskFunction(
+            func, task_name, queue, max_attempts or settings.TASK_QUEUE_MAX_ATTEMPTS
+        )
+        _registry[task_name] = task_function
+        return task_function
+    return register
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"Unknown task: {name}")
+
+
+def enqueue(name, args=(), kwargs=None, dedupe_key=None, countdown=0, queue=None):
+    """
+    Queue a registered task. With a dedupe_key, nothing is queued while another
+    task with that key is still queued or running, and that task is returned instead.
+    """
+    task_function = get_task(name)
+    row = Task(
+        name=name,
+        queue=queue or task_function.queue,
+        args=list(args),
+        kwargs=kwargs or {},
+        dedupe_key=dedupe_key,
+        max_attempts=task_function.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=countdown),
+    )
+
+    if dedupe_key is None:
+        row.save()
+    else:
+        # ON CONFLICT DO NOTHING against the partial unique index on active dedupe keys
+        Task.objects.bulk_create([row], ignore_conflicts=True)
+        row = Task.objects.filter(dedupe_key=dedupe_key, status__in=['queued', 'running']).first()
+
+    # Only short tasks run eagerly; they hold up the request that committed them
+    eager = settings.TASK_QUEUE_RUN_EAGERLY and row is not None and row.queue in settings.TASK_QUEUE_EAGER_QUEUES
+    if eager and row.status == 'queued':
+        transaction.on_commit(partial(run_task_now, row.id))
+    return row
+
+
+def run_task_now(task_id):
+    """Claim and run one specific task in this thread (eager mode and tests)"""
+    claimed = _claim(Task.objects.filter(id=task_id), 1, 'eager')
+    if claimed:
+        execute_task(claimed[0])
+
+
+def backoff_seconds(attempts):
+    """Exponential backoff with jitter: base, 2x base, 4x base... up to TASK_QUEUE_MAX_BACKOFF"""
+    delay = min(settings.TASK_QUEUE_RETRY_BACKOFF * 2 ** (attempts - 1), settings.TASK_QUEUE_MAX_BACKOFF)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _lease_expiry():
+    return timezone.now() + timedelta(seconds=settings.TASK_QUEUE_LEASE_SECONDS)
+
+
+def _claim(candidates, limit, worker_id):
+    now = timezone.now()
+    with transaction.atomic():
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        # Due queued tasks, plus running tasks whose worker stopped renewing the lease
+        tasks = list(
+            candidates.filter(
+                Q(status='queued', run_at__lte=now) |
+                Q(status='running', locked_until__lt=now, attempts__lt=F('max_attempts'))
+            )
+            .select_for_update(skip_locked=skip_locked)
+            .order_by('run_at', 'id')[:limit]
+        )
+        # attempts counts claims, so a task that keeps killing its worker still runs out of attempts
+        Task.objects.filter(id__in=[row.id for row in tasks]).update(
+            status='running', attempts=F('attempts') + 1, locked_until=_lease_expiry(), locked_by=worker_id
+        )
+    for row in tasks:
+        row.status = 'running'
+        row.attempts += 1
+        row.locked_by = worker_id
+    return tasks
+
+
+def _queue_lock(queue):
+    # Serializes claiming per queue so concurrency limits hold across workers
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [zlib.crc32(f"task_queue:{queue}".encode())])
+
+
+def claim_tasks(queues, limit, worker_id):
+    """Claim up to `limit` due tasks from `queues`, respecting each queue's concurrency limit"""
+    claimed = []
+    limits = settings.TASK_QUEUE_CONCURRENCY
+    # Abandoned tasks that have used up their attempts would otherwise hold their dedupe key forever
+    Task.objects.filter(
+        queue__in=queues, status='running', locked_until__lt=timezone.now(), attempts__gte=F('max_attempts')
+    ).update(status='failed', last_error='Worker lost the task lease', finished_at=timezone.now())
+    for queue in queues:
+        room = limit - len(claimed)
+        if room <= 0:
+            break
+        with transaction.atomic():
+            _queue_lock(queue)
+            if queue in limits:
+                active = Task.objects.filter(
+                    queue=queue, status='running', locked_until__gte=timezone.now()
+                ).count()
+                room = min(room, limits[queue] - active)
+            if room > 0:
+                claimed.extend(_claim(Task.objects.filter(queue=queue), room, worker_id))
+    return claimed
+
+
+def renew_leases(task_ids, worker_id):
+    """Extend the lease of tasks this worker is still running"""
+    if task_ids:
+        Task.objects.filter(id__in=task_ids, status='running', locked_by=worker_id).update(
+            locked_until=_lease_expiry()
+        )
+
+
+def execute_task(row):
+    """Run a claimed task and record success, a retry with backoff, or final failure"""
+    try:
+        get_task(row.name)(*row.args, **row.kwargs)
+    except Exception as e:
+        logger.exception("Task %s (%s) failed on attempt %s", row.name, row.id, row.attempts)
+        if row.attempts < row.max_attempts:
+            Task.objects.filter(id=row.id).update(
+                status='queued', locked_until=None, locked_by='', last_error=str(e),
+                run_at=timezone.now() + timedelta(seconds=backoff_seconds(row.attempts))
+            )
+        else:
+            Task.objects.filter(id=row.id).update(
+                status='failed', locked_until=None, last_error=str(e), finished_at=timezone.now()
+            )
+        return False
+    else:
+        Task.objects.filter(id=row.id).update(
+            status='succeeded', locked_until=None, last_error='', finished_at=timezone.now()
+        )
+        return True
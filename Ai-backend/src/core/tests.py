@@ -1,3 +1,100 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .task_queue import claim_tasks, execute_task, run_task_now, task
+
+calls = []
+
+
+@task(name='core.tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task(name='core.tests.send', queue='email')
+def send(value):
+    calls.append(value)
+
+
+@task(name='core.tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def expire(self, row):
+        Task.objects.filter(id=row.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_repeat_dedupe_key_is_a_no_op(self):
+        first = record.enqueue(args=[1], dedupe_key='record:1')
+        second = record.enqueue(args=[2], dedupe_key='record:1')
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Task.objects.get().args, [1])
+
+        # A finished task frees its key
+        run_task_now(first.id)
+        self.assertNotEqual(record.enqueue(args=[3], dedupe_key='record:1').id, first.id)
+
+    @override_settings(TASK_QUEUE_RETRY_BACKOFF=10)
+    def test_retries_with_backoff_then_fails(self):
+        row = explode.delay()
+        with self.assertLogs('core.task_queue', 'ERROR'):
+            run_task_now(row.id)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts, row.last_error), ('queued', 1, 'boom'))
+        self.assertGreater(row.run_at, timezone.now() + timedelta(seconds=7))
+
+        # Not due again before the backoff is over
+        run_task_now(row.id)
+        self.assertEqual(Task.objects.get(id=row.id).attempts, 1)
+
+        Task.objects.filter(id=row.id).update(run_at=timezone.now())
+        with self.assertLogs('core.task_queue', 'ERROR'):
+            run_task_now(row.id)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('failed', 2))
+        self.assertIsNotNone(row.finished_at)
+
+    def test_expired_lease_is_claimed_again(self):
+        row = record.delay(1)
+        self.assertEqual([claimed.id for claimed in claim_tasks(['default'], 1, 'worker-1')], [row.id])
+        self.assertEqual(claim_tasks(['default'], 1, 'worker-2'), [])
+
+        self.expire(row)
+        claimed = claim_tasks(['default'], 1, 'worker-2')
+        self.assertEqual([item.id for item in claimed], [row.id])
+        row.refresh_from_db()
+        self.assertEqual((row.attempts, row.locked_by), (2, 'worker-2'))
+
+        execute_task(claimed[0])
+        self.assertEqual(Task.objects.get(id=row.id).status, 'succeeded')
+        self.assertEqual(calls, [1])
+
+    @override_settings(TASK_QUEUE_CONCURRENCY={'limited': 2})
+    def test_concurrency_limit_holds_across_claims(self):
+        for value in range(3):
+            record.enqueue(args=[value], queue='limited')
+        claimed = claim_tasks(['limited'], 10, 'worker-1')
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(claim_tasks(['limited'], 10, 'worker-2'), [])
+
+        execute_task(claimed[0])
+        self.assertEqual(len(claim_tasks(['limited'], 10, 'worker-2')), 1)
+
+    @override_settings(TASK_QUEUE_RUN_EAGERLY=True, TASK_QUEUE_EAGER_QUEUES=['email'])
+    def test_eager_tasks_run_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sent = send.delay('otp')
+            queued = record.delay('fanout')
+            self.assertEqual(calls, [])
+
+        # Only eager queues run in-process; the rest wait for a worker
+        self.assertEqual(calls, ['otp'])
+        self.assertEqual(Task.objects.get(id=sent.id).status, 'succeeded')
+        self.assertEqual(Task.objects.get(id=queued.id).status, 'queued')
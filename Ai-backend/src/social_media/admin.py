@@ -3,7 +3,8 @@ from django.utils.html import format_html
 from .models import (
     Post, PostMedia, PostMetrics, Hashtag, PostHashtag, Reaction, Comment,
     CommentLike, Follow, Bookmark, Share, Message, UserProfile, Report,
-    Notification, PostView
+    Notification, PostView, TimelineEntry, HashtagTrendBucket, FanoutJob,
+    SuggestedFollows, NotificationDigestEvent
 )
 
 @admin.register(UserProfile)
@@ -35,11 +36,17 @@ class PostAdmin(admin.ModelAdmin):
 
 @admin.register(Hashtag)
 class HashtagAdmin(admin.ModelAdmin):
-    list_display = ['name', 'posts_count', 'trending_score', 'created_at']
+    list_display = ['name', 'posts_count', 'trending_score', 'growth_rate', 'created_at']
     search_fields = ['name']
     readonly_fields = ['created_at']
     ordering = ['-trending_score', '-posts_count']
 
+@admin.register(FanoutJob)
+class FanoutJobAdmin(admin.ModelAdmin):
+    list_display = ['post', 'status', 'processed_count', 'followers_total', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
 @admin.register(Reaction)
 class ReactionAdmin(admin.ModelAdmin):
     list_display = ['user', 'post', 'reaction_type', 'created_at']
@@ -82,7 +89,7 @@ class MessageAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ['user', 'notification_type', 'title', 'is_read', 'created_at']
+    list_display = ['user', 'notification_type', 'title', 'actor_count', 'is_read', 'created_at']
     list_filter = ['notification_type', 'is_read', 'created_at']
     search_fields = ['user__username', 'title', 'message']
     readonly_fields = ['id', 'created_at']
@@ -111,3 +118,7 @@ admin.site.register(PostHashtag)
 admin.site.register(CommentLike)
 admin.site.register(Share)
 admin.site.register(PostView)
+admin.site.register(TimelineEntry)
+admin.site.register(HashtagTrendBucket)
+admin.site.register(SuggestedFollows)
+admin.site.register(NotificationDigestEvent)
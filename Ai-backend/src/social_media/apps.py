@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Cache backends whose data is private to one process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
 
 
 class SocialMediaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'social_media'
+
+    def ready(self):
+        backend = settings.CACHES['default']['BACKEND']
+        if settings.SOCIAL_REQUIRE_SHARED_CACHE and backend in PROCESS_LOCAL_CACHES:
+            # Versions, counter buffers and unread counts would silently diverge between workers
+            raise ImproperlyConfigured(
+                f"social_media keeps state shared between workers in the cache, but the default cache is "
+                f"{backend}. Set REDIS_URL, or SOCIAL_REQUIRE_SHARED_CACHE=false for a single process."
+            )
+
+        # Push notifications saved on any write path to open notification streams
+        from . import signals
@@ -0,0 +1,153 @@
+"""
+As-you-type suggestions for hashtags and people.
+
+The most used hashtags are served from an in-memory prefix trie whose nodes keep
+their own top suggestions, so a lookup costs one step per typed character. The
+trie is rebuilt every ``SOCIAL_AUTOCOMPLETE_REFRESH`` seconds in the background.
+Prefixes that fall outside the trie, and people, go to the database. There,
+substring matches on ``Hashtag.name``, ``User.name`` and the email local part use
+pg_trgm GIN indexes on PostgreSQL.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, CharField, F, Func, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .background import run_logged
+from .hashtags import normalize_hashtag
+from .models import Hashtag
+
+User = get_user_model()
+
+SUGGESTIONS_PER_NODE = 10  # Largest `limit` the trie can answer on its own
+
+
+class _TrieNode:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []  # [(name, posts_count)] best first, at most SUGGESTIONS_PER_NODE
+
+
+class HashtagTrie:
+    """Prefix trie over the top hashtags by posts_count"""
+
+    def __init__(self, hashtags=()):
+        self.root = _TrieNode()
+        self.size = 0
+        # Inserting in descending posts_count order fills every node's top list best-first
+        for name, posts_count in sorted(hashtags, key=lambda item: (-item[1], item[0])):
+            self.insert(name, posts_count)
+
+    def insert(self, name, posts_count):
+        node = self.root
+        for char in name:
+            node = node.children.setdefault(char, _TrieNode())
+            if len(node.top) < SUGGESTIONS_PER_NODE:
+                node.top.append((name, posts_count))
+        self.size += 1
+
+    def complete(self, prefix, limit):
+        """[(name, posts_count)] for hashtags starting with prefix, most used first"""
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.top[:limit]
+
+
+class HashtagTrieCache:
+    """Holds the current trie and swaps in a rebuilt one once it is older than the refresh interval"""
+
+    def __init__(self):
+        self._trie = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def build(self):
+        top = Hashtag.objects.filter(posts_count__gt=0).order_by('-posts_count').values_list(
+            'name', 'posts_count'
+        )[:settings.SOCIAL_AUTOCOMPLETE_TRIE_SIZE]
+        self._trie = HashtagTrie(top)
+        self._built_at = time.monotonic()
+        return self._trie
+
+    def _refresh_in_background(self):
+        run_logged(self.build, 'Hashtag trie refresh')
+        self._refreshing = False
+
+    def get(self):
+        if self._trie is None:
+            with self._lock:
+                if self._trie is None:
+                    self.build()
+        elif time.monotonic() - self._built_at > settings.SOCIAL_AUTOCOMPLETE_REFRESH:
+            # Keep serving the current trie while a fresh one is built
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, name='hashtag-trie-refresh', daemon=True).start()
+        return self._trie
+
+
+hashtag_trie = HashtagTrieCache()
+
+
+def suggest_hashtags(prefix, limit):
+    """Hashtags starting with (then containing) the prefix, most used first"""
+    prefix = normalize_hashtag(prefix)
+    if not prefix:
+        return []
+
+    trie = hashtag_trie.get()
+    suggestions = trie.complete(prefix, limit)
+    # A full answer from the trie is exact: hashtags left out of it have fewer posts than any in it
+    if len(suggestions) >= limit and limit <= SUGGESTIONS_PER_NODE:
+        return [{'name': name, 'posts_count': posts_count} for name, posts_count in suggestions]
+
+    queryset = Hashtag.objects.filter(name__icontains=prefix).annotate(
+        starts=Case(When(name__startswith=prefix, then=Value(1)), default=Value(0), output_field=IntegerField())
+    )
+    ordering = ['-starts', '-posts_count', 'name']
+    if connection.vendor == 'postgresql':
+        queryset = queryset.annotate(similarity=TrigramSimilarity('name', prefix))
+        ordering.insert(1, '-similarity')
+    return list(queryset.order_by(*ordering).values('name', 'posts_count')[:limit])
+
+
+def suggest_users(text, limit, exclude_user_id=None):
+    """Active users whose name or email local part starts with (then contains) the text"""
+    text = text.strip().lstrip('@').strip()
+    if not text:
+        return User.objects.none()
+
+    queryset = User.objects.filter(is_active=True).select_related('social_profile')
+    if exclude_user_id is not None:
+        queryset = queryset.exclude(id=exclude_user_id)
+
+    if connection.vendor == 'postgresql':
+        # Same expression as the trigram index on the email local part
+        queryset = queryset.annotate(
+            email_local=Func(F('email'), Value('@'), Value(1), function='SPLIT_PART', output_field=CharField())
+        ).filter(Q(name__icontains=text) | Q(email_local__icontains=text)).annotate(
+            similarity=Greatest(TrigramSimilarity('name', text), TrigramSimilarity('email_local', text))
+        )
+        starts = Q(name__istartswith=text) | Q(email_local__istartswith=text)
+        ordering = ['-starts', '-similarity']
+    else:
+        queryset = queryset.filter(Q(name__icontains=text) | Q(email__istartswith=text))
+        starts = Q(name__istartswith=text) | Q(email__istartswith=text)
+        ordering = ['-starts']
+
+    queryset = queryset.annotate(
+        starts=Case(When(starts, then=Value(1)), default=Value(0), output_field=IntegerField())
+    )
+    return queryset.order_by(*ordering, F('social_profile__followers_count').desc(nulls_last=True), 'id')[:limit]
@@ -0,0 +1,56 @@
+"""
+Daemon threads for work a web process does off the request path: flushing the
+write-behind buffers, rebuilding the autocomplete trie and listening for
+notifications. Failures are logged and the thread carries on.
+"""
+import logging
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def run_logged(func, name):
+    """Call func, logging any exception; returns whether it succeeded"""
+    try:
+        func()
+        return True
+    except Exception:
+        logger.exception("%s failed", name)
+        return False
+    finally:
+        # A daemon thread has no request cycle to close its database connection
+        close_old_connections()
+
+
+class PeriodicThread:
+    """
+    Calls func on one daemon thread of this process, then again every interval
+    seconds (a number, or a callable read before each wait) until stopped.
+    """
+
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start the thread unless it is already running"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            run_logged(self.func, self.name)
+            self._stopped.wait(self.interval() if callable(self.interval) else self.interval)
@@ -0,0 +1,34 @@
+"""
+Version counters for caches that are never invalidated in place.
+
+Entries embed their owner's current version in the key (``post_fragment:<id>:<version>``,
+``follow_graph:<kind>:<id>:<version>``). Bumping ``<prefix>:<id>`` makes every stale
+entry unreachable, and stale entries expire on their own.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def bump_versions(prefix, ids):
+    """Move each id's version forward so entries written under the old one are never read"""
+    for item_id in ids:
+        try:
+            cache.incr(f"{prefix}:{item_id}")
+        except ValueError:
+            # Unknown or evicted version: start from a value no earlier entry can have used
+            cache.set(f"{prefix}:{item_id}", time.time_ns(), None)
+
+
+def get_versions(prefix, ids):
+    """{id: current version}, starting a version for ids that have none yet"""
+    version_keys = {item_id: f"{prefix}:{item_id}" for item_id in ids}
+    cached = cache.get_many(version_keys.values())
+
+    versions = {}
+    for item_id, key in version_keys.items():
+        if key not in cached:
+            cache.add(key, time.time_ns(), None)
+            cached[key] = cache.get(key)
+        versions[item_id] = cached[key]
+    return versions
@@ -0,0 +1,211 @@
+"""
+Notification coalescing.
+
+Reactions, comments, shares and follows do not insert one row per event. Events of
+the same type on the same target (``group_key``, e.g. ``liked:<post_id>`` or
+``follow:``) for the same user are merged into one aggregate notification while it
+is unread and less than ``SOCIAL_NOTIFICATION_COALESCE_WINDOW`` seconds old. The
+aggregate keeps an ``actor_count`` and the latest few actors in ``sample_actors``,
+and its message is rebuilt ("Ann, Bob and 12 others liked your text post"). Events of one
+group are serialized on a transaction-scoped advisory lock for ``(user, group_key)``,
+so they never queue on a shared row; views record them with ``notify_on_commit``,
+after the counter transaction. A merge updates the row in place. Its ``created_at`` stays put, so the row keeps its place
+in the list and in the unread count. An event after the aggregate was read or the
+window closed starts a new aggregate. ``collapse_notifications`` applies the same
+grouping to rows written before coalescing existed.
+"""
+import time
+import zlib
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Notification, UserProfile
+from .unread import forget_unread_counts, get_read_watermark, unread_notifications
+
+COALESCED_TYPES = ['liked', 'loved', 'motivated', 'comment', 'share', 'follow']
+
+
+def group_key(notification_type, post_id=None):
+    return f"{notification_type}:{post_id or ''}"
+
+
+def actor_summary(sample_actors, actor_count):
+    """'Ann', 'Ann and Bob', 'Ann, Bob and 3 others'"""
+    names = [actor['name'] for actor in sample_actors[:2]]
+    others = actor_count - len(names)
+    if others > 0:
+        return f"{', '.join(names)} and {others} {'other' if others == 1 else 'others'}"
+    return ' and '.join(names)
+
+
+def _actor(user):
+    return {'id': user.id, 'name': user.name}
+
+
+def _merge_actor(sample_actors, actor):
+    """(sample with actor moved to the front, whether the actor is new to the sample)"""
+    others = [sample for sample in sample_actors if sample['id'] != actor['id']]
+    return [actor] + others[:settings.SOCIAL_NOTIFICATION_SAMPLE_ACTORS - 1], len(others) == len(sample_actors)
+
+
+def _group_lock(user_id, key):
+    # Serializes events of one group; other groups and other writes to the user's rows don't wait
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [zlib.crc32(f"notify:{user_id}:{key}".encode())])
+
+
+def notify(user_id, notification_type, from_user, title, action, post=None, comment=None):
+    """
+    Record one event for user_id, where action completes "<actors> ..." (e.g. "shared
+    your text post"). Merges into the open aggregate of the same type and target or
+    creates a new one; returns the notification.
+    """
+    key = group_key(notification_type, post.id if post else None)
+    actor = _actor(from_user)
+    window_start = timezone.now() - timedelta(seconds=settings.SOCIAL_NOTIFICATION_COALESCE_WINDOW)
+
+    with transaction.atomic():
+        # Locking the aggregate alone would not do: before it exists there is no row, and
+        # concurrent events would each create one
+        _group_lock(user_id, key)
+        aggregate = unread_notifications(user_id, get_read_watermark(user_id)).filter(
+            group_key=key, created_at__gte=window_start
+        ).order_by('-created_at').first()
+
+        if aggregate is None:
+            return Notification.objects.create(
+                user_id=user_id,
+                notification_type=notification_type,
+                group_key=key,
+                title=title,
+                message=f"{actor['name']} {action}",
+                post=post,
+                comment=comment,
+                from_user=from_user,
+                sample_actors=[actor]
+            )
+
+        aggregate.sample_actors, is_new_actor = _merge_actor(aggregate.sample_actors, actor)
+        # Repeat events from a sampled actor (unlike and like again) are not counted twice
+        if is_new_actor:
+            aggregate.actor_count += 1
+        aggregate.message = f"{actor_summary(aggregate.sample_actors, aggregate.actor_count)} {action}"
+        aggregate.from_user = from_user
+        aggregate.comment = comment or aggregate.comment
+        # Still unread, so the unread count is unchanged; the save signal pushes the new text
+        aggregate.save(update_fields=['sample_actors', 'actor_count', 'message', 'from_user', 'comment'])
+        return aggregate
+
+
+def notify_on_commit(user_id, notification_type, from_user, title, action, post=None, comment=None):
+    """notify() once the current transaction commits; a failure is logged and leaves the event unrecorded"""
+    transaction.on_commit(
+        partial(notify, user_id, notification_type, from_user, title, action, post=post, comment=comment),
+        robust=True
+    )
+
+
+def _action(row):
+    # Messages were written as "<actor name> <action>"
+    name = row.from_user.name if row.from_user else ''
+    if name and row.message.startswith(f"{name} "):
+        return row.message[len(name) + 1:]
+    return None
+
+
+def _collapse(rows, window):
+    """(kept rows to update, ids to delete) for one user's rows ordered by group and time"""
+    keep, delete = [], []
+    aggregate = None
+    for row, key, unread in rows:
+        if (
+            aggregate is not None and aggregate.group_key == key and aggregate.unread == unread
+            and row.created_at - aggregate.created_at < window
+        ):
+            aggregate.sample_actors, is_new_actor = _merge_actor(aggregate.sample_actors, _actor(row.from_user))
+            if is_new_actor:
+                aggregate.actor_count += 1
+            action = _action(row)
+            if action:
+                aggregate.message = f"{actor_summary(aggregate.sample_actors, aggregate.actor_count)} {action}"
+            aggregate.from_user_id = row.from_user_id
+            aggregate.comment_id = row.comment_id or aggregate.comment_id
+            delete.append(row.id)
+            continue
+
+        # The earliest row of a group is kept, so the group stays where its first event was
+        aggregate = row
+        aggregate.group_key, aggregate.unread = key, unread
+        aggregate.actor_count = 1
+        aggregate.sample_actors = [_actor(row.from_user)]
+        keep.append(aggregate)
+    return keep, delete
+
+
+def collapse_notifications(chunk_size=500, window=None, throttle=0.0, dry_run=False):
+    """
+    Merge existing ungrouped reaction, comment, share and follow notifications into
+    aggregates, chunk_size users at a time. Rows only merge with rows of the same
+    read state. Returns 'users', 'kept', 'deleted' and 'seconds'.
+    """
+    started = time.perf_counter()
+    window = timedelta(seconds=window or settings.SOCIAL_NOTIFICATION_COALESCE_WINDOW)
+    ungrouped = Notification.objects.filter(
+        group_key='', notification_type__in=COALESCED_TYPES, from_user__isnull=False
+    )
+    report = {'users': 0, 'kept': 0, 'deleted': 0}
+
+    last_user_id = None
+    while True:
+        users = ungrouped.order_by('user_id')
+        if last_user_id is not None:
+            users = users.filter(user_id__gt=last_user_id)
+        user_ids = list(users.values_list('user_id', flat=True).distinct()[:chunk_size])
+        if not user_ids:
+            break
+        last_user_id = user_ids[-1]
+
+        watermarks = dict(
+            UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'notifications_read_at')
+        )
+        rows = ungrouped.filter(user_id__in=user_ids).select_related('from_user').order_by(
+            'user_id', 'notification_type', 'post_id', 'created_at'
+        )
+        by_user = {}
+        for row in rows.iterator(chunk_size=2000):
+            watermark = watermarks.get(row.user_id)
+            unread = not row.is_read and (watermark is None or row.created_at > watermark)
+            by_user.setdefault(row.user_id, []).append(
+                (row, group_key(row.notification_type, row.post_id), unread)
+            )
+
+        keep, delete = [], []
+        for user_rows in by_user.values():
+            user_keep, user_delete = _collapse(user_rows, window)
+            keep += user_keep
+            delete += user_delete
+
+        if not dry_run:
+            with transaction.atomic():
+                Notification.objects.bulk_update(
+                    keep, ['group_key', 'actor_count', 'sample_actors', 'message', 'from_user', 'comment'],
+                    batch_size=1000
+                )
+                for start in range(0, len(delete), 1000):
+                    Notification.objects.filter(id__in=delete[start:start + 1000]).delete()
+            # Merged unread rows count once now
+            forget_unread_counts(by_user)
+
+        report['users'] += len(by_user)
+        report['kept'] += len(keep)
+        report['deleted'] += len(delete)
+        if throttle:
+            time.sleep(throttle)
+
+    report['seconds'] = time.perf_counter() - started
+    return report
@@ -0,0 +1,148 @@
+"""
+Write-behind buffer for hot post counters.
+
+With ``SOCIAL_COUNTER_WRITE_BEHIND`` enabled, reaction, share, bookmark and view
+deltas are collected here instead of taking a row lock on the post for every
+request. ``flush_post_counters`` drains the buffer into batched UPDATEs every
+``SOCIAL_COUNTER_FLUSH_INTERVAL`` seconds. It runs on the flusher thread a
+process starts when it first buffers a delta, or from
+``manage.py flush_post_counters --loop``. Feed reads add the pending deltas so
+counts still look live.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+BUFFERED_FIELDS = (
+    'likes_count', 'loves_count', 'motivates_count',
+    'shares_count', 'bookmarks_count', 'views_count',
+)
+
+
+class LocalCounterBuffer:
+    """In-process buffer, for tests and single-process deployments"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas = defaultdict(Counter)
+
+    def add(self, post_id, deltas):
+        with self._lock:
+            self._deltas[str(post_id)].update(deltas)
+
+    def pending(self, post_ids):
+        with self._lock:
+            return {
+                post_id: dict(self._deltas[str(post_id)])
+                for post_id in post_ids if str(post_id) in self._deltas
+            }
+
+    def drain(self):
+        with self._lock:
+            drained, self._deltas = self._deltas, defaultdict(Counter)
+        return {
+            post_id: {field: delta for field, delta in deltas.items() if delta}
+            for post_id, deltas in drained.items() if any(deltas.values())
+        }
+
+
+class CacheCounterBuffer:
+    """Buffer shared between workers through the Django cache backend"""
+    registry_key = 'post_counters:dirty'
+    lock_key = 'post_counters:lock'
+    lock_timeout = 5
+
+    def _delta_key(self, post_id, field):
+        return f"post_counters:{post_id}:{field}"
+
+    def _dirty_key(self, post_id):
+        return f"post_counters:dirty:{post_id}"
+
+    @contextmanager
+    def _registry_lock(self):
+        deadline = time.monotonic() + self.lock_timeout
+        while not cache.add(self.lock_key, 1, self.lock_timeout):
+            if time.monotonic() > deadline:
+                raise TimeoutError('Timed out waiting for the post counter registry lock')
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            cache.delete(self.lock_key)
+
+    def add(self, post_id, deltas):
+        post_id = str(post_id)
+        for field, delta in deltas.items():
+            key = self._delta_key(post_id, field)
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                if not cache.add(key, delta, None):
+                    cache.incr(key, delta)
+
+        # Only the first delta since the last flush has to touch the shared registry
+        if cache.add(self._dirty_key(post_id), 1, None):
+            with self._registry_lock():
+                registry = cache.get(self.registry_key, [])
+                registry.append(post_id)
+                cache.set(self.registry_key, registry, None)
+
+    def pending(self, post_ids):
+        keys = {
+            (post_id, field): self._delta_key(post_id, field)
+            for post_id in post_ids for field in BUFFERED_FIELDS
+        }
+        values = cache.get_many(keys.values())
+
+        pending = defaultdict(dict)
+        for (post_id, field), key in keys.items():
+            if values.get(key):
+                pending[post_id][field] = values[key]
+        return dict(pending)
+
+    def drain(self):
+        with self._registry_lock():
+            post_ids = cache.get(self.registry_key, [])
+            cache.delete(self.registry_key)
+        if not post_ids:
+            return {}
+
+        # Clear dirty markers before reading, so deltas added from here on re-register the post
+        cache.delete_many([self._dirty_key(post_id) for post_id in post_ids])
+
+        drained = defaultdict(dict)
+        for post_id, deltas in self.pending(post_ids).items():
+            for field, delta in deltas.items():
+                # Subtract what was read rather than deleting, so concurrent increments survive
+                key = self._delta_key(post_id, field)
+                if delta > 0:
+                    cache.decr(key, delta)
+                else:
+                    cache.incr(key, -delta)
+                drained[post_id][field] = delta
+        return dict(drained)
+
+
+_local_buffer = LocalCounterBuffer()
+_cache_buffer = CacheCounterBuffer()
+
+
+def write_behind_enabled():
+    return settings.SOCIAL_COUNTER_WRITE_BEHIND
+
+
+def get_counter_buffer():
+    if settings.SOCIAL_COUNTER_BUFFER == 'local':
+        return _local_buffer
+    return _cache_buffer
+
+
+def pending_counter_deltas(post_ids):
+    """Buffered deltas not yet written to the database, keyed by post id"""
+    if not write_behind_enabled():
+        return {}
+    return get_counter_buffer().pending(post_ids)
@@ -0,0 +1,232 @@
+"""
+Single-statement engagement counter updates.
+
+``PostCounters.apply`` adds any combination of counter deltas to a post and
+recomputes ``engagement_score`` in the same UPDATE, replacing the
+F() save / refresh_from_db / calculate / save sequence on the hottest rows.
+``record_post_counters`` routes hot deltas through the write-behind buffer
+when ``SOCIAL_COUNTER_WRITE_BEHIND`` is enabled.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .background import PeriodicThread
+from .counter_buffer import BUFFERED_FIELDS, get_counter_buffer, write_behind_enabled
+from .fragments import bump_post_versions
+from .models import Post, Reaction
+
+COUNTER_FIELDS = (
+    'likes_count', 'loves_count', 'motivates_count', 'comments_count',
+    'shares_count', 'bookmarks_count', 'views_count',
+)
+
+REACTION_COUNTERS = {
+    'liked': 'likes_count',
+    'loved': 'loves_count',
+    'motivated': 'motivates_count',
+}
+
+
+def reaction_deltas(previous_type, current_type):
+    """Counter deltas for a reaction changing from previous_type to current_type (either may be None)"""
+    deltas = {}
+    if previous_type == current_type:
+        return deltas
+    if previous_type:
+        deltas[REACTION_COUNTERS[previous_type]] = -1
+    if current_type:
+        deltas[REACTION_COUNTERS[current_type]] = deltas.get(REACTION_COUNTERS[current_type], 0) + 1
+    return deltas
+
+
+class PostCounters:
+    """Apply counter deltas to posts and recompute engagement_score in one statement"""
+
+    @classmethod
+    def apply(cls, post_id, **deltas):
+        """Returns the post's new counters and engagement_score, or None if the post does not exist"""
+        return cls.apply_many({post_id: deltas}).get(post_id)
+
+    @classmethod
+    def apply_many(cls, deltas_by_post):
+        """Apply {post_id: {field: delta}} in one batched UPDATE; returns new values keyed by post id"""
+        deltas_by_post = {post_id: deltas for post_id, deltas in deltas_by_post.items() if deltas}
+        for deltas in deltas_by_post.values():
+            unknown = set(deltas) - set(COUNTER_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown post counters: {', '.join(sorted(unknown))}")
+        if not deltas_by_post:
+            return {}
+        # A stable row order keeps concurrent batches from deadlocking on each other's locks
+        deltas_by_post = dict(sorted(deltas_by_post.items(), key=lambda item: str(item[0])))
+
+        if connection.vendor == 'postgresql':
+            values = cls._apply_returning(deltas_by_post)
+        else:
+            values = {
+                post_id: result for post_id, deltas in deltas_by_post.items()
+                if (result := cls._apply_orm(post_id, deltas)) is not None
+            }
+
+        # After commit, so a concurrent reader cannot cache the uncommitted row under the new version
+        transaction.on_commit(lambda: bump_post_versions(*values))
+        return values
+
+    @classmethod
+    def _apply_returning(cls, deltas_by_post):
+        qn = connection.ops.quote_name
+        table = qn(Post._meta.db_table)
+
+        # SET expressions all see the old row, so the score is computed from the new values inline
+        new_values = {
+            field: f"GREATEST(post.{qn(field)} + delta.{qn(field)}, 0)" for field in COUNTER_FIELDS
+        }
+        engagement = ' + '.join(
+            f"{new_values[field]} * {float(weight)}" for field, weight in Post.ENGAGEMENT_WEIGHTS.items()
+        )
+        time_decay = (
+            f"GREATEST({float(Post.MIN_TIME_DECAY)}, 1.0 / (1.0 + EXTRACT(EPOCH FROM (NOW() - "
+            f"post.{qn('created_at')})) / 3600.0 * {float(Post.DECAY_PER_HOUR)}))"
+        )
+        assignments = [f"{qn(field)} = {new_values[field]}" for field in COUNTER_FIELDS]
+        assignments.append(f"{qn('engagement_score')} = ({engagement}) * {time_decay}")
+
+        row_placeholder = '(' + ', '.join(['%s::uuid'] + ['%s::integer'] * len(COUNTER_FIELDS)) + ')'
+        params = []
+        for post_id, deltas in deltas_by_post.items():
+            params.append(str(post_id))
+            params.extend(deltas.get(field, 0) for field in COUNTER_FIELDS)
+
+        columns = ', '.join([qn('id')] + [qn(field) for field in COUNTER_FIELDS])
+        returning = ', '.join(f"post.{qn(field)}" for field in ('id',) + COUNTER_FIELDS + ('engagement_score',))
+        sql = (
+            f"UPDATE {table} AS post SET {', '.join(assignments)} "
+            f"FROM (VALUES {', '.join([row_placeholder] * len(deltas_by_post))}) AS delta ({columns}) "
+            f"WHERE post.{qn('id')} = delta.{qn('id')} RETURNING {returning}"
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        post_ids = {str(post_id): post_id for post_id in deltas_by_post}
+        return {
+            post_ids[str(row[0])]: dict(zip(COUNTER_FIELDS + ('engagement_score',), row[1:]))
+            for row in rows
+        }
+
+    @classmethod
+    def _apply_orm(cls, post_id, deltas):
+        # Fallback for databases without UPDATE ... FROM / RETURNING in this code path (e.g. SQLite tests)
+        with transaction.atomic():
+            updated = Post.objects.filter(id=post_id).update(**{
+                field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()
+            })
+            if not updated:
+                return None
+            post = Post.objects.only(*COUNTER_FIELDS, 'created_at').get(id=post_id)
+            post.calculate_engagement_score()
+            Post.objects.filter(id=post_id).update(engagement_score=post.engagement_score)
+
+        values = {field: getattr(post, field) for field in COUNTER_FIELDS}
+        values['engagement_score'] = post.engagement_score
+        return values
+
+
+def record_post_counters(post_id, **deltas):
+    """
+    Apply counter deltas now, or buffer the hot ones when write-behind is enabled.
+    Counters outside BUFFERED_FIELDS (comments_count) are always written immediately.
+    """
+    if not write_behind_enabled():
+        PostCounters.apply(post_id, **deltas)
+        return
+
+    buffered = {field: delta for field, delta in deltas.items() if field in BUFFERED_FIELDS}
+    immediate = {field: delta for field, delta in deltas.items() if field not in BUFFERED_FIELDS}
+    if buffered:
+        # After commit, so a rolled back reaction leaves no delta behind
+        transaction.on_commit(lambda: _buffer_deltas(post_id, buffered))
+    if immediate:
+        PostCounters.apply(post_id, **immediate)
+
+
+def _buffer_deltas(post_id, deltas):
+    get_counter_buffer().add(post_id, deltas)
+    # Only processes that record counters flush them; migrate, shell and cron commands start no thread
+    start_counter_flusher()
+
+
+def flush_post_counters():
+    """Drain buffered deltas into batched UPDATEs; returns the number of posts written"""
+    counter_buffer = get_counter_buffer()
+    deltas_by_post = counter_buffer.drain()
+    if not deltas_by_post:
+        return 0
+
+    try:
+        return len(PostCounters.apply_many(deltas_by_post))
+    except Exception:
+        # Put the deltas back so the next flush retries them
+        for post_id, deltas in deltas_by_post.items():
+            counter_buffer.add(post_id, deltas)
+        raise
+
+
+counter_flusher = PeriodicThread(
+    'post-counter-flusher', flush_post_counters, lambda: settings.SOCIAL_COUNTER_FLUSH_INTERVAL
+)
+
+
+def start_counter_flusher():
+    """Start this process's flusher thread once"""
+    return counter_flusher.start()
+
+
+def toggle_reaction_row(user_id, post_id, reaction_type):
+    """
+    Toggle a user's reaction on a post using the (user, post) unique key.
+
+    Sending the current reaction type removes it, any other type replaces it.
+    Returns ``(previous_type, current_type)``; ``current_type`` is None when removed.
+    """
+    if connection.vendor == 'postgresql':
+        qn = connection.ops.quote_name
+        table = qn(Reaction._meta.db_table)
+        sql = f"""
+            WITH previous AS (
+                SELECT reaction_type FROM {table} WHERE user_id = %s AND post_id = %s
+            ), removed AS (
+                DELETE FROM {table} WHERE user_id = %s AND post_id = %s AND reaction_type = %s
+            ), upserted AS (
+                INSERT INTO {table} (user_id, post_id, reaction_type, created_at)
+                SELECT %s, %s, %s, NOW()
+                WHERE NOT EXISTS (SELECT 1 FROM previous WHERE reaction_type = %s)
+                ON CONFLICT (user_id, post_id) DO UPDATE SET reaction_type = EXCLUDED.reaction_type
+                RETURNING reaction_type
+            )
+            SELECT (SELECT reaction_type FROM previous), (SELECT reaction_type FROM upserted)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                user_id, post_id,
+                user_id, post_id, reaction_type,
+                user_id, post_id, reaction_type, reaction_type,
+            ])
+            previous_type, current_type = cursor.fetchone()
+        return previous_type, current_type
+
+    with transaction.atomic():
+        existing = Reaction.objects.select_for_update().filter(user_id=user_id, post_id=post_id).first()
+        if existing is None:
+            Reaction.objects.create(user_id=user_id, post_id=post_id, reaction_type=reaction_type)
+            return None, reaction_type
+        previous_type = existing.reaction_type
+        if previous_type == reaction_type:
+            existing.delete()
+            return previous_type, None
+        existing.reaction_type = reaction_type
+        existing.save(update_fields=['reaction_type'])
+        return previous_type, reaction_type
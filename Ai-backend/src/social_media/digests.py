@@ -0,0 +1,177 @@
+"""
+Notification digests.
+
+Users whose ``UserProfile.notification_digest`` is not ``off`` do not get a
+notification for every new post from the accounts they follow. Fan-out writes a
+narrow ``NotificationDigestEvent`` row for them instead; it is not pushed and not
+counted as unread. ``send_notification_digests`` runs from cron every few minutes.
+Digest periods are fixed and aligned to the epoch in UTC (every hour on the hour,
+every day at midnight for ``SOCIAL_NOTIFICATION_DIGEST_WINDOWS``). A run
+summarizes the events created before the start of the current period, so the
+first post after a quiet spell waits for the end of its period with the rest.
+The due events of all users are read in one query ordered by user, streaming the
+rows. Each user gets one summary notification ("12 new posts from Ann, Bob and 3
+others") and, with ``digest_email`` on, one email queued on the task queue, which
+retries failed sends. Summaries are written ``SOCIAL_NOTIFICATION_DIGEST_BATCH``
+users at a time. Each batch creates its notifications, queues their emails,
+deletes the events it summarized and stamps ``digest_sent_at`` in one
+transaction. Overlapping runs are kept out by a lock. Users who switched digests
+off get their pending events summarized on the next run.
+"""
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from itertools import groupby
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .coalescing import actor_summary
+from .models import Notification, NotificationDigestEvent, UserProfile
+from .realtime import publish_notifications
+from .unread import record_new_notifications
+
+RUN_LOCK_NAME = 'notification_digests:lock'
+RUN_LOCK_TIMEOUT = 60 * 60  # Cache lock expiry, in case a run dies without releasing it
+
+
+def digest_user_ids(user_ids):
+    """The given users who take new-post notifications as a digest"""
+    return set(
+        UserProfile.objects.filter(user_id__in=user_ids).exclude(notification_digest='off')
+        .values_list('user_id', flat=True)
+    )
+
+
+def buffer_post_events(post, user_ids):
+    """Queue a new post for the digests of the given users"""
+    NotificationDigestEvent.objects.bulk_create(
+        [NotificationDigestEvent(user_id=user_id, post=post, from_user_id=post.user_id) for user_id in user_ids],
+        batch_size=1000
+    )
+
+
+def period_start(now, seconds):
+    """Start of the fixed digest period of the given length that contains now"""
+    return datetime.fromtimestamp(now.timestamp() // seconds * seconds, tz=dt_timezone.utc)
+
+
+def _due_events(now, max_id):
+    """Pending events up to max_id from before each user's current digest period, ordered by user"""
+    due = Q(user__social_profile__notification_digest='off')
+    for frequency, seconds in settings.SOCIAL_NOTIFICATION_DIGEST_WINDOWS.items():
+        due |= Q(user__social_profile__notification_digest=frequency, created_at__lt=period_start(now, seconds))
+    return NotificationDigestEvent.objects.filter(due, id__lte=max_id).order_by('user_id', 'id').values_list(
+        'id', 'user_id', 'from_user_id', 'from_user__name', 'user__email',
+        'user__social_profile__notification_digest', 'user__social_profile__digest_email'
+    )
+
+
+def _summarize(user_id, events):
+    """(summary notification, (subject, body) of the email or None) for one user's events, oldest first"""
+    authors = {}
+    for _, _, from_user_id, name, *_ in reversed(events):
+        authors.setdefault(from_user_id, {'id': from_user_id, 'name': name or 'Someone'})
+    sample_actors = list(authors.values())[:settings.SOCIAL_NOTIFICATION_SAMPLE_ACTORS]
+    _, _, _, _, email, frequency, digest_email = events[-1]
+
+    posts = f"{len(events)} new {'post' if len(events) == 1 else 'posts'}"
+    message = f"{posts} from {actor_summary(sample_actors, len(authors))}"
+    notification = Notification(
+        user_id=user_id,
+        notification_type='digest',
+        title=f"Your {frequency} digest" if frequency != 'off' else "Catch up on new posts",
+        message=message,
+        from_user_id=sample_actors[0]['id'],
+        actor_count=len(authors),
+        sample_actors=sample_actors
+    )
+
+    mail = None
+    if digest_email and email:
+        mail = (
+            email,
+            f"WellZO - {message}",
+            f"Hello!\n\nWhile you were away: {message}.\n\nOpen WellZO to catch up.\n\nBest regards,\nWellZO Team"
+        )
+    return notification, mail
+
+
+def _write_batch(batch, now):
+    """Create the summaries of a batch, queue their emails, drop the summarized events and stamp the users"""
+    # Imported here: tasks imports fanout, which imports this module
+    from .tasks import send_digest_email
+
+    user_ids = [notification.user_id for notification, _, _ in batch]
+    event_ids = [event_id for _, _, ids in batch for event_id in ids]
+    mails = [mail for _, mail, _ in batch if mail is not None]
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create([notification for notification, _, _ in batch])
+        record_new_notifications(notifications)
+        publish_notifications(notifications)
+        # Queued in the same transaction, so an email goes out exactly when its events are gone
+        for mail in mails:
+            send_digest_email.delay(*mail)
+        for start in range(0, len(event_ids), 1000):
+            NotificationDigestEvent.objects.filter(id__in=event_ids[start:start + 1000]).delete()
+        UserProfile.objects.filter(user_id__in=user_ids).update(digest_sent_at=now)
+    return len(mails)
+
+
+@contextmanager
+def _run_lock():
+    """Yields whether this run got the lock; another run holding it means this one should skip"""
+    if connection.vendor == 'postgresql':
+        key = zlib.crc32(RUN_LOCK_NAME.encode())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+        return
+
+    acquired = cache.add(RUN_LOCK_NAME, 1, RUN_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(RUN_LOCK_NAME)
+
+
+def send_notification_digests(now=None):
+    """
+    Summarize the due events of every user; returns 'users', 'events', 'emails' and
+    'seconds', plus 'skipped' when another run holds the lock.
+    """
+    started = time.perf_counter()
+    now = now or timezone.now()
+    report = {'users': 0, 'events': 0, 'emails': 0, 'skipped': False}
+
+    with _run_lock() as acquired:
+        if not acquired:
+            report['skipped'] = True
+        elif (max_id := NotificationDigestEvent.objects.order_by('-id').values_list('id', flat=True).first()):
+            batch = []
+            rows = _due_events(now, max_id).iterator(chunk_size=5000)
+            for user_id, events in groupby(rows, key=lambda row: row[1]):
+                events = list(events)
+                notification, mail = _summarize(user_id, events)
+                batch.append((notification, mail, [event[0] for event in events]))
+                report['users'] += 1
+                report['events'] += len(events)
+                if len(batch) >= settings.SOCIAL_NOTIFICATION_DIGEST_BATCH:
+                    report['emails'] += _write_batch(batch, now)
+                    batch = []
+            if batch:
+                report['emails'] += _write_batch(batch, now)
+
+    report['seconds'] = time.perf_counter() - started
+    return report
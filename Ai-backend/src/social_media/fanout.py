@@ -0,0 +1,153 @@
+"""
+Background delivery of new posts to followers.
+
+``create_post`` only writes the post and the author's own timeline entry. Once
+the transaction commits, a ``FanoutJob`` writes follower timeline entries and
+notifications in ``SOCIAL_FANOUT_CHUNK_SIZE`` chunks. Each chunk commits together
+with the job's cursor, so a job whose worker dies resumes after the last
+delivered follower once its lease expires. Followers in digest mode get a
+buffered digest event instead of a notification (see ``digests``). Jobs are run by
+the ``fanout`` task queue (``tasks.deliver_post_fanout``); ``run_fanout_worker``
+reports progress and sweeps up anything left behind.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .digests import buffer_post_events, digest_user_ids
+from .models import FanoutJob, Follow, Notification
+from .realtime import publish_notifications
+from .timeline import is_high_fanout_author, push_to_timelines
+from .unread import record_new_notifications
+
+
+def fan_out_post(post):
+    """Put the post in its author's timeline and queue delivery to followers"""
+    from .tasks import deliver_post_fanout
+
+    push_to_timelines(post, [post.user_id])
+    job = FanoutJob.objects.create(post=post)
+    # Queued in the same transaction, so it becomes visible to workers when the post commits
+    deliver_post_fanout.enqueue(args=[job.id], dedupe_key=f"post_fanout:{job.id}")
+    return job
+
+
+def _lease_expiry():
+    return timezone.now() + timedelta(seconds=settings.SOCIAL_FANOUT_LEASE_SECONDS)
+
+
+def claim_fanout_job(job_id=None):
+    """Lease a pending job, or a running one whose worker stopped renewing its lease"""
+    now = timezone.now()
+    claimable = FanoutJob.objects.filter(
+        Q(status='pending') | Q(status='running', locked_until__lt=now),
+        attempts__lt=settings.SOCIAL_FANOUT_MAX_ATTEMPTS
+    )
+    if job_id is not None:
+        claimable = claimable.filter(id=job_id)
+
+    with transaction.atomic():
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        job = claimable.select_for_update(skip_locked=skip_locked).order_by('created_at').first()
+        if job is None:
+            return None
+        job.status = 'running'
+        job.attempts += 1
+        job.locked_until = _lease_expiry()
+        job.started_at = job.started_at or now
+        job.save(update_fields=['status', 'attempts', 'locked_until', 'started_at'])
+    return job
+
+
+def follower_notification(post, follower_id):
+    author = post.user
+    user_name = author.name.split()[0] if author.name else author.email.split('@')[0]
+    return Notification(
+        user_id=follower_id,
+        notification_type='post',
+        title=f"New post from {user_name}",
+        message=f"{user_name} shared a new {post.type} post",
+        post=post,
+        from_user=author
+    )
+
+
+def run_fanout_job(job_id=None):
+    """Claim a job (a specific one, or the oldest claimable) and deliver it; returns the job or None"""
+    job = claim_fanout_job(job_id)
+    if job is None:
+        return None
+
+    try:
+        post = job.post
+        author_id = post.user_id
+        if not job.followers_total:
+            job.followers_total = Follow.objects.filter(following_id=author_id).count()
+            FanoutJob.objects.filter(id=job.id).update(followers_total=job.followers_total)
+        # Celebrity posts are read from the author at timeline read time, only notifications are pushed
+        push_timeline = not is_high_fanout_author(author_id)
+
+        while True:
+            follows = list(Follow.objects.filter(
+                following_id=author_id, id__gt=job.cursor
+            ).order_by('id').values_list('id', 'follower_id')[:settings.SOCIAL_FANOUT_CHUNK_SIZE])
+            if not follows:
+                break
+
+            follower_ids = [follower_id for _, follower_id in follows]
+            digest_ids = digest_user_ids(follower_ids)
+            with transaction.atomic():
+                if push_timeline:
+                    push_to_timelines(post, follower_ids)
+                # Followers in digest mode get the post in their next summary instead
+                buffer_post_events(post, [follower_id for follower_id in follower_ids if follower_id in digest_ids])
+                notifications = Notification.objects.bulk_create(
+                    [follower_notification(post, follower_id) for follower_id in follower_ids
+                     if follower_id not in digest_ids]
+                )
+                record_new_notifications(notifications)
+                publish_notifications(notifications)
+
+                # Advance the cursor with the chunk, but only while this worker still holds the lease
+                lease = _lease_expiry()
+                owned = FanoutJob.objects.filter(id=job.id, locked_until=job.locked_until).update(
+                    cursor=follows[-1][0],
+                    processed_count=job.processed_count + len(follows),
+                    locked_until=lease
+                )
+                if not owned:
+                    transaction.set_rollback(True)
+                    return job
+            job.cursor = follows[-1][0]
+            job.processed_count += len(follows)
+            job.locked_until = lease
+
+        FanoutJob.objects.filter(id=job.id, locked_until=job.locked_until).update(
+            status='done', locked_until=None, finished_at=timezone.now(), last_error=''
+        )
+        job.status = 'done'
+    except Exception as e:
+        retry = job.attempts < settings.SOCIAL_FANOUT_MAX_ATTEMPTS
+        job.status = 'pending' if retry else 'failed'
+        FanoutJob.objects.filter(id=job.id, locked_until=job.locked_until).update(
+            status=job.status, locked_until=None, last_error=str(e)
+        )
+        raise
+    return job
+
+
+def fanout_stats():
+    """Job counts by status, the oldest waiting job's lag and the progress of running jobs"""
+    by_status = dict(FanoutJob.objects.values_list('status').annotate(total=Count('id')).order_by())
+    oldest_pending = FanoutJob.objects.filter(status='pending').aggregate(oldest=Min('created_at'))['oldest']
+    running = FanoutJob.objects.filter(status='running').values(
+        'post_id', 'processed_count', 'followers_total', 'locked_until'
+    )
+    return {
+        'by_status': by_status,
+        'lag_seconds': (timezone.now() - oldest_pending).total_seconds() if oldest_pending else 0,
+        'running': list(running),
+    }
@@ -0,0 +1,158 @@
+"""
+Cached follow graph adjacency lists.
+
+Each user's following and follower ids are kept as a sorted int64 NumPy array,
+stored as raw bytes under ``follow_graph:<kind>:<user_id>:<version>`` (8 bytes
+per id). Membership is a binary search, and intersections search the shorter
+list in the longer one. ``toggle_follow`` bumps ``follow_graph_version:<user_id>``
+for both users so their stale lists are never read again. Lists longer than
+``SOCIAL_FOLLOW_GRAPH_MAX_CACHED`` are never cached, to keep entries below the
+cache backend's item size limit; ``get_cached_follow_lists`` lets callers answer
+those, and lists not cached yet, with targeted queries instead.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_versions import bump_versions, get_versions
+from .models import Follow
+
+VERSION_PREFIX = 'follow_graph_version'
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+
+# kind -> (column holding the list owner, column holding the listed ids)
+_COLUMNS = {
+    FOLLOWING: ('follower_id', 'following_id'),
+    FOLLOWERS: ('following_id', 'follower_id'),
+}
+
+
+class FollowIds:
+    """Sorted, de-duplicated user ids backed by an int64 NumPy array"""
+    __slots__ = ('ids',)
+
+    def __init__(self, ids=None):
+        self.ids = np.empty(0, dtype=np.int64) if ids is None else ids
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(np.frombuffer(data, dtype=np.int64))
+
+    def to_bytes(self):
+        return self.ids.tobytes()
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __contains__(self, user_id):
+        position = np.searchsorted(self.ids, user_id)
+        return position < len(self.ids) and self.ids[position] == user_id
+
+    def _common(self, other):
+        small, big = sorted((self.ids, other.ids), key=len)
+        if not len(small):
+            return small
+        found = big[np.minimum(np.searchsorted(big, small), len(big) - 1)] == small
+        return small[found]
+
+    def intersection(self, other):
+        return FollowIds(self._common(other))
+
+    def intersection_count(self, other):
+        return int(len(self._common(other)))
+
+
+def _list_key(kind, user_id, version):
+    return f"follow_graph:{kind}:{user_id}:{version}"
+
+
+def invalidate_follow_graph(*user_ids):
+    """Drop cached lists of users whose follows changed (both sides of a follow)"""
+    bump_versions(VERSION_PREFIX, user_ids)
+
+
+def _cached_lists(kind, user_ids):
+    """({user_id: FollowIds} of cache hits, {user_id: list key} of every given user)"""
+    list_keys = {
+        user_id: _list_key(kind, user_id, version)
+        for user_id, version in get_versions(VERSION_PREFIX, user_ids).items()
+    }
+    cached = cache.get_many(list_keys.values())
+    return {user_id: FollowIds.from_bytes(cached[key]) for user_id, key in list_keys.items() if key in cached}, list_keys
+
+
+def _load_lists(kind, user_ids):
+    """{user_id: FollowIds} for every given user, in one query"""
+    owner, listed = _COLUMNS[kind]
+    rows = Follow.objects.filter(**{f"{owner}__in": user_ids}).values_list(owner, listed)
+    pairs = np.fromiter(rows.iterator(chunk_size=20000), dtype=np.dtype((np.int64, 2)))
+
+    lists = {user_id: FollowIds() for user_id in user_ids}
+    if len(pairs):
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        owners, starts = np.unique(pairs[:, 0], return_index=True)
+        for owner_id, ids in zip(owners.tolist(), np.split(pairs[:, 1], starts[1:])):
+            lists[owner_id] = FollowIds(np.unique(ids))
+    return lists
+
+
+def get_follow_lists(kind, user_ids):
+    """{user_id: FollowIds} of FOLLOWING or FOLLOWERS lists; cache misses load in one query"""
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    lists, list_keys = _cached_lists(kind, user_ids)
+    missing_ids = [user_id for user_id in user_ids if user_id not in lists]
+    if missing_ids:
+        loaded = _load_lists(kind, missing_ids)
+        cache.set_many(
+            {
+                list_keys[user_id]: ids.to_bytes()
+                for user_id, ids in loaded.items()
+                if len(ids) <= settings.SOCIAL_FOLLOW_GRAPH_MAX_CACHED
+            },
+            settings.SOCIAL_FOLLOW_GRAPH_TIMEOUT
+        )
+        lists.update(loaded)
+    return lists
+
+
+def get_cached_follow_lists(kind, user_ids):
+    """
+    {user_id: FollowIds} of the lists that are already cached, without loading the
+    rest. Callers answer the missing ones with targeted queries, since a list that is
+    uncached, or too long to ever be cached, would otherwise load in full on every call.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    return _cached_lists(kind, user_ids)[0]
+
+
+def get_following(user_id):
+    """Ids of the users `user_id` follows"""
+    return get_follow_lists(FOLLOWING, [user_id])[user_id]
+
+
+def get_followers(user_id):
+    """Ids of the users following `user_id`"""
+    return get_follow_lists(FOLLOWERS, [user_id])[user_id]
+
+
+def is_following(follower_id, following_id):
+    return following_id in get_following(follower_id)
+
+
+def follow_graph_footprint(user_ids):
+    """Bytes per user of the cached following and follower lists of the given users"""
+    following = get_follow_lists(FOLLOWING, user_ids)
+    followers = get_follow_lists(FOLLOWERS, user_ids)
+    return {user_id: following[user_id].nbytes + followers[user_id].nbytes for user_id in following}
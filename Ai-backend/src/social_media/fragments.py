@@ -0,0 +1,81 @@
+"""
+Versioned cache of serialized post bodies.
+
+Everything in a post except the viewer's reactions, bookmark, comment previews and
+relative timestamp is the same for every viewer. Those bodies are cached under
+``post_fragment:<id>:<version>``; write paths bump ``post_version:<id>`` so stale
+bodies are simply never read again and expire on their own.
+"""
+from django.core.cache import cache
+
+from .cache_versions import bump_versions, get_versions
+from .counter_buffer import pending_counter_deltas
+from .loaders import load_viewer_state
+from .models import Post
+from .serializers import PostBodySerializer, PostOverlaySerializer
+
+VERSION_PREFIX = 'post_version'
+FRAGMENT_TIMEOUT = 60 * 10  # Bounds staleness of embedded author cards, which do not bump versions
+
+
+def _fragment_key(post_id, version):
+    return f"post_fragment:{post_id}:{version}"
+
+
+def bump_post_versions(*post_ids):
+    """Invalidate cached bodies after an edit, new media or a counter write"""
+    bump_versions(VERSION_PREFIX, post_ids)
+
+
+def get_post_versions(post_ids):
+    return get_versions(VERSION_PREFIX, post_ids)
+
+
+def get_post_bodies(post_ids):
+    """Multi-get cached post bodies, serializing and caching only the misses"""
+    versions = get_post_versions(post_ids)
+    fragment_keys = {post_id: _fragment_key(post_id, version) for post_id, version in versions.items()}
+    cached = cache.get_many(fragment_keys.values())
+
+    bodies = {post_id: cached[key] for post_id, key in fragment_keys.items() if key in cached}
+    missing_ids = [post_id for post_id in post_ids if post_id not in bodies]
+    if missing_ids:
+        posts = Post.objects.filter(id__in=missing_ids).select_related(
+            'user', 'user__social_profile', 'metrics'
+        ).prefetch_related('media')
+        fresh = {body['id']: body for body in PostBodySerializer(posts, many=True).data}
+        cache.set_many(
+            {fragment_keys[post.id]: fresh[str(post.id)] for post in posts},
+            FRAGMENT_TIMEOUT
+        )
+        bodies.update({post.id: fresh[str(post.id)] for post in posts})
+    return bodies
+
+
+def serialize_posts(posts, context):
+    """PostSerializer output for a page of posts: cached bodies plus a cheap per-viewer overlay"""
+    posts = list(posts)
+    if not posts:
+        return []
+
+    context = dict(context)
+    if 'viewer_state' not in context:
+        request = context.get('request')
+        context['viewer_state'] = load_viewer_state(request.user if request else None, posts)
+
+    post_ids = [post.id for post in posts]
+    bodies = get_post_bodies(post_ids)
+    pending = pending_counter_deltas(post_ids)
+    overlays = PostOverlaySerializer(posts, many=True, context=context).data
+
+    results = []
+    for post, overlay in zip(posts, overlays):
+        # Posts deleted since the page query have no body and are dropped
+        if post.id not in bodies:
+            continue
+        data = {**bodies[post.id], **overlay}
+        # Buffered write-behind deltas keep counts live between flushes
+        for field, delta in pending.get(post.id, {}).items():
+            data[field] = max(0, data[field] + delta)
+        results.append(data)
+    return results
@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models import F
+
+from .models import Hashtag, PostHashtag
+from .trends import record_hashtag_uses
+
+
+def normalize_hashtag(name):
+    """'#Run ' -> 'run'; empty names normalize to ''"""
+    return name.strip().lstrip('#').strip().lower()
+
+
+def normalize_hashtags(names):
+    """Normalized, deduplicated hashtag names in first-seen order"""
+    normalized = (normalize_hashtag(name) for name in names)
+    return list(dict.fromkeys(name for name in normalized if name))
+
+
+def attach_hashtags(post, names):
+    """
+    Link a new post to its hashtags with a fixed number of queries, whatever the tag count:
+    one upsert for the hashtags, one insert for the links, one UPDATE for posts_count.
+    Returns the linked hashtag ids.
+    """
+    names = normalize_hashtags(names)
+    if not names:
+        return []
+
+    with transaction.atomic():
+        # The upsert locks the hashtag rows in the order of its VALUES list, so sorting the
+        # names makes concurrent posts lock shared hashtags in the same order. The no-op
+        # update on conflict makes existing rows come back with their ids.
+        hashtags = Hashtag.objects.bulk_create(
+            [Hashtag(name=name) for name in sorted(names)],
+            update_conflicts=True,
+            unique_fields=['name'],
+            update_fields=['name']
+        )
+        hashtag_ids = [hashtag.pk for hashtag in hashtags]
+        if None in hashtag_ids:
+            # Backends that cannot return ids from an upsert
+            hashtag_ids = list(Hashtag.objects.filter(name__in=names).values_list('id', flat=True))
+
+        PostHashtag.objects.bulk_create(
+            [PostHashtag(post=post, hashtag_id=hashtag_id) for hashtag_id in hashtag_ids],
+            ignore_conflicts=True
+        )
+        # Only rows the upsert already holds locks on, so this takes no new locks
+        Hashtag.objects.filter(id__in=hashtag_ids).update(posts_count=F('posts_count') + 1)
+
+    record_hashtag_uses(hashtag_ids, at=post.created_at)
+    return hashtag_ids
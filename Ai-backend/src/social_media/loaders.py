@@ -0,0 +1,186 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .follow_graph import FOLLOWERS, FOLLOWING, get_cached_follow_lists
+from .models import Reaction, Bookmark, PostHashtag, Comment, CommentLike, Follow
+
+COMMENT_PREVIEW_LIMIT = 2  # Top-level comments shown under each post in a feed
+REPLY_PREVIEW_LIMIT = 3  # Replies shown under each comment
+
+
+class ViewerState:
+    """Viewer-dependent data for one page of posts, keyed by post id"""
+
+    def __init__(self, post_ids, user=None, reactions=None, bookmarks=None):
+        self.post_ids = set(post_ids)
+        self.user = user
+        self.reactions = reactions or {}  # post_id -> reaction_type
+        self.bookmarks = bookmarks or set()  # post_ids bookmarked by the viewer
+        self._tags = None
+        self._comments = None
+
+    @property
+    def tags(self):
+        # post_id -> [hashtag names]; only needed when post bodies are not served from cache
+        if self._tags is None:
+            self._tags = load_post_tags(self.post_ids)
+        return self._tags
+
+    @property
+    def comments(self):
+        # Loaded on first use so cached post bodies never pay for comment previews
+        if self._comments is None:
+            self._comments = load_comment_state(self.user, post_ids=list(self.post_ids))
+        return self._comments
+
+
+class CommentState:
+    """Bounded comment previews, replies and the viewer's comment likes"""
+
+    def __init__(self):
+        self.comment_ids = set()  # Comments whose replies and like state have been resolved
+        self.previews = defaultdict(list)  # post_id -> first top-level comments
+        self.replies = defaultdict(list)  # parent_id -> first replies
+        self.liked = set()  # comment_ids liked by the viewer
+
+
+class RelationshipState:
+    """The viewer's follow relationships with a list of users, keyed by user id"""
+
+    def __init__(self, user_ids, following=None, followed_by=None, mutual=None):
+        self.user_ids = set(user_ids)
+        self.following = following or set()  # user_ids the viewer follows
+        self.followed_by = followed_by or set()  # user_ids following the viewer
+        self.mutual = mutual or {}  # user_id -> mutual connection count
+
+
+def first_per_group(queryset, partition_field, limit):
+    """Keep the first `limit` rows per partition using ROW_NUMBER() instead of loading every row"""
+    return queryset.annotate(
+        row_number=Window(
+            RowNumber(),
+            partition_by=[F(partition_field)],
+            order_by=[F('created_at').asc(), F('id').asc()]
+        )
+    ).filter(row_number__lte=limit).order_by('created_at', 'id')
+
+
+def load_comment_state(user, post_ids=(), comments=(),
+                       preview_limit=COMMENT_PREVIEW_LIMIT, reply_limit=REPLY_PREVIEW_LIMIT):
+    """
+    Load comment previews for posts and reply previews for comments in a fixed number
+    of queries: one for the previews, one per reply depth, and one for the viewer's likes.
+    """
+    state = CommentState()
+    roots = list(comments)
+
+    if post_ids:
+        previews = first_per_group(
+            Comment.objects.filter(post_id__in=post_ids, parent=None).select_related('user', 'user__social_profile'),
+            'post_id', preview_limit
+        )
+        for comment in previews:
+            state.previews[comment.post_id].append(comment)
+            roots.append(comment)
+
+    loaded = list(roots)
+    frontier = [comment.id for comment in roots]
+    while frontier:
+        state.comment_ids.update(frontier)
+        replies = list(first_per_group(
+            Comment.objects.filter(parent_id__in=frontier).select_related('user', 'user__social_profile'),
+            'parent_id', reply_limit
+        ))
+        for reply in replies:
+            state.replies[reply.parent_id].append(reply)
+        loaded.extend(replies)
+        frontier = [reply.id for reply in replies]
+
+    if loaded and user is not None and user.is_authenticated:
+        state.liked = set(CommentLike.objects.filter(
+            user=user, comment_id__in=[comment.id for comment in loaded]
+        ).values_list('comment_id', flat=True))
+
+    return state
+
+
+def load_post_tags(post_ids):
+    tags = defaultdict(list)
+    for post_id, name in PostHashtag.objects.filter(post_id__in=post_ids).order_by('id').values_list(
+        'post_id', 'hashtag__name'
+    ):
+        tags[post_id].append(name)
+    return tags
+
+
+def load_viewer_state(user, posts):
+    """
+    Resolve the viewer's reactions and bookmarks for a page of posts in one query each.
+    Post tags and comment previews are loaded on first access, also once per page.
+    """
+    post_ids = [post.id for post in posts]
+    if not post_ids or user is None or not user.is_authenticated:
+        return ViewerState(post_ids, user=user)
+
+    reactions = dict(
+        Reaction.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', 'reaction_type')
+    )
+    bookmarks = set(
+        Bookmark.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+    )
+    return ViewerState(post_ids, user=user, reactions=reactions, bookmarks=bookmarks)
+
+
+def load_relationship_state(user, user_ids, mutual='following'):
+    """
+    Resolve follow state between the viewer and a list of users. Cached follow
+    graph lists answer it without queries; lists that are not cached, or too long
+    to be, fall back to one targeted query for is-following and is-followed-by and
+    one aggregate query for the mutual counts they leave open.
+    mutual='following' counts people both follow, mutual='followers' counts people
+    the viewer follows who follow the user, and None skips the count.
+    """
+    if user is None or not user.is_authenticated:
+        return RelationshipState(user_ids)
+    # The viewer's own profile shows no relationship with itself
+    others = [user_id for user_id in user_ids if user_id != user.id]
+    if not others:
+        return RelationshipState(user_ids)
+
+    viewer_following = get_cached_follow_lists(FOLLOWING, [user.id]).get(user.id)
+    viewer_followers = get_cached_follow_lists(FOLLOWERS, [user.id]).get(user.id)
+
+    following, followed_by = set(), set()
+    lookups = Q()
+    if viewer_following is None:
+        lookups |= Q(follower=user, following_id__in=others)
+    else:
+        following = {user_id for user_id in others if user_id in viewer_following}
+    if viewer_followers is None:
+        lookups |= Q(follower_id__in=others, following=user)
+    else:
+        followed_by = {user_id for user_id in others if user_id in viewer_followers}
+    if lookups:
+        for follower_id, following_id in Follow.objects.filter(lookups).values_list('follower_id', 'following_id'):
+            if follower_id == user.id:
+                following.add(following_id)
+            else:
+                followed_by.add(follower_id)
+
+    counts = {}
+    if mutual in (FOLLOWING, FOLLOWERS):
+        cached = get_cached_follow_lists(mutual, others) if viewer_following is not None else {}
+        for user_id, ids in cached.items():
+            counts[user_id] = viewer_following.intersection_count(ids)
+        uncounted = [user_id for user_id in others if user_id not in cached]
+        if uncounted:
+            owner, listed = ('follower_id', 'following_id') if mutual == FOLLOWING else ('following_id', 'follower_id')
+            counts.update(
+                Follow.objects.filter(**{
+                    f"{owner}__in": uncounted,
+                    f"{listed}__in": Follow.objects.filter(follower=user).values('following_id')
+                }).values(owner).annotate(count=Count('id')).values_list(owner, 'count')
+            )
+    return RelationshipState(user_ids, following=following, followed_by=followed_by, mutual=counts)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from social_media.coalescing import collapse_notifications
+
+
+class Command(BaseCommand):
+    help = 'Merge existing reaction, comment, share and follow notifications into aggregates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be merged without writing')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users processed per chunk')
+        parser.add_argument(
+            '--window', type=int, default=None,
+            help='Seconds an aggregate stays open (default SOCIAL_NOTIFICATION_COALESCE_WINDOW)'
+        )
+        parser.add_argument('--throttle', type=float, default=0.05, help='Seconds to sleep between chunks')
+
+    def handle(self, *args, **options):
+        report = collapse_notifications(
+            chunk_size=options['chunk_size'], window=options['window'],
+            throttle=options['throttle'], dry_run=options['dry_run']
+        )
+        action = 'would be merged' if options['dry_run'] else 'merged'
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['users']} users: {report['deleted']} notifications {action} into {report['kept']} "
+            f"in {report['seconds']:.2f}s"
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from social_media.counters import flush_post_counters
+
+
+class Command(BaseCommand):
+    help = 'Apply buffered write-behind post counter deltas in batched UPDATEs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep flushing until interrupted')
+        parser.add_argument(
+            '--interval', type=float, default=settings.SOCIAL_COUNTER_FLUSH_INTERVAL,
+            help='Seconds between flushes when looping'
+        )
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            flushed = flush_post_counters()
+            self.stdout.write(self.style.SUCCESS(f"Flushed counters for {flushed} posts"))
+            return
+
+        self.stdout.write(f"Flushing post counters every {options['interval']}s")
+        try:
+            while True:
+                flush_post_counters()
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            flushed = flush_post_counters()
+            self.stdout.write(self.style.SUCCESS(f"Stopped after a final flush of {flushed} posts"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from social_media.follow_graph import follow_graph_footprint
+from social_media.models import Follow, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Report the memory the cached follow graph takes per user, to size the cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Measure the N most followed users')
+
+    def handle(self, *args, **options):
+        user_ids = list(
+            UserProfile.objects.order_by('-followers_count').values_list('user_id', flat=True)[:options['users']]
+        )
+        footprint = follow_graph_footprint(user_ids)
+        sizes = sorted(footprint.values())
+        if sizes:
+            self.stdout.write(
+                f"Measured {len(sizes)} users: {sum(sizes) / len(sizes):,.0f} bytes/user on average, "
+                f"median {sizes[len(sizes) // 2]:,}, max {sizes[-1]:,}"
+            )
+        # Every follow is stored twice, once in each user's list, at 8 bytes per id
+        edges = Follow.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Whole graph: {edges:,} follows, about {edges * 16 / 1024 ** 2:,.1f} MiB of id arrays"
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from social_media.partitions import create_partitions, drop_expired_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions and drop the ones past retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without making them')
+        parser.add_argument(
+            '--months-ahead', type=int, default=None,
+            help='Months to create ahead of the current one (default SOCIAL_PARTITION_MONTHS_AHEAD)'
+        )
+        parser.add_argument('--skip-drop', action='store_true', help='Only create partitions')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        created = create_partitions(months_ahead=options['months_ahead'], dry_run=dry_run)
+        for name in created:
+            self.stdout.write(f"{'Would create' if dry_run else 'Created'} {name}")
+
+        if not options['skip_drop']:
+            for model, entry in drop_expired_partitions(dry_run=dry_run).items():
+                for name in entry['dropped']:
+                    self.stdout.write(f"{'Would drop' if dry_run else 'Dropped'} {name}")
+                if entry['deleted']:
+                    action = 'Would delete' if dry_run else 'Deleted'
+                    self.stdout.write(f"{action} {entry['deleted']} expired {model} rows")
+
+        self.stdout.write(self.style.SUCCESS('Partitions are up to date'))
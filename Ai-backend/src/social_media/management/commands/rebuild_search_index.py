@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from social_media.models import Post
+from social_media.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Rebuild post search vectors from content and hashtags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Posts updated per statement')
+
+    def handle(self, *args, **options):
+        indexed = 0
+        last_id = None
+        while True:
+            chunk = Post.objects.order_by('id')
+            if last_id is not None:
+                chunk = chunk.filter(id__gt=last_id)
+            post_ids = list(chunk.values_list('id', flat=True)[:options['chunk_size']])
+            if not post_ids:
+                break
+            update_search_vectors(post_ids)
+            indexed += len(post_ids)
+            last_id = post_ids[-1]
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} posts"))
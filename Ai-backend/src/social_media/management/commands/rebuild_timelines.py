@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from social_media.models import Post, Follow, TimelineEntry, UserProfile
+from social_media.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = "Fill home timelines with followed authors' and users' own recent posts"
+
+    def handle(self, *args, **options):
+        authors = rebuild_timelines(Post, Follow, UserProfile, TimelineEntry)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt timeline entries for {authors} authors"))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from social_media.reconcile import COUNTERS, counter_label, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized counters from their source rows and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows compared per chunk')
+        parser.add_argument('--throttle', type=float, default=0.05, help='Seconds to sleep between chunks')
+        parser.add_argument(
+            '--counter', action='append', dest='counters', metavar='MODEL[.FIELD]',
+            help='Only reconcile these counters, e.g. Post.likes_count or UserProfile (repeatable)'
+        )
+
+    def handle(self, *args, **options):
+        counters = COUNTERS
+        if options['counters']:
+            counters = [
+                counter for counter in COUNTERS
+                if any(counter_label(counter) == name or counter.model.__name__ == name for name in options['counters'])
+            ]
+            if not counters:
+                raise CommandError(f"No counters match {', '.join(options['counters'])}")
+
+        report = reconcile_counters(
+            counters, chunk_size=options['chunk_size'], throttle=options['throttle'], dry_run=options['dry_run']
+        )
+
+        for model, rows in report['scanned'].items():
+            self.stdout.write(f"Scanned {rows} {model} rows")
+        for label, entry in report['counters'].items():
+            if not entry['rows']:
+                continue
+            examples = ', '.join(f"{pk}: {stored} -> {expected}" for pk, stored, expected in entry['examples'])
+            self.stdout.write(f"{label}: {entry['rows']} rows off by {entry['drift']} in total ({examples})")
+
+        drifted = sum(entry['rows'] for entry in report['counters'].values())
+        action = 'would fix' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f"{drifted} drifted counters, {action} in {report['seconds']:.2f}s"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from social_media.trends import rebuild_trend_buckets, refresh_hashtag_trends
+
+
+class Command(BaseCommand):
+    help = 'Recompute hashtag velocity and growth and cache the trending list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recreate trend buckets from PostHashtag rows first')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            buckets = rebuild_trend_buckets()
+            self.stdout.write(f"Rebuilt {buckets} trend buckets")
+        scored = refresh_hashtag_trends()
+        self.stdout.write(self.style.SUCCESS(f"Scored {scored} trending hashtags"))
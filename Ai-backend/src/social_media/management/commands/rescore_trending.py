@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from social_media.rescoring import rescore_trending_posts
+
+
+class Command(BaseCommand):
+    help = 'Recompute time-decayed engagement scores for posts in the trending window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Rescore posts created in the last N days')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Posts loaded per query')
+
+    def handle(self, *args, **options):
+        stats = rescore_trending_posts(days=options['days'], chunk_size=options['chunk_size'])
+        rate = stats['scanned'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {stats['scanned']} posts, updated {stats['updated']} scores "
+            f"in {stats['seconds']:.2f}s ({rate:,.0f} rows/sec)"
+        ))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from social_media.fanout import fanout_stats, run_fanout_job
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued post fan-out jobs to followers, resuming interrupted ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for jobs until interrupted')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--status', action='store_true', help='Print queue depth, lag and progress, then exit')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            stats = fanout_stats()
+            self.stdout.write(f"Jobs by status: {stats['by_status']}")
+            self.stdout.write(f"Oldest pending job lag: {stats['lag_seconds']:.1f}s")
+            for job in stats['running']:
+                self.stdout.write(
+                    f"Running {job['post_id']}: {job['processed_count']}/{job['followers_total']} "
+                    f"(lease until {job['locked_until']})"
+                )
+            return
+
+        delivered = 0
+        try:
+            while True:
+                try:
+                    job = run_fanout_job()
+                except Exception as e:
+                    # The job goes back to pending (or failed after its last attempt)
+                    self.stderr.write(f"Fan-out job failed: {str(e)}")
+                    # A failure that repeats (e.g. the database is down) must not spin the loop
+                    time.sleep(options['interval'])
+                    continue
+                finally:
+                    close_old_connections()
+                if job is None:
+                    if not options['loop']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                delivered += 1
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} fan-out jobs"))
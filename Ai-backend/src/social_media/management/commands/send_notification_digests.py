@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from social_media.digests import send_notification_digests
+
+
+class Command(BaseCommand):
+    help = 'Summarize buffered new-post events into one digest notification per due user'
+
+    def handle(self, *args, **options):
+        report = send_notification_digests()
+        if report['skipped']:
+            self.stdout.write("Another digest run is in progress, skipping")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {report['users']} digests covering {report['events']} events "
+            f"({report['emails']} emails queued) in {report['seconds']:.2f}s"
+        ))
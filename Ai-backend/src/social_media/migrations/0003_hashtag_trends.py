@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0002_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='growth_rate',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.CreateModel(
+            name='HashtagTrendBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(db_index=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trend_buckets', to='social_media.hashtag')),
+            ],
+            options={
+                'unique_together': {('hashtag', 'bucket_start')},
+            },
+        ),
+    ]
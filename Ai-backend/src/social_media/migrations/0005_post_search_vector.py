@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:15
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # GIN indexes and tsvector only exist on PostgreSQL; other databases use the in-process index
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS social_media_post_search_vector_gin '
+        'ON social_media_post USING gin (search_vector)'
+    )
+    schema_editor.execute("""
+        UPDATE social_media_post AS post SET search_vector =
+            setweight(to_tsvector('english', coalesce(post.content, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce((
+                SELECT string_agg(hashtag.name, ' ')
+                FROM social_media_posthashtag AS link
+                JOIN social_media_hashtag AS hashtag ON hashtag.id = link.hashtag_id
+                WHERE link.post_id = post.id
+            ), '')), 'B')
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS social_media_post_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0004_fanoutjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
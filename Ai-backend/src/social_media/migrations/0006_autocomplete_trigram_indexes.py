@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm only exists on PostgreSQL; other databases fall back to plain LIKE scans
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    hashtag_table = apps.get_model('social_media', 'Hashtag')._meta.db_table
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Django compiles icontains / istartswith to UPPER(col::text) LIKE UPPER(%s), so the
+    # indexes are built on that same expression
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS social_media_hashtag_name_trgm '
+        f'ON {hashtag_table} USING gin ((UPPER(name::text)) gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS social_media_user_name_trgm '
+        f'ON {user_table} USING gin ((UPPER(name::text)) gin_trgm_ops)'
+    )
+    # SPLIT_PART(email, '@', 1) is the email local part expression used by autocomplete.suggest_users
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS social_media_user_email_local_trgm "
+        f"ON {user_table} USING gin ((UPPER(SPLIT_PART(email, '@', 1)::text)) gin_trgm_ops)"
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index in ('social_media_hashtag_name_trgm', 'social_media_user_name_trgm',
+                  'social_media_user_email_local_trgm'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('social_media', '0005_post_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
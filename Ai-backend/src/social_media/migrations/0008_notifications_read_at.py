@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0007_suggested_follows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='notifications_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
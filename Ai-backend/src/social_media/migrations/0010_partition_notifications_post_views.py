@@ -0,0 +1,48 @@
+"""
+Rebuilds social_media_notification and social_media_postview as monthly partitions
+on PostgreSQL.
+
+Before running on a large database:
+
+- Each table is copied with one INSERT ... SELECT inside the migration transaction,
+  and the table is locked (ACCESS EXCLUSIVE) until the migration commits. Reads and
+  writes of notifications and post views wait for the whole copy, so run it in a
+  maintenance window sized to the two tables.
+- The partition key has to be part of every unique constraint, so the database
+  primary key becomes (id, created_at). The model state still declares id alone as
+  the primary key; Django has no composite primary key before 5.2. A later
+  autodetected AlterField on either model's id or created_at would emit SQL for a
+  primary key that no longer exists. Write such changes as RunSQL against the
+  partitioned table, wrapped in SeparateDatabaseAndState.
+"""
+from django.db import migrations
+
+from social_media.partitions import partition_table, unpartition_table
+
+PARTITIONED = ('Notification', 'PostView')
+
+
+def partition_tables(apps, schema_editor):
+    # Declarative partitioning is PostgreSQL only; other databases keep plain tables
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name in PARTITIONED:
+        partition_table(schema_editor, apps.get_model('social_media', model_name))
+
+
+def unpartition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name in PARTITIONED:
+        unpartition_table(schema_editor, apps.get_model('social_media', model_name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0009_notification_coalescing'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
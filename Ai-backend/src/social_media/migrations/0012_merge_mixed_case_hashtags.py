@@ -0,0 +1,67 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def _normalize(name):
+    # Same rule as social_media.hashtags.normalize_hashtag at the time of this migration
+    return name.strip().lstrip('#').strip().lower()
+
+
+def merge_mixed_case_hashtags(apps, schema_editor):
+    """Fold hashtags that only differ by case or a leading '#' into their normalized name"""
+    Hashtag = apps.get_model('social_media', 'Hashtag')
+    PostHashtag = apps.get_model('social_media', 'PostHashtag')
+    HashtagTrendBucket = apps.get_model('social_media', 'HashtagTrendBucket')
+
+    groups = {}
+    for hashtag_id, name in Hashtag.objects.order_by('id').values_list('id', 'name').iterator():
+        normalized = _normalize(name)
+        if normalized:
+            groups.setdefault(normalized, []).append((hashtag_id, name))
+
+    for normalized, rows in groups.items():
+        if len(rows) == 1 and rows[0][1] == normalized:
+            continue
+        # An exact match keeps its id; otherwise the oldest row is renamed
+        keep_id = next((hashtag_id for hashtag_id, name in rows if name == normalized), rows[0][0])
+        merged_ids = [hashtag_id for hashtag_id, _ in rows if hashtag_id != keep_id]
+
+        linked = set(PostHashtag.objects.filter(hashtag_id=keep_id).values_list('post_id', flat=True))
+        for link_id, post_id in PostHashtag.objects.filter(hashtag_id__in=merged_ids).values_list('id', 'post_id'):
+            if post_id in linked:
+                continue
+            PostHashtag.objects.filter(id=link_id).update(hashtag_id=keep_id)
+            linked.add(post_id)
+
+        buckets = {bucket.bucket_start: bucket for bucket in HashtagTrendBucket.objects.filter(hashtag_id=keep_id)}
+        for bucket in HashtagTrendBucket.objects.filter(hashtag_id__in=merged_ids).order_by('id'):
+            if bucket.bucket_start in buckets:
+                kept = buckets[bucket.bucket_start]
+                kept.count += bucket.count
+                kept.save(update_fields=['count'])
+            else:
+                HashtagTrendBucket.objects.filter(id=bucket.id).update(hashtag_id=keep_id)
+                bucket.hashtag_id = keep_id
+                buckets[bucket.bucket_start] = bucket
+
+        trending_score = Hashtag.objects.filter(id__in=[hashtag_id for hashtag_id, _ in rows]).aggregate(
+            score=Max('trending_score')
+        )['score']
+        # Links and buckets left on the merged rows were duplicates; they go with the rows
+        Hashtag.objects.filter(id__in=merged_ids).delete()
+        Hashtag.objects.filter(id=keep_id).update(
+            name=normalized,
+            posts_count=PostHashtag.objects.filter(hashtag_id=keep_id).aggregate(count=Count('id'))['count'],
+            trending_score=trending_score or 0.0
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0011_notification_digests'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_mixed_case_hashtags, migrations.RunPython.noop),
+    ]
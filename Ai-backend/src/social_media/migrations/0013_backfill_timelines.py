@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from social_media.timeline import rebuild_timelines
+
+
+def backfill_timelines(apps, schema_editor):
+    # Follows and posts created before home timelines existed; fan-out keeps them current from here
+    rebuild_timelines(
+        apps.get_model('social_media', 'Post'),
+        apps.get_model('social_media', 'Follow'),
+        apps.get_model('social_media', 'UserProfile'),
+        apps.get_model('social_media', 'TimelineEntry'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0012_merge_mixed_case_hashtags'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinLengthValidator
 from django.utils import timezone
 import uuid
@@ -37,6 +38,21 @@ class Post(models.Model):
     # For trending algorithm
     engagement_score = models.FloatField(default=0.0, db_index=True)
     
+    # Full-text search document, maintained by search.update_search_vectors (GIN indexed on PostgreSQL)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    # Shared by calculate_engagement_score and the single-statement UPDATE in counters.py
+    ENGAGEMENT_WEIGHTS = {
+        'likes_count': 1,
+        'loves_count': 2,
+        'motivates_count': 3,
+        'comments_count': 5,
+        'shares_count': 10,
+        'views_count': 0.1,
+    }
+    DECAY_PER_HOUR = 0.1
+    MIN_TIME_DECAY = 0.1
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -51,15 +67,10 @@ class Post(models.Model):
     def calculate_engagement_score(self):
         """Calculate engagement score for trending algorithm"""
         hours_since_posted = (timezone.now() - self.created_at).total_seconds() / 3600
-        time_decay = max(0.1, 1 / (1 + hours_since_posted * 0.1))
+        time_decay = max(self.MIN_TIME_DECAY, 1 / (1 + hours_since_posted * self.DECAY_PER_HOUR))
         
-        engagement = (
-            self.likes_count * 1 + 
-            self.loves_count * 2 + 
-            self.motivates_count * 3 + 
-            self.comments_count * 5 + 
-            self.shares_count * 10 +
-            self.views_count * 0.1
+        engagement = sum(
+            getattr(self, field) * weight for field, weight in self.ENGAGEMENT_WEIGHTS.items()
         )
         
         self.engagement_score = engagement * time_decay
@@ -93,6 +104,7 @@ class Hashtag(models.Model):
     name = models.CharField(max_length=100, unique=True, db_index=True)
     posts_count = models.PositiveIntegerField(default=0, db_index=True)
     trending_score = models.FloatField(default=0.0, db_index=True)
+    growth_rate = models.FloatField(default=0.0)  # % change in uses, current trend window vs the previous one
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -101,6 +113,18 @@ class Hashtag(models.Model):
     def __str__(self):
         return self.name
 
+class HashtagTrendBucket(models.Model):
+    """Hashtag uses per hour, summed over sliding windows by the trend refresh"""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='trend_buckets')
+    bucket_start = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['hashtag', 'bucket_start']
+    
+    def __str__(self):
+        return f"#{self.hashtag.name} at {self.bucket_start}: {self.count}"
+
 class PostHashtag(models.Model):
     """Many-to-many relationship with additional data"""
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
@@ -183,6 +207,75 @@ class Follow(models.Model):
     def __str__(self):
         return f"{self.follower.email} follows {self.following.email}"
 
+class TimelineEntry(models.Model):
+    """Materialized home timeline row, pushed to a follower when an author posts"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()  # Copied from the post so reads never touch the posts table order
+    
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.post.id} in timeline of {self.user.email}"
+
+class NotificationDigestEvent(models.Model):
+    """A buffered new-post event for a user in digest mode, summarized by the digest job"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='digest_events')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='digest_events')
+    from_user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='digest_events_sent')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.post_id} in digest of {self.user_id}"
+
+class FanoutJob(models.Model):
+    """Background delivery of a new post to its author's followers, resumable from `cursor`"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name='fanout_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    cursor = models.BigIntegerField(default=0)  # Last Follow id delivered
+    followers_total = models.PositiveIntegerField(default=0)
+    processed_count = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    locked_until = models.DateTimeField(null=True, blank=True)  # Lease; an expired lease means the worker died
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Fan-out of {self.post_id}: {self.processed_count}/{self.followers_total} ({self.status})"
+
+class SuggestedFollows(models.Model):
+    """Precomputed friends-of-friends follow suggestions, rebuilt by compute_follow_suggestions"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='suggested_follows')
+    candidates = models.JSONField(default=list)  # [[user_id, mutual_count], ...] best first
+    computed_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{len(self.candidates)} suggestions for {self.user.email}"
+
 class Bookmark(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='bookmarks')
@@ -244,6 +337,12 @@ class Message(models.Model):
 
 class UserProfile(models.Model):
     """Extended user profile for social features"""
+    DIGEST_CHOICES = [
+        ('off', 'Off'),
+        ('hourly', 'Hourly'),
+        ('daily', 'Daily'),
+    ]
+    
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='social_profile')
     bio = models.TextField(max_length=500, blank=True)
     avatar_url = models.URLField(blank=True, null=True)
@@ -255,6 +354,14 @@ class UserProfile(models.Model):
     followers_count = models.PositiveIntegerField(default=0, db_index=True)
     following_count = models.PositiveIntegerField(default=0)
     
+    # Notifications created up to this time count as read, see unread.py
+    notifications_read_at = models.DateTimeField(null=True, blank=True)
+    
+    # New-post notifications are summarized instead of sent one by one, see digests.py
+    notification_digest = models.CharField(max_length=10, choices=DIGEST_CHOICES, default='off')
+    digest_email = models.BooleanField(default=False)
+    digest_sent_at = models.DateTimeField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -297,6 +404,7 @@ class Notification(models.Model):
         ('follow', 'New Follower'),
         ('message', 'New Message'),
         ('mention', 'Mentioned in Post'),
+        ('digest', 'Notification Digest'),
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -310,6 +418,11 @@ class Notification(models.Model):
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
     from_user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications_sent')
     
+    # Aggregation of events of one type on one target (see coalescing.py)
+    group_key = models.CharField(max_length=64, blank=True, default='')
+    actor_count = models.PositiveIntegerField(default=1)
+    sample_actors = models.JSONField(default=list, blank=True)  # [{'id', 'name'}], latest first
+    
     is_read = models.BooleanField(default=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
@@ -318,6 +431,7 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=['user', 'is_read', '-created_at']),
             models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['user', 'group_key', '-created_at']),
         ]
     
     def __str__(self):
@@ -0,0 +1,174 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """Keep full microsecond precision; DjangoJSONEncoder truncates datetimes to milliseconds"""
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(StandardResultsSetPagination):
+    """
+    Cursor pagination over the queryset's full sort key.
+
+    The sort key of the last row on a page, e.g. (engagement_score, created_at, id),
+    is encoded into an opaque ``cursor`` token. The next page is fetched with a row
+    comparison against that tuple instead of COUNT(*) + OFFSET, so page 200 costs the
+    same as page 1. The ``previous`` cursor holds the first row of the page and reads
+    backwards from it. Responses keep the page-number keys; ``count`` is null because
+    counting is what cursors avoid. Requests that still send ``page`` get page-number
+    pagination.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.use_page_numbers = (
+            self.page_query_param in request.query_params
+            and self.cursor_query_param not in request.query_params
+        )
+        if self.use_page_numbers:
+            # The pk tie-break keeps rows that share a sort value on one page
+            return super().paginate_queryset(queryset.order_by(*self.get_ordering(queryset)), request, view)
+
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.fields = [self.get_field(queryset, name) for name in self.ordering]
+        queryset = queryset.order_by(*self.ordering)
+
+        encoded_cursor = request.query_params.get(self.cursor_query_param)
+        position, reverse = self.decode_cursor(encoded_cursor) if encoded_cursor else (None, False)
+
+        # Fetch one extra row to know whether there is another page that way without counting
+        results = self.get_page_rows(queryset, position, self.page_size + 1, reverse)
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            # Read backwards from a later page, which is still there
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.next_position = self.get_position(results[-1]) if self.has_next and results else None
+        self.previous_position = self.get_position(results[0]) if self.has_previous and results else None
+        return results
+
+    def get_page_rows(self, queryset, position, limit, reverse=False):
+        """
+        Up to limit rows of the ordered queryset after position (None for the first
+        page), or before it, nearest first, when reverse is set.
+        """
+        if reverse:
+            queryset = queryset.order_by(*self.reversed_ordering())
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, reverse))
+        return list(queryset[:limit])
+
+    def get_paginated_response(self, data):
+        if self.use_page_numbers:
+            return super().get_paginated_response(data)
+
+        return Response({
+            'count': None,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if self.use_page_numbers:
+            return super().get_next_link()
+        return self.cursor_link(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.use_page_numbers:
+            return super().get_previous_link()
+        return self.cursor_link(self.previous_position, reverse=True)
+
+    def cursor_link(self, position, reverse):
+        if position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def get_ordering(self, queryset):
+        """Queryset ordering with the primary key appended as a unique tie-break"""
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        pk_name = queryset.model._meta.pk.name
+        ordering = [
+            name.replace('pk', pk_name) if name.lstrip('-') == 'pk' else name
+            for name in ordering
+        ]
+
+        if not any(name.lstrip('-') == pk_name for name in ordering):
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append(f"-{pk_name}" if descending else pk_name)
+        return ordering
+
+    def get_field(self, queryset, name):
+        name = name.lstrip('-')
+        # Annotations such as a search rank can be part of the sort key too
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise ValueError(f"KeysetPagination can only order by fields or annotations, got '{name}'")
+
+    def get_position(self, obj):
+        return [
+            getattr(obj, getattr(field, 'attname', None) or name.lstrip('-'))
+            for field, name in zip(self.fields, self.ordering)
+        ]
+
+    def reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f"-{name}" for name in self.ordering]
+
+    def keyset_filter(self, position, reverse=False):
+        """Lexicographic "after this row" (or "before" with reverse) filter: (a < x) OR (a = x AND b < y) OR ..."""
+        condition = Q()
+        for index, (name, value) in enumerate(zip(self.ordering, position)):
+            lookup = 'lt' if name.startswith('-') != reverse else 'gt'
+            clause = Q(**{f"{name.lstrip('-')}__{lookup}": value})
+            for previous_name, previous_value in zip(self.ordering[:index], position[:index]):
+                clause &= Q(**{previous_name.lstrip('-'): previous_value})
+            condition |= clause
+        return condition
+
+    def encode_cursor(self, position, reverse=False):
+        cursor = {'o': self.ordering, 'v': position}
+        if reverse:
+            cursor['r'] = 1
+        payload = json.dumps(cursor, cls=CursorJSONEncoder)
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, encoded_cursor):
+        """(position, whether to read backwards from it)"""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded_cursor.encode('ascii')))
+            if payload['o'] != self.ordering or len(payload['v']) != len(self.fields):
+                raise ValueError('Cursor does not match the requested ordering')
+            position = [field.to_python(value) for field, value in zip(self.fields, payload['v'])]
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,273 @@
+"""
+Monthly time-range partitions for append-heavy tables.
+
+On PostgreSQL, ``Notification`` and ``PostView`` are partitioned by the month of
+``created_at`` (migration 0010). Each month is its own table ``<table>_pYYYYMM``
+with its own indexes. Vacuum and index maintenance then touch recent months only,
+and a query bounded on ``created_at`` skips the other months at plan time. A
+``<table>_default`` partition catches rows outside the created months, so inserts
+never fail if the maintenance job falls behind.
+
+``maintain_partitions`` (run daily from cron) creates the next
+``SOCIAL_PARTITION_MONTHS_AHEAD`` months ahead of time. It drops months that are
+older than ``SOCIAL_PARTITION_RETENTION_MONTHS``, and each drop is one DROP TABLE
+with no DELETE scan. Reads go through ``within_retention``, so expired rows are
+hidden before their month is dropped and the bound lets the planner prune. On
+other databases the tables stay unpartitioned and expired rows are deleted in
+batches.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Notification, PostView
+
+PARTITIONED_MODELS = [Notification, PostView]
+PARTITION_KEY = 'created_at'
+DELETE_BATCH_SIZE = 5000
+
+
+def month_start(value):
+    return value.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def retention_start(model, now=None):
+    """Start of the oldest month of model rows that is kept"""
+    months = settings.SOCIAL_PARTITION_RETENTION_MONTHS[model.__name__]
+    return add_months(month_start(now or timezone.now()), 1 - months)
+
+
+def within_retention(queryset):
+    """Restrict a queryset of a partitioned model to the retained months"""
+    return queryset.filter(**{f"{PARTITION_KEY}__gte": retention_start(queryset.model)})
+
+
+def _bounds(month):
+    # Literal bounds: partition DDL takes no query parameters
+    return f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+
+
+def is_partitioned(table, using=connection):
+    if using.vendor != 'postgresql':
+        return False
+    with using.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+            [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def monthly_partitions(table, using=connection):
+    """{month: partition name} of the monthly partitions attached to table"""
+    with using.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s AND pg_table_is_visible(p.oid)',
+            [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = re.fullmatch(rf"{re.escape(table)}_p(\d{{4}})(\d{{2}})", name)
+        if match:
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)
+            partitions[month] = name
+    return partitions
+
+
+def _create_partition(table, month, using=connection):
+    qn = using.ops.quote_name
+    name, default = partition_name(table, month), default_partition_name(table)
+    end = add_months(month, 1)
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        cursor.execute(
+            f"SELECT 1 FROM {qn(default)} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s LIMIT 1",
+            [month, end]
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES {_bounds(month)}")
+            return
+        # The month already has rows in the default partition: move them before attaching
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(default)} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s "
+            f"RETURNING *) INSERT INTO {qn(name)} SELECT * FROM moved",
+            [month, end]
+        )
+        cursor.execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES {_bounds(month)}")
+
+
+def create_partitions(months_ahead=None, dry_run=False, now=None):
+    """Create the missing monthly partitions from this month to months_ahead months on; returns their names"""
+    months_ahead = settings.SOCIAL_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(now or timezone.now())
+    created = []
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        if not is_partitioned(table):
+            continue
+        existing = monthly_partitions(table)
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                if not dry_run:
+                    _create_partition(table, month)
+                created.append(partition_name(table, month))
+    return created
+
+
+def _delete_expired_rows(queryset, dry_run):
+    if dry_run:
+        return queryset.count()
+    deleted = 0
+    while True:
+        batch = list(queryset.values_list('pk', flat=True)[:DELETE_BATCH_SIZE])
+        if not batch:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=batch).delete()[0]
+
+
+def drop_expired_partitions(dry_run=False, now=None):
+    """
+    Drop monthly partitions older than each model's retention. Unpartitioned tables
+    have their expired rows deleted in batches instead. Returns {model name:
+    {'dropped': [partition names], 'deleted': rows}}.
+    """
+    qn = connection.ops.quote_name
+    report = {}
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        cutoff = retention_start(model, now)
+        entry = report[model.__name__] = {'dropped': [], 'deleted': 0}
+
+        if not is_partitioned(table):
+            expired = model.objects.filter(**{f"{PARTITION_KEY}__lt": cutoff})
+            entry['deleted'] = _delete_expired_rows(expired, dry_run)
+            continue
+
+        for month, name in sorted(monthly_partitions(table).items()):
+            if add_months(month, 1) <= cutoff:
+                if not dry_run:
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"DROP TABLE {qn(name)}")
+                entry['dropped'].append(name)
+        # Stray old rows can only be left in the default partition, which stays small
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"{'SELECT COUNT(*)' if dry_run else 'DELETE'} FROM {qn(default_partition_name(table))} "
+                f"WHERE {PARTITION_KEY} < %s",
+                [cutoff]
+            )
+            entry['deleted'] = cursor.fetchone()[0] if dry_run else cursor.rowcount
+    return report
+
+
+# Migration helpers. They take the schema editor and historical model of a RunPython operation.
+
+def _is_auto(field):
+    return field.get_internal_type() in ('AutoField', 'BigAutoField', 'SmallAutoField')
+
+
+def _create_staging(schema_editor, model, staging, suffix=''):
+    qn = schema_editor.quote_name
+    table = model._meta.db_table
+    schema_editor.execute(
+        f"CREATE TABLE {qn(staging)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS){suffix}"
+    )
+    pk = model._meta.pk
+    if _is_auto(pk):
+        # A serial default still points at the old table's sequence, which is dropped with it
+        schema_editor.execute(f"ALTER TABLE {qn(staging)} ALTER COLUMN {qn(pk.column)} DROP DEFAULT")
+
+def _restore_constraints(schema_editor, model, primary_key):
+    """Primary key, auto id sequence, indexes and foreign keys of a rebuilt table"""
+    qn = schema_editor.quote_name
+    table = model._meta.db_table
+    schema_editor.execute(
+        f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + '_pkey')} "
+        f"PRIMARY KEY ({', '.join(qn(column) for column in primary_key)})"
+    )
+
+    pk = model._meta.pk
+    if _is_auto(pk):
+        # LIKE does not copy the identity of an auto id; a sequence it owns takes its place
+        sequence = f"{table}_{pk.column}_seq"
+        schema_editor.execute(f"CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.{qn(pk.column)}")
+        schema_editor.execute(
+            f"ALTER TABLE {qn(table)} ALTER COLUMN {qn(pk.column)} SET DEFAULT nextval('{sequence}')"
+        )
+        schema_editor.execute(
+            f"SELECT setval('{sequence}', COALESCE(MAX({qn(pk.column)}), 0) + 1, false) FROM {qn(table)}"
+        )
+
+    for statement in schema_editor._model_indexes_sql(model):
+        schema_editor.execute(statement)
+    for field in model._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            schema_editor.execute(schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+
+
+def partition_table(schema_editor, model, months_ahead=None):
+    """
+    Rebuild a table as monthly partitions of created_at, copying its rows. The table
+    stays locked until the surrounding transaction commits, and its primary key
+    becomes (pk, created_at) in the database only (see migration 0010).
+    """
+    qn = schema_editor.quote_name
+    table = model._meta.db_table
+    staging = f"{table}_partitioned"
+    months_ahead = settings.SOCIAL_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+
+    _create_staging(schema_editor, model, staging, f" PARTITION BY RANGE ({PARTITION_KEY})")
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN({PARTITION_KEY}) FROM {qn(table)}")
+        oldest = cursor.fetchone()[0]
+
+    current = month_start(timezone.now())
+    month = month_start(oldest) if oldest and oldest < current else current
+    last = add_months(current, months_ahead)
+    while month <= last:
+        schema_editor.execute(
+            f"CREATE TABLE {qn(partition_name(table, month))} PARTITION OF {qn(staging)} FOR VALUES {_bounds(month)}"
+        )
+        month = add_months(month, 1)
+    schema_editor.execute(f"CREATE TABLE {qn(default_partition_name(table))} PARTITION OF {qn(staging)} DEFAULT")
+
+    schema_editor.execute(f"INSERT INTO {qn(staging)} SELECT * FROM {qn(table)}")
+    schema_editor.execute(f"DROP TABLE {qn(table)}")
+    schema_editor.execute(f"ALTER TABLE {qn(staging)} RENAME TO {qn(table)}")
+    # The partition key has to be part of the primary key
+    _restore_constraints(schema_editor, model, [model._meta.pk.column, PARTITION_KEY])
+
+
+def unpartition_table(schema_editor, model):
+    """Rebuild a partitioned table as one plain table, copying its rows"""
+    qn = schema_editor.quote_name
+    table = model._meta.db_table
+    staging = f"{table}_unpartitioned"
+
+    _create_staging(schema_editor, model, staging)
+    schema_editor.execute(f"INSERT INTO {qn(staging)} SELECT * FROM {qn(table)}")
+    # Drops the partitions and the id sequence with the table
+    schema_editor.execute(f"DROP TABLE {qn(table)}")
+    schema_editor.execute(f"ALTER TABLE {qn(staging)} RENAME TO {qn(table)}")
+    _restore_constraints(schema_editor, model, [model._meta.pk.column])
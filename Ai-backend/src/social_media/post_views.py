@@ -0,0 +1,218 @@
+"""
+Post view ingestion.
+
+Clients report batches of viewed post ids. Each view goes into a HyperLogLog
+sketch of the post's unique viewers for the day, held in process memory, so a
+request costs no database or cache writes. The flusher thread runs every
+``SOCIAL_VIEW_FLUSH_INTERVAL`` seconds. It merges the local sketches into the
+shared ones in the cache (a register-wise max, so merging is lossless). It then
+adds the growth of each day's unique viewer estimate to ``views_count`` in one
+batched UPDATE, and bulk-inserts the sampled ``PostView`` rows. Sketches use
+2 ** SOCIAL_VIEW_HLL_PRECISION one-byte registers (2 KB at precision 11, about
+2% error) however many views a post gets. They are stored zlib-compressed, so
+rarely viewed posts take a few bytes. Views buffered in a process that dies
+before its next flush are lost.
+"""
+import hashlib
+import math
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+from .background import PeriodicThread
+from .counters import PostCounters
+from .models import Post, PostView
+
+User = get_user_model()
+
+SKETCH_TIMEOUT = 60 * 60 * 48  # A day's sketch only grows during that day
+SAMPLE_SCALE = 1_000_000
+
+
+class HyperLogLog:
+    """Cardinality sketch over 64-bit hashes with 2 ** precision one-byte registers"""
+
+    def __init__(self, precision=None, registers=None):
+        self.precision = precision or settings.SOCIAL_VIEW_HLL_PRECISION
+        self.size = 1 << self.precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    @classmethod
+    def from_bytes(cls, data, precision=None):
+        return cls(precision, zlib.decompress(data))
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.registers), 1)
+
+    def add_hash(self, value):
+        """Add a 64-bit hash; returns True if the sketch changed"""
+        bits = 64 - self.precision
+        index = value >> bits
+        rank = bits - (value & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        merged = np.maximum(
+            np.frombuffer(self.registers, dtype=np.uint8), np.frombuffer(other.registers, dtype=np.uint8)
+        )
+        self.registers = bytearray(merged.tobytes())
+
+    def count(self):
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size ** 2 / np.ldexp(1.0, -registers.astype(np.int32)).sum()
+        zeros = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * self.size and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+
+def viewer_hash(post_id, viewer, day):
+    """64-bit hash of one viewer of one post on one day; drives both the sketch and sampling"""
+    digest = hashlib.blake2b(f"{post_id}:{viewer}:{day}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def _sketch_key(post_id, day):
+    return f"post_views:{post_id}:{day}"
+
+
+class ViewBuffer:
+    """This process's sketches and sampled rows since the last flush"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sketches = {}  # (post_id, day) -> HyperLogLog
+        self._samples = []  # Unsaved PostView rows
+        self._counted = {}  # (post_id, day) -> estimate already in views_count but not yet in the cache
+
+    def add(self, post_ids, user_id, ip_address):
+        day = timezone.now().strftime('%Y%m%d')
+        sample_below = settings.SOCIAL_VIEW_SAMPLE_RATE * SAMPLE_SCALE
+        with self._lock:
+            for post_id in post_ids:
+                value = viewer_hash(post_id, user_id, day)
+                sketch = self._sketches.get((post_id, day))
+                if sketch is None:
+                    sketch = self._sketches[(post_id, day)] = HyperLogLog()
+                sketch.add_hash(value)
+                # Sampling by hash keeps a viewer's repeat views of a post on one day in or out together
+                if value % SAMPLE_SCALE < sample_below:
+                    self._samples.append(PostView(post_id=post_id, user_id=user_id, ip_address=ip_address))
+
+    def drain(self):
+        with self._lock:
+            sketches, self._sketches = self._sketches, {}
+            samples, self._samples = self._samples, []
+            counted, self._counted = self._counted, {}
+        return sketches, samples, counted
+
+    def restore(self, sketches, samples, counted):
+        """Put back what a failed flush drained, with the estimates it already added to views_count"""
+        with self._lock:
+            for key, sketch in sketches.items():
+                existing = self._sketches.setdefault(key, sketch)
+                if existing is not sketch:
+                    existing.merge(sketch)
+            self._samples.extend(samples)
+            for key, estimate in counted.items():
+                self._counted[key] = max(self._counted.get(key, 0), estimate)
+
+
+_buffer = ViewBuffer()
+
+
+@contextmanager
+def _merge_lock(timeout=10):
+    # One flush at a time across workers, so a read-merge-write of a shared sketch is never overwritten
+    deadline = time.monotonic() + timeout
+    while not cache.add('post_views:lock', 1, timeout):
+        if time.monotonic() > deadline:
+            raise TimeoutError('Timed out waiting for the post view merge lock')
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        cache.delete('post_views:lock')
+
+
+def record_post_views(post_ids, user_id, ip_address):
+    """Buffer views of the given posts by one viewer; returns the number accepted"""
+    accepted = []
+    for post_id in post_ids[:settings.SOCIAL_VIEW_BATCH_LIMIT]:
+        try:
+            accepted.append(uuid.UUID(str(post_id)))
+        except ValueError:
+            continue
+    accepted = list(dict.fromkeys(accepted))
+    if accepted:
+        _buffer.add(accepted, user_id, ip_address)
+        start_view_flusher()
+    return len(accepted)
+
+
+def flush_post_views():
+    """Merge buffered sketches into the cache and write views_count and sampled rows; returns posts updated"""
+    sketches, samples, counted_by_key = _buffer.drain()
+    if not sketches and not samples:
+        return 0
+
+    deltas_by_post = {}
+    try:
+        with _merge_lock():
+            keys = {_sketch_key(post_id, day): (post_id, day) for post_id, day in sketches}
+            stored = cache.get_many(keys)
+            updates, counted_now = {}, {}
+            for key, (post_id, day) in keys.items():
+                sketch = sketches[(post_id, day)]
+                # An earlier flush may have written counts but failed before storing its sketch
+                counted = counted_by_key.get((post_id, day), 0)
+                if key in stored:
+                    registers, stored_counted = stored[key]
+                    sketch.merge(HyperLogLog.from_bytes(registers))
+                    counted = max(counted, stored_counted)
+                estimate = sketch.count()
+                # Estimates can dip slightly when the estimator switches ranges; views_count never goes back
+                if estimate > counted:
+                    deltas_by_post[post_id] = deltas_by_post.get(post_id, 0) + estimate - counted
+                    counted = estimate
+                updates[key] = (sketch.to_bytes(), counted)
+                counted_now[(post_id, day)] = counted
+            # Counts are written before the sketches that record them as counted
+            PostCounters.apply_many({post_id: {'views_count': delta} for post_id, delta in deltas_by_post.items()})
+            counted_by_key = counted_now
+            cache.set_many(updates, SKETCH_TIMEOUT)
+    except Exception:
+        # Merging is idempotent, so the drained sketches go back into the buffer for the next flush.
+        # Once counts are written they go back too, so the next flush does not add them again.
+        _buffer.restore(sketches, samples, counted_by_key)
+        raise
+
+    if samples:
+        # Posts and accounts deleted since the view would fail the foreign keys
+        post_ids = set(Post.objects.filter(id__in={view.post_id for view in samples}).values_list('id', flat=True))
+        user_ids = set(User.objects.filter(id__in={view.user_id for view in samples}).values_list('id', flat=True))
+        PostView.objects.bulk_create(
+            [view for view in samples if view.post_id in post_ids and view.user_id in user_ids], batch_size=1000
+        )
+    return len(deltas_by_post)
+
+
+view_flusher = PeriodicThread('post-view-flusher', flush_post_views, lambda: settings.SOCIAL_VIEW_FLUSH_INTERVAL)
+
+
+def start_view_flusher():
+    """Start this process's flusher thread once"""
+    return view_flusher.start()
@@ -0,0 +1,362 @@
+"""
+Real-time notification push over Server-Sent Events.
+
+``NotificationStreamApp`` wraps the ASGI application and serves ``STREAM_PATH``
+itself. Each connected client is one coroutine waiting on an asyncio queue, and
+it holds no thread or database connection while idle. Write paths call ``publish_notifications`` (new or
+updated rows) or ``publish_unread_changed`` (rows marked read). Events are
+delivered once the surrounding transaction commits, through the backend named
+by ``SOCIAL_REALTIME_BACKEND``:
+
+- ``local``: dispatched in this process only, for single-worker deployments and tests.
+- ``postgres``: sent with NOTIFY. Every worker runs one LISTEN connection and hands
+  what it hears to its own subscribers.
+
+On an event the stream loads the notifications named in it and the unread count
+with one short query burst, then sends them as ``notification`` and
+``unread_count`` events.
+
+EventSource cannot send an Authorization header, and a JWT in the query string
+would end up in access logs. Browsers therefore POST to ``notifications/stream/ticket/``
+with their JWT first and open the stream with the returned ``?ticket=``, which is
+good for one connection within ``SOCIAL_REALTIME_TICKET_TIMEOUT`` seconds.
+"""
+import asyncio
+import json
+import secrets
+import select
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+from .background import PeriodicThread
+from .models import Notification
+from .partitions import within_retention
+from .serializers import NotificationSerializer
+from .unread import get_read_watermark, unread_count
+
+CHANNEL = 'social_notifications'
+MAX_PAYLOAD = 7000  # NOTIFY payloads must stay under 8000 bytes
+STREAM_PATH = '/api/social_media/notifications/stream/'
+QUEUE_SIZE = 256  # Events buffered per client before it is told to resync
+RESYNC = object()
+
+
+class Subscription:
+    """One connected client: an asyncio queue fed from any thread"""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # A stalled client misses events; it reloads everything on the resync marker
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    def deliver(self, item):
+        self.loop.call_soon_threadsafe(self._put, item)
+
+
+class Broker:
+    """In-process registry of connected clients by user id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        get_backend().start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def dispatch(self, events):
+        """Hand [(user_id, notification_id or None)] to the matching clients of this process"""
+        with self._lock:
+            targets = [
+                (subscription, notification_id)
+                for user_id, notification_id in events
+                for subscription in self._subscribers.get(user_id, ())
+            ]
+        for subscription, notification_id in targets:
+            subscription.deliver(notification_id)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+broker = Broker()
+
+
+class LocalBackend:
+    """Delivers to this process's clients only"""
+
+    def start(self):
+        pass
+
+    def publish(self, events):
+        transaction.on_commit(lambda: broker.dispatch(events))
+
+
+class PostgresBackend:
+    """Delivers across workers with LISTEN/NOTIFY; NOTIFY is sent when the transaction commits"""
+
+    def __init__(self):
+        # Reconnects a second after the LISTEN connection fails
+        self._listener = PeriodicThread('notification-listener', self._listen, 1)
+
+    def start(self):
+        self._listener.start()
+
+    def publish(self, events):
+        batch, size = [], 0
+        with connection.cursor() as cursor:
+            for event in events:
+                batch.append(event)
+                size += len(json.dumps(event)) + 1
+                if size >= MAX_PAYLOAD:
+                    cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(batch)])
+                    batch, size = [], 0
+            if batch:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(batch)])
+
+    def _listen(self):
+        wrapper = connections['default']
+        raw = wrapper.get_new_connection(wrapper.get_connection_params())
+        raw.autocommit = True
+        try:
+            raw.cursor().execute(f'LISTEN {CHANNEL}')
+            while True:
+                if hasattr(raw, 'poll'):
+                    # psycopg2
+                    if select.select([raw], [], [], 5) == ([], [], []):
+                        continue
+                    raw.poll()
+                    notifies = []
+                    while raw.notifies:
+                        notifies.append(raw.notifies.pop(0))
+                else:
+                    # psycopg 3
+                    notifies = list(raw.notifies(timeout=5))
+                for notify in notifies:
+                    broker.dispatch([tuple(event) for event in json.loads(notify.payload)])
+        finally:
+            raw.close()
+
+
+_backends = {'local': LocalBackend, 'postgres': PostgresBackend}
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = _backends[settings.SOCIAL_REALTIME_BACKEND]()
+    return _backend
+
+
+def publish_notifications(notifications):
+    """Push new or updated notifications to their users' open streams once the transaction commits"""
+    events = [(notification.user_id, str(notification.pk)) for notification in notifications]
+    if events:
+        get_backend().publish(events)
+
+
+def publish_unread_changed(user_id):
+    """Tell the user's open streams to refresh the unread count (after marking rows read)"""
+    get_backend().publish([(user_id, None)])
+
+
+def _format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def _load_update(user_id, notification_ids):
+    """Serialized notifications by id (None: the latest page) and the unread count"""
+    try:
+        notifications = within_retention(Notification.objects.filter(user_id=user_id)).select_related('from_user')
+        if notification_ids is None:
+            notifications = notifications.order_by('-created_at')[:20]
+        else:
+            notifications = notifications.filter(id__in=notification_ids).order_by('created_at')
+        data = NotificationSerializer(notifications, many=True, context={
+            'notifications_read_at': get_read_watermark(user_id)
+        }).data
+        return data, unread_count(user_id)
+    finally:
+        # Idle streams must not pin a database connection
+        connection.close()
+
+
+def _ticket_key(ticket):
+    return f"notification_stream_ticket:{ticket}"
+
+
+def issue_stream_ticket(user_id):
+    """A random single-use ticket that opens one notification stream for user_id"""
+    ticket = secrets.token_urlsafe(32)
+    cache.set(_ticket_key(ticket), user_id, settings.SOCIAL_REALTIME_TICKET_TIMEOUT)
+    return ticket
+
+
+def _redeem_ticket(ticket):
+    """The user a ticket was issued to, or None; a ticket is used up by its first redemption"""
+    try:
+        user_id = cache.get(_ticket_key(ticket))
+        # Only the caller whose delete removed the key gets the user
+        if user_id is None or not cache.delete(_ticket_key(ticket)):
+            return None
+        return get_user_model().objects.filter(id=user_id).first()
+    finally:
+        connection.close()
+
+
+def _authenticate(raw_token):
+    try:
+        authentication = JWTAuthentication()
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+    finally:
+        connection.close()
+
+
+# Worker-pool threads per burst, not one thread per connected client
+load_update = sync_to_async(_load_update, thread_sensitive=False)
+authenticate = sync_to_async(_authenticate, thread_sensitive=False)
+redeem_ticket = sync_to_async(_redeem_ticket, thread_sensitive=False)
+
+
+async def notification_events(user_id):
+    """SSE text for one client, until the task is cancelled on disconnect"""
+    subscription = broker.subscribe(user_id)
+    try:
+        yield f"retry: {settings.SOCIAL_REALTIME_RETRY_MS}\n\n"
+        _, unread = await load_update(user_id, [])
+        yield _format_event('unread_count', {'unread_count': unread})
+
+        while True:
+            try:
+                item = await asyncio.wait_for(subscription.queue.get(), settings.SOCIAL_REALTIME_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Comment line that keeps proxies from closing an idle stream
+                yield ': keepalive\n\n'
+                continue
+
+            # Coalesce a burst into one query round trip
+            items = [item]
+            while not subscription.queue.empty():
+                items.append(subscription.queue.get_nowait())
+            if RESYNC in items:
+                notification_ids = None
+            else:
+                notification_ids = [item for item in items if item is not None]
+
+            notifications, unread = await load_update(user_id, notification_ids)
+            if notification_ids is None:
+                yield _format_event('resync', {'notifications': notifications})
+            else:
+                for notification in notifications:
+                    yield _format_event('notification', notification)
+            yield _format_event('unread_count', {'unread_count': unread})
+    finally:
+        broker.unsubscribe(subscription)
+
+
+class NotificationStreamApp:
+    """
+    ASGI app serving STREAM_PATH and passing every other request to Django.
+
+    Served outside Django's request handler on purpose: that handler keeps a
+    thread for each open request, which a stream holds for hours.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != STREAM_PATH:
+            return await self.application(scope, receive, send)
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        cors = self._cors_headers(headers.get('origin'))
+        if scope['method'] != 'GET':
+            return await self._respond(send, 405, {'error': 'Method not allowed'}, cors)
+
+        # A JWT header from clients that can send one, otherwise a single-use ticket
+        authorization = headers.get('authorization', '')
+        ticket = parse_qs(scope['query_string'].decode('latin-1')).get('ticket', [None])[0]
+        if authorization.startswith('Bearer '):
+            user = await authenticate(authorization[len('Bearer '):])
+        elif ticket:
+            user = await redeem_ticket(ticket)
+        else:
+            user = None
+        if user is None or not user.is_active:
+            return await self._respond(
+                send, 401, {'error': 'Authentication credentials were not provided or are invalid'}, cors
+            )
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),  # Stop nginx from buffering the stream
+            ] + cors,
+        })
+        stream = asyncio.create_task(self._stream(user.id, send))
+        try:
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+        finally:
+            stream.cancel()
+            await asyncio.gather(stream, return_exceptions=True)
+
+    async def _stream(self, user_id, send):
+        async for chunk in notification_events(user_id):
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+    async def _respond(self, send, status, data, headers):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')] + headers,
+        })
+        await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+    def _cors_headers(self, origin):
+        # Mirrors the corsheaders settings the rest of the API is served with
+        allowed = getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False) or origin in settings.CORS_ALLOWED_ORIGINS
+        if not origin or not allowed:
+            return []
+        headers = [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+        if getattr(settings, 'CORS_ALLOW_CREDENTIALS', False):
+            headers.append((b'access-control-allow-credentials', b'true'))
+        return headers
@@ -0,0 +1,145 @@
+"""
+Reconciliation of denormalized counters.
+
+``reconcile_counters`` walks each counted model in primary key chunks. For every
+chunk it recomputes the true counts with one GROUP BY query per counter and
+compares them with the stored values. Post counters are compared net of deltas
+still waiting in the write-behind buffer. Drifted rows are fixed in one short
+transaction per chunk: the rows are locked, recounted and written, so increments
+racing with the fix are not lost. Post fixes go through ``PostCounters`` so
+engagement scores and cached bodies follow. ``views_count`` is left out: it counts
+daily unique viewers estimated by ``post_views``, and PostView rows are only a sample.
+"""
+import time
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Count
+
+from .counter_buffer import pending_counter_deltas
+from .counters import PostCounters
+from .models import Bookmark, Comment, CommentLike, Follow, Hashtag, Post, PostHashtag, Reaction, Share, UserProfile
+
+# model.field is the number of source rows whose source_key equals the model's key column
+Counter = namedtuple('Counter', ['model', 'field', 'key', 'source', 'source_key'])
+
+COUNTERS = [
+    Counter(Post, 'likes_count', 'id', Reaction.objects.filter(reaction_type='liked'), 'post_id'),
+    Counter(Post, 'loves_count', 'id', Reaction.objects.filter(reaction_type='loved'), 'post_id'),
+    Counter(Post, 'motivates_count', 'id', Reaction.objects.filter(reaction_type='motivated'), 'post_id'),
+    Counter(Post, 'comments_count', 'id', Comment.objects.all(), 'post_id'),
+    Counter(Post, 'shares_count', 'id', Share.objects.all(), 'post_id'),
+    Counter(Post, 'bookmarks_count', 'id', Bookmark.objects.all(), 'post_id'),
+    Counter(Comment, 'likes_count', 'id', CommentLike.objects.all(), 'comment_id'),
+    Counter(Hashtag, 'posts_count', 'id', PostHashtag.objects.all(), 'hashtag_id'),
+    Counter(UserProfile, 'posts_count', 'user_id', Post.objects.all(), 'user_id'),
+    Counter(UserProfile, 'followers_count', 'user_id', Follow.objects.all(), 'following_id'),
+    Counter(UserProfile, 'following_count', 'user_id', Follow.objects.all(), 'follower_id'),
+]
+
+EXAMPLES_PER_COUNTER = 5
+
+
+def counter_label(counter):
+    return f"{counter.model.__name__}.{counter.field}"
+
+
+def _actual_counts(counter, keys):
+    return dict(
+        counter.source.filter(**{f"{counter.source_key}__in": keys})
+        .order_by().values(counter.source_key).annotate(count=Count('pk'))
+        .values_list(counter.source_key, 'count')
+    )
+
+
+def _expected_values(model, counters, rows):
+    """{pk: {field: value the row should store}} for rows of (pk, key, *stored values)"""
+    keys = [row[1] for row in rows]
+    actual = {counter.field: _actual_counts(counter, keys) for counter in counters}
+    # Buffered deltas are applied on top of the stored value by the next flush
+    pending = pending_counter_deltas(keys) if model is Post else {}
+    return {
+        pk: {
+            counter.field: actual[counter.field].get(key, 0) - pending.get(key, {}).get(counter.field, 0)
+            for counter in counters
+        }
+        for pk, key, *_ in rows
+    }
+
+
+def _drift(counters, rows, expected):
+    """[(counter, pk, stored, expected)] for every stored value that differs from its expected value"""
+    drift = []
+    for pk, key, *stored in rows:
+        for counter, value in zip(counters, stored):
+            if value != expected[pk][counter.field]:
+                drift.append((counter, pk, value, expected[pk][counter.field]))
+    return drift
+
+
+def _fix(model, counters, pks):
+    """Lock the drifted rows, recount them and write the true values; returns the drift fixed"""
+    fields = [counter.field for counter in counters]
+    key = counters[0].key
+    with transaction.atomic():
+        rows = list(
+            model.objects.select_for_update().filter(pk__in=pks).order_by('pk').values_list('pk', key, *fields)
+        )
+        expected = _expected_values(model, counters, rows)
+        drift = _drift(counters, rows, expected)
+        if model is Post:
+            deltas_by_post = {}
+            for counter, pk, stored, value in drift:
+                deltas_by_post.setdefault(pk, {})[counter.field] = value - stored
+            PostCounters.apply_many(deltas_by_post)
+        elif drift:
+            model.objects.bulk_update(
+                [model(pk=pk, **expected[pk]) for pk in {pk for _, pk, _, _ in drift}], fields
+            )
+    return drift
+
+
+def reconcile_counters(counters=COUNTERS, chunk_size=1000, throttle=0.0, dry_run=False):
+    """
+    Recompute counters chunk by chunk and fix drifted rows unless dry_run is set.
+    Sleeps `throttle` seconds after each chunk to spread the load. Returns
+    'counters' ({label: {'rows', 'drift', 'examples'}}), 'scanned' rows per model and 'seconds'.
+    """
+    started = time.perf_counter()
+    report = {counter_label(counter): {'rows': 0, 'drift': 0, 'examples': []} for counter in counters}
+    scanned = {}
+
+    by_model = {}
+    for counter in counters:
+        by_model.setdefault(counter.model, []).append(counter)
+
+    for model, model_counters in by_model.items():
+        fields = [counter.field for counter in model_counters]
+        scanned[model.__name__] = 0
+        last_pk = None
+        while True:
+            queryset = model.objects.order_by('pk')
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            rows = list(queryset.values_list('pk', model_counters[0].key, *fields)[:chunk_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            scanned[model.__name__] += len(rows)
+
+            drift = _drift(model_counters, rows, _expected_values(model, model_counters, rows))
+            if drift and not dry_run:
+                # Only rows that still differ after locking and recounting are written and reported
+                drift = _fix(model, model_counters, list({pk for _, pk, _, _ in drift}))
+
+            for counter, pk, stored, expected in drift:
+                entry = report[counter_label(counter)]
+                entry['rows'] += 1
+                entry['drift'] += abs(expected - stored)
+                if len(entry['examples']) < EXAMPLES_PER_COUNTER:
+                    entry['examples'].append((pk, stored, expected))
+
+            if throttle:
+                time.sleep(throttle)
+
+    return {'counters': report, 'scanned': scanned, 'seconds': time.perf_counter() - started}
@@ -0,0 +1,66 @@
+"""
+Periodic re-scoring of trending posts.
+
+``engagement_score`` only picks up its time decay when a post gets an interaction,
+so posts that go quiet keep their old score. This job walks the trending window
+in keyset chunks, recomputes the decay for the whole chunk with NumPy and writes
+back only the scores that moved. The decay bottoms out after
+``(1 / MIN_TIME_DECAY - 1) / DECAY_PER_HOUR`` hours (90 by default), so any window
+longer than that plus the run interval leaves no stale scores behind.
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .models import Post
+
+SCORE_FIELDS = tuple(Post.ENGAGEMENT_WEIGHTS)
+
+
+def compute_engagement_scores(counts, created_at_seconds, now_seconds):
+    """Vectorized Post.calculate_engagement_score; counts has one column per SCORE_FIELDS entry"""
+    weights = np.array([Post.ENGAGEMENT_WEIGHTS[field] for field in SCORE_FIELDS], dtype=np.float64)
+    hours_since_posted = (now_seconds - created_at_seconds) / 3600.0
+    time_decay = np.maximum(Post.MIN_TIME_DECAY, 1.0 / (1.0 + hours_since_posted * Post.DECAY_PER_HOUR))
+    return (counts @ weights) * time_decay
+
+
+def rescore_trending_posts(days=7, chunk_size=10000, tolerance=1e-4):
+    """
+    Recompute engagement_score for posts created in the last `days` days.
+    Returns the number of rows scanned and updated and the elapsed seconds.
+    """
+    started = time.perf_counter()
+    now = timezone.now()
+    window = Post.objects.filter(created_at__gte=now - timedelta(days=days))
+
+    scanned = updated = 0
+    last_id = None
+    while True:
+        chunk = window.order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        rows = list(chunk.values_list('id', 'created_at', 'engagement_score', *SCORE_FIELDS)[:chunk_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        scanned += len(rows)
+
+        ids = [row[0] for row in rows]
+        created_at = np.fromiter((row[1].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+        old_scores = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        counts = np.array([row[3:] for row in rows], dtype=np.float64)
+
+        new_scores = compute_engagement_scores(counts, created_at, now.timestamp())
+        changed = np.flatnonzero(~np.isclose(new_scores, old_scores, rtol=tolerance, atol=tolerance))
+        if changed.size:
+            Post.objects.bulk_update(
+                [Post(id=ids[index], engagement_score=float(new_scores[index])) for index in changed],
+                ['engagement_score'],
+                batch_size=1000
+            )
+            updated += changed.size
+
+    return {'scanned': scanned, 'updated': updated, 'seconds': time.perf_counter() - started}
@@ -0,0 +1,177 @@
+"""
+Full-text post search.
+
+On PostgreSQL each post has a ``search_vector`` tsvector (content weighted A,
+hashtags weighted B) with a GIN index. It is refreshed by ``update_search_vectors``
+whenever a post or its hashtags are written. Other databases (SQLite test runs)
+use an in-process inverted index with the same weighting. Both rank matches by
+text relevance blended with ``engagement_score`` into a ``search_score``
+annotation, which ``KeysetPagination`` pages over with the post id as tie-break.
+"""
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Value, When
+from django.db.models.functions import Ln
+
+from .models import Hashtag, Post, PostHashtag
+
+SEARCH_CONFIG = 'english'
+CONTENT_WEIGHT = 1.0  # tsvector weight A
+HASHTAG_WEIGHT = 0.4  # tsvector weight B
+ENGAGEMENT_WEIGHT = 0.1  # How much log(1 + engagement_score) lifts a match's text rank
+
+TERM_PATTERN = re.compile(r'\w+')
+
+
+def search_terms(text):
+    """Lowercased word tokens; '#Run' and 'run' search the same"""
+    return TERM_PATTERN.findall(text.lower())
+
+
+def update_search_vectors(post_ids):
+    """Rebuild the search document of the given posts from their content and hashtags"""
+    post_ids = [str(post_id) for post_id in post_ids]
+    if not post_ids:
+        return
+    if connection.vendor != 'postgresql':
+        _fallback_index.refresh(post_ids)
+        return
+
+    qn = connection.ops.quote_name
+    sql = f"""
+        UPDATE {qn(Post._meta.db_table)} AS post SET {qn('search_vector')} =
+            setweight(to_tsvector(%s, coalesce(post.{qn('content')}, '')), 'A') ||
+            setweight(to_tsvector(%s, coalesce((
+                SELECT string_agg(hashtag.{qn('name')}, ' ')
+                FROM {qn(PostHashtag._meta.db_table)} AS link
+                JOIN {qn(Hashtag._meta.db_table)} AS hashtag
+                    ON hashtag.{qn('id')} = link.{qn('hashtag_id')}
+                WHERE link.{qn('post_id')} = post.{qn('id')}
+            ), '')), 'B')
+        WHERE post.{qn('id')} = ANY(%s::uuid[])
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [SEARCH_CONFIG, SEARCH_CONFIG, post_ids])
+
+
+def search_posts(queryset, text):
+    """Filter to posts matching every term (the last one as a prefix) and annotate search_score"""
+    terms = search_terms(text)
+    if not terms:
+        queryset = queryset.none().annotate(text_rank=Value(0.0, output_field=FloatField()))
+    elif connection.vendor == 'postgresql':
+        # Terms are \w+ tokens, so they are safe to join into a raw tsquery
+        query = SearchQuery(' & '.join(terms[:-1] + [f"{terms[-1]}:*"]), search_type='raw', config=SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=query).annotate(
+            text_rank=SearchRank(F('search_vector'), query, weights=[0.1, 0.2, HASHTAG_WEIGHT, CONTENT_WEIGHT])
+        )
+    else:
+        ranks = _fallback_index.search(terms)
+        queryset = queryset.filter(id__in=list(ranks)).annotate(
+            text_rank=Case(
+                *[When(id=post_id, then=Value(rank)) for post_id, rank in ranks.items()],
+                default=Value(0.0),
+                output_field=FloatField()
+            )
+        )
+
+    return queryset.annotate(search_score=ExpressionWrapper(
+        F('text_rank') * (1 + Ln(1 + F('engagement_score')) * ENGAGEMENT_WEIGHT),
+        output_field=FloatField()
+    ))
+
+
+class InvertedIndex:
+    """
+    In-process term -> {post_id: weight} index for databases without full-text
+    search. Built from the database on first use and kept current by
+    update_search_vectors; other processes only see their own updates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)
+        self._documents = {}  # post_id -> terms, to remove stale postings on refresh
+        self._sorted_terms = None
+        self._loaded = False
+
+    def _documents_for(self, posts):
+        tags = defaultdict(list)
+        for post_id, name in PostHashtag.objects.filter(post__in=posts).values_list('post_id', 'hashtag__name'):
+            tags[str(post_id)].append(name)
+
+        for post_id, content in posts.values_list('id', 'content').iterator(chunk_size=2000):
+            weights = defaultdict(float)
+            for term in search_terms(content or ''):
+                weights[term] += CONTENT_WEIGHT
+            for term in search_terms(' '.join(tags[str(post_id)])):
+                weights[term] += HASHTAG_WEIGHT
+            yield str(post_id), weights
+
+    def _replace(self, post_id, weights):
+        for term in self._documents.pop(post_id, ()):
+            self._postings[term].pop(post_id, None)
+            if not self._postings[term]:
+                del self._postings[term]
+        for term, weight in weights.items():
+            self._postings[term][post_id] = weight
+        if weights:
+            self._documents[post_id] = set(weights)
+        self._sorted_terms = None
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            for post_id, weights in self._documents_for(Post.objects.all()):
+                self._replace(post_id, weights)
+            self._loaded = True
+
+    def refresh(self, post_ids):
+        with self._lock:
+            if not self._loaded:
+                return  # Picked up by the full load on first search
+            found = dict(self._documents_for(Post.objects.filter(id__in=post_ids)))
+            for post_id in post_ids:
+                self._replace(post_id, found.get(post_id, {}))
+
+    def _expand(self, term, prefix):
+        if not prefix:
+            return [term] if term in self._postings else []
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        start = bisect.bisect_left(self._sorted_terms, term)
+        matches = []
+        for candidate in self._sorted_terms[start:]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+
+    def search(self, terms):
+        """{post_id: rank} for posts matching every term, the last one as a prefix"""
+        with self._lock:
+            self._ensure_loaded()
+            total = max(len(self._documents), 1)
+            ranks = None
+            for index, term in enumerate(terms):
+                scores = defaultdict(float)
+                for match in self._expand(term, prefix=index == len(terms) - 1):
+                    postings = self._postings[match]
+                    idf = math.log(1 + total / len(postings))
+                    for post_id, weight in postings.items():
+                        scores[post_id] += weight * idf
+                if ranks is None:
+                    ranks = scores
+                else:
+                    ranks = {post_id: rank + scores[post_id] for post_id, rank in ranks.items() if post_id in scores}
+                if not ranks:
+                    return {}
+            return dict(ranks)
+
+
+_fallback_index = InvertedIndex()
@@ -2,10 +2,13 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.db.models import Exists, OuterRef
 from .models import (
-    Post, PostMedia, PostMetrics, Hashtag, PostHashtag, Reaction, Comment,
-    CommentLike, Follow, Bookmark, Share, Message, UserProfile, Report,
+    Post, PostMedia, PostMetrics, Hashtag, Reaction, Comment,
+    Follow, Share, Message, UserProfile, Report,
     Notification
 )
+from .loaders import load_viewer_state, load_comment_state, load_relationship_state
+from .hashtags import attach_hashtags
+from .search import update_search_vectors
 
 User = get_user_model()
 
@@ -92,6 +95,24 @@ class HashtagSerializer(serializers.ModelSerializer):
         model = Hashtag
         fields = ['name', 'posts_count', 'trending_score']
 
+def get_comment_state(context):
+    """Comment state passed in by the view or loaded with the page's viewer state"""
+    state = context.get('comment_state')
+    if state is None and context.get('viewer_state') is not None:
+        state = context['viewer_state'].comments
+    return state
+
+class CommentListSerializer(serializers.ListSerializer):
+    """Loads replies and like state for a page of comments in a fixed number of queries"""
+    
+    def to_representation(self, data):
+        comments = list(data.all() if hasattr(data, 'all') else data)
+        state = get_comment_state(self.context)
+        if comments and (state is None or not all(comment.id in state.comment_ids for comment in comments)):
+            request = self.context.get('request')
+            self.context['comment_state'] = load_comment_state(request.user if request else None, comments=comments)
+        return super().to_representation(comments)
+
 class CommentSerializer(serializers.ModelSerializer):
     user = UserBasicSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
@@ -103,64 +124,86 @@ class CommentSerializer(serializers.ModelSerializer):
             'id', 'user', 'content', 'created_at', 'updated_at',
             'likes_count', 'replies', 'user_liked'
         ]
+        list_serializer_class = CommentListSerializer
+    
+    def get_state(self, obj):
+        state = get_comment_state(self.context)
+        if state is None or obj.id not in state.comment_ids:
+            request = self.context.get('request')
+            state = load_comment_state(request.user if request else None, comments=[obj])
+            self.context['comment_state'] = state
+        return state
     
     def get_replies(self, obj):
-        if hasattr(obj, 'replies'):
-            return CommentSerializer(obj.replies.all()[:3], many=True, context=self.context).data
-        return []
+        return CommentSerializer(self.get_state(obj).replies.get(obj.id, []), many=True, context=self.context).data
     
     def get_user_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return CommentLike.objects.filter(user=request.user, comment=obj).exists()
-        return False
+        return obj.id in self.get_state(obj).liked
+
+class PostListSerializer(serializers.ListSerializer):
+    """Loads viewer state for the whole page up front so each post costs no extra queries"""
+    
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        if 'viewer_state' not in self.context:
+            request = self.context.get('request')
+            self.context['viewer_state'] = load_viewer_state(request.user if request else None, posts)
+        return super().to_representation(posts)
 
-class PostSerializer(serializers.ModelSerializer):
+class ViewerStateMixin:
+    def get_viewer_state(self, obj):
+        # Loaded per page by PostListSerializer or passed in by the view; single posts load their own
+        state = self.context.get('viewer_state')
+        if state is None or obj.id not in state.post_ids:
+            request = self.context.get('request')
+            state = load_viewer_state(request.user if request else None, [obj])
+            self.context['viewer_state'] = state
+        return state
+
+class PostBodySerializer(ViewerStateMixin, serializers.ModelSerializer):
+    """Viewer-independent post fields, cached and shared between viewers by the fragment cache"""
     user = UserBasicSerializer(read_only=True)
     media = PostMediaSerializer(many=True, read_only=True)
     metrics = PostMetricsSerializer(read_only=True)
     tags = serializers.SerializerMethodField()
-    reactions = serializers.SerializerMethodField()
-    bookmarked = serializers.SerializerMethodField()
-    comments_preview = serializers.SerializerMethodField()
-    timestamp = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
         fields = [
-            'id', 'user', 'type', 'content', 'created_at', 'timestamp',
+            'id', 'user', 'type', 'content', 'created_at',
             'likes_count', 'loves_count', 'motivates_count', 'comments_count',
             'shares_count', 'bookmarks_count', 'views_count', 'media',
-            'metrics', 'tags', 'reactions', 'bookmarked', 'comments_preview'
+            'metrics', 'tags'
         ]
+        list_serializer_class = PostListSerializer
     
     def get_tags(self, obj):
-        return list(obj.posthashtag_set.select_related('hashtag').values_list('hashtag__name', flat=True))
+        return self.get_viewer_state(obj).tags.get(obj.id, [])
+
+class PostOverlaySerializer(ViewerStateMixin, serializers.Serializer):
+    """Per-viewer and time-dependent post fields, layered over a cached post body"""
+    reactions = serializers.SerializerMethodField()
+    bookmarked = serializers.SerializerMethodField()
+    comments_preview = serializers.SerializerMethodField()
+    timestamp = serializers.SerializerMethodField()
+    
+    class Meta:
+        list_serializer_class = PostListSerializer
     
     def get_reactions(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            try:
-                user_reaction = obj.reactions.get(user=request.user)
-                return {
-                    'liked': user_reaction.reaction_type == 'liked',
-                    'loved': user_reaction.reaction_type == 'loved',
-                    'motivated': user_reaction.reaction_type == 'motivated'
-                }
-            except Reaction.DoesNotExist:
-                pass
-        
-        return {'liked': False, 'loved': False, 'motivated': False}
+        reaction_type = self.get_viewer_state(obj).reactions.get(obj.id)
+        return {
+            'liked': reaction_type == 'liked',
+            'loved': reaction_type == 'loved',
+            'motivated': reaction_type == 'motivated'
+        }
     
     def get_bookmarked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Bookmark.objects.filter(user=request.user, post=obj).exists()
-        return False
+        return obj.id in self.get_viewer_state(obj).bookmarks
     
     def get_comments_preview(self, obj):
-        # Get the first 2 comments that are already prefetched
-        comments = [comment for comment in obj.comments.all() if comment.parent is None][:2]
+        # First top-level comments, loaded per page with the viewer state
+        comments = self.get_viewer_state(obj).comments.previews.get(obj.id, [])
         return CommentSerializer(comments, many=True, context=self.context).data
     
     def get_timestamp(self, obj):
@@ -168,6 +211,10 @@ class PostSerializer(serializers.ModelSerializer):
         from django.utils.timesince import timesince
         return timesince(obj.created_at, timezone.now()) + " ago"
 
+class PostSerializer(PostBodySerializer, PostOverlaySerializer):
+    class Meta(PostBodySerializer.Meta):
+        fields = PostBodySerializer.Meta.fields + ['timestamp', 'reactions', 'bookmarked', 'comments_preview']
+
 class CreatePostSerializer(serializers.ModelSerializer):
     media_files = serializers.ListField(
         child=serializers.FileField(), 
@@ -213,26 +260,21 @@ class CreatePostSerializer(serializers.ModelSerializer):
         post = Post.objects.create(user=self.context['request'].user, **validated_data)
         
         # Handle media files (you'll need to implement file upload logic)
-        for i, media_file in enumerate(media_files):
-            # This is a placeholder - implement actual file upload
-            PostMedia.objects.create(
+        PostMedia.objects.bulk_create([
+            PostMedia(
                 post=post,
                 media_type='image' if media_file.content_type.startswith('image') else 'video',
                 file_url=f"/media/posts/{post.id}/{media_file.name}",  # Implement proper upload
                 order=i
             )
+            for i, media_file in enumerate(media_files)
+        ])
+        
+        # Handle hashtags: one upsert, one link insert and one atomic posts_count UPDATE
+        attach_hashtags(post, hashtags)
         
-        # Handle hashtags
-        for hashtag_name in hashtags:
-            if hashtag_name.startswith('#'):
-                hashtag_name = hashtag_name[1:]
-            
-            hashtag, created = Hashtag.objects.get_or_create(name=hashtag_name)
-            PostHashtag.objects.create(post=post, hashtag=hashtag)
-            
-            # Update hashtag count
-            hashtag.posts_count += 1
-            hashtag.save()
+        # Index content and hashtags for search
+        update_search_vectors([post.id])
         
         # Handle metrics
         if metrics_data:
@@ -265,7 +307,50 @@ class CreateMessageSerializer(serializers.ModelSerializer):
         model = Message
         fields = ['recipient', 'content']
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class RelationshipListSerializer(serializers.ListSerializer):
+    """Resolves follow state for a whole list of profiles at once instead of several queries per profile"""
+    
+    def to_representation(self, data):
+        profiles = list(data.all() if hasattr(data, 'all') else data)
+        if 'relationship_state' not in self.context:
+            request = self.context.get('request')
+            mutual = self.child.mutual_connections_kind
+            # Mutual counts precomputed by the view need no query
+            if all(hasattr(profile, 'mutual_count') for profile in profiles):
+                mutual = None
+            self.context['relationship_state'] = load_relationship_state(
+                request.user if request else None, [profile.user_id for profile in profiles], mutual=mutual
+            )
+        return super().to_representation(profiles)
+
+class RelationshipStateMixin:
+    # Which mutual connections to count, see load_relationship_state
+    mutual_connections_kind = 'following'
+    
+    def get_relationship_state(self, obj):
+        # Loaded per list by RelationshipListSerializer; single profiles load their own
+        state = self.context.get('relationship_state')
+        if state is None or obj.user_id not in state.user_ids:
+            request = self.context.get('request')
+            state = load_relationship_state(
+                request.user if request else None, [obj.user_id], mutual=self.mutual_connections_kind
+            )
+            self.context['relationship_state'] = state
+        return state
+    
+    def get_is_following(self, obj):
+        return obj.user_id in self.get_relationship_state(obj).following
+    
+    def get_is_followed_by(self, obj):
+        return obj.user_id in self.get_relationship_state(obj).followed_by
+    
+    def get_mutual_connections(self, obj):
+        # Precomputed by the suggestion engine when the profile comes from get_suggested_users
+        if hasattr(obj, 'mutual_count'):
+            return obj.mutual_count
+        return self.get_relationship_state(obj).mutual.get(obj.user_id, 0)
+
+class UserProfileSerializer(RelationshipStateMixin, serializers.ModelSerializer):
     user = UserBasicSerializer(read_only=True)
     is_following = serializers.SerializerMethodField()
     is_followed_by = serializers.SerializerMethodField()
@@ -278,38 +363,28 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'posts_count', 'followers_count', 'following_count',
             'is_following', 'is_followed_by', 'mutual_connections'
         ]
-    
-    def get_is_following(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated and request.user != obj.user:
-            return Follow.objects.filter(follower=request.user, following=obj.user).exists()
-        return False
-    
-    def get_is_followed_by(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated and request.user != obj.user:
-            return Follow.objects.filter(follower=obj.user, following=request.user).exists()
-        return False
-    
-    def get_mutual_connections(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated and request.user != obj.user:
-            # Find users that both the current user and profile user follow
-            current_user_following = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-            profile_user_following = Follow.objects.filter(follower=obj.user).values_list('following', flat=True)
-            mutual = set(current_user_following) & set(profile_user_following)
-            return len(mutual)
-        return 0
+        list_serializer_class = RelationshipListSerializer
 
 class NotificationSerializer(serializers.ModelSerializer):
     from_user = UserBasicSerializer(read_only=True)
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Notification
         fields = [
             'id', 'notification_type', 'title', 'message', 'from_user',
-            'is_read', 'created_at'
+            'actor_count', 'sample_actors', 'is_read', 'created_at'
         ]
+    
+    def get_is_read(self, obj):
+        # Read individually, or covered by the user's mark-all-read watermark
+        read_at = self.context.get('notifications_read_at')
+        return obj.is_read or (read_at is not None and obj.created_at <= read_at)
+
+class NotificationPreferencesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserProfile
+        fields = ['notification_digest', 'digest_email']
 
 class TrendingTopicSerializer(serializers.ModelSerializer):
     growth = serializers.SerializerMethodField()
@@ -319,32 +394,20 @@ class TrendingTopicSerializer(serializers.ModelSerializer):
         fields = ['name', 'posts_count', 'growth']
     
     def get_growth(self, obj):
-        # Calculate growth percentage (placeholder logic)
-        return f"+{min(25, max(5, obj.trending_score * 10))}%"
+        # Change in uses over the current trend window vs the previous one
+        return f"{obj.growth_rate:+.0f}%"
 
-class SuggestedUserSerializer(serializers.ModelSerializer):
+class SuggestedUserSerializer(RelationshipStateMixin, serializers.ModelSerializer):
     user = UserBasicSerializer(read_only=True)
     mutual_connections = serializers.SerializerMethodField()
     is_following = serializers.SerializerMethodField()
+    # People the viewer follows who follow the suggested user, as counted by the suggestion engine
+    mutual_connections_kind = 'followers'
     
     class Meta:
         model = UserProfile
         fields = ['user', 'mutual_connections', 'is_following']
-    
-    def get_mutual_connections(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            current_user_following = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-            suggested_user_followers = Follow.objects.filter(following=obj.user).values_list('follower', flat=True)
-            mutual = set(current_user_following) & set(suggested_user_followers)
-            return len(mutual)
-        return 0
-    
-    def get_is_following(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Follow.objects.filter(follower=request.user, following=obj.user).exists()
-        return False
+        list_serializer_class = RelationshipListSerializer
 
 class CommunityStatsSerializer(serializers.Serializer):
     total_posts = serializers.IntegerField()
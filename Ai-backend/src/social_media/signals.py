@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Notification
+from .realtime import publish_notifications
+from .unread import record_new_notifications
+
+
+@receiver(post_save, sender=Notification)
+def push_saved_notification(sender, instance, created, **kwargs):
+    if created:
+        record_new_notifications([instance])
+    publish_notifications([instance])
@@ -0,0 +1,30 @@
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+
+from core.task_queue import task
+
+from .fanout import run_fanout_job
+from .models import FanoutJob
+
+logger = logging.getLogger(__name__)
+
+
+@task(queue='fanout')
+def deliver_post_fanout(job_id):
+    """Deliver a new post to its author's followers; resumes from the job's cursor on retry"""
+    if run_fanout_job(job_id) is None:
+        status = FanoutJob.objects.filter(id=job_id).values_list('status', flat=True).first()
+        if status in ('pending', 'running'):
+            # Still leased by a worker that may have died; retry with backoff until the lease expires
+            raise RuntimeError(f"Fan-out job {job_id} is leased by another worker")
+
+
+@task(queue='email')
+def send_digest_email(email, subject, body):
+    """Email one notification digest; a failed send is retried with backoff"""
+    if not settings.EMAIL_HOST_PASSWORD or not settings.EMAIL_HOST_USER:
+        logger.warning("Email not configured, skipping digest email.")
+        return
+    EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [email]).send()
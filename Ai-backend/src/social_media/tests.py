@@ -1,3 +1,1180 @@
-from django.test import TestCase
+import asyncio
+import time
+from io import StringIO
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import autocomplete, post_views, rescoring, search
+from .background import PeriodicThread
+from .coalescing import collapse_notifications, notify
+from .counter_buffer import pending_counter_deltas
+from .counters import PostCounters, flush_post_counters, record_post_counters
+from .digests import RUN_LOCK_NAME, buffer_post_events, send_notification_digests
+from .fanout import run_fanout_job
+from .follow_graph import FOLLOWERS, FOLLOWING, get_follow_lists, invalidate_follow_graph
+from .fragments import get_post_versions
+from .hashtags import attach_hashtags
+from .loaders import load_comment_state, load_relationship_state
+from .models import (
+    Bookmark, Comment, CommentLike, FanoutJob, Follow, Hashtag, HashtagTrendBucket, Notification,
+    NotificationDigestEvent, Post, PostHashtag, PostView, Reaction, SuggestedFollows, TimelineEntry, UserProfile
+)
+from .partitions import (
+    add_months, create_partitions, default_partition_name, drop_expired_partitions, is_partitioned, month_start,
+    monthly_partitions, partition_name, partition_table, unpartition_table
+)
+from .realtime import RESYNC, QUEUE_SIZE, STREAM_PATH, Broker, NotificationStreamApp, broker
+from .suggestions import compute_follow_suggestions
+from .timeline import home_timeline_page, push_to_timelines
+from .trends import get_trending_hashtags
+from .unread import mark_all_read, mark_read, unread_count
+
+User = get_user_model()
+
+
+class SocialTestCase(TestCase):
+    """Users with authenticated API clients and an empty cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create_user(email=f"user{i}@example.com", name=f"User {i}", password='pw', is_active=True)
+            for i in range(4)
+        ]
+        self.clients = []
+        for user in self.users:
+            client = APIClient()
+            client.force_authenticate(user)
+            self.clients.append(client)
+
+    def create_post(self, user, content='Morning run', **fields):
+        return Post.objects.create(user=user, content=content, type=fields.pop('type', 'fitness'), **fields)
+
+
+class PostCountersTests(SocialTestCase):
+    def test_version_bumped_only_after_commit(self):
+        post = self.create_post(self.users[0])
+        before = get_post_versions([post.id])[post.id]
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            PostCounters.apply(post.id, likes_count=1)
+        self.assertEqual(get_post_versions([post.id])[post.id], before)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_post_versions([post.id])[post.id], before)
+
+    def test_rolled_back_write_keeps_version(self):
+        post = self.create_post(self.users[0])
+        before = get_post_versions([post.id])[post.id]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    PostCounters.apply(post.id, likes_count=1)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(get_post_versions([post.id])[post.id], before)
+        self.assertEqual(Post.objects.get(id=post.id).likes_count, 0)
+
+
+@override_settings(SOCIAL_COUNTER_WRITE_BEHIND=True, SOCIAL_COUNTER_BUFFER='local')
+class WriteBehindCounterTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        flush_post_counters()
+        patcher = mock.patch('social_media.counters.start_counter_flusher')
+        self.start_flusher = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_deltas_are_buffered_after_commit(self):
+        post = self.create_post(self.users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            record_post_counters(post.id, likes_count=1, comments_count=1)
+            self.assertEqual(pending_counter_deltas([post.id]), {})
+
+        self.assertEqual(pending_counter_deltas([post.id]), {post.id: {'likes_count': 1}})
+        self.start_flusher.assert_called_once()
+        flush_post_counters()
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.comments_count), (1, 1))
+
+    def test_rolled_back_deltas_are_dropped(self):
+        post = self.create_post(self.users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    record_post_counters(post.id, likes_count=1)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(pending_counter_deltas([post.id]), {})
+        self.start_flusher.assert_not_called()
+
+
+@override_settings(SOCIAL_COUNTER_WRITE_BEHIND=True, SOCIAL_COUNTER_BUFFER='local')
+class ReconcileCountersTests(SocialTestCase):
+    counters = ['--counter', 'Post.likes_count', '--counter', 'UserProfile.followers_count']
+
+    def setUp(self):
+        super().setUp()
+        flush_post_counters()
+        patcher = mock.patch('social_media.counters.start_counter_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.author = self.users[0]
+        self.post = self.create_post(self.author)
+        # Source rows written without their counters, as after a lost update
+        for user in self.users[1:3]:
+            Reaction.objects.create(user=user, post=self.post, reaction_type='liked')
+            Follow.objects.create(follower=user, following=self.author)
+        UserProfile.objects.update_or_create(user=self.author, defaults={'followers_count': 0})
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_counters', *self.counters, *args, throttle=0, stdout=out)
+        return out.getvalue()
+
+    def stored(self):
+        return (
+            Post.objects.values_list('likes_count', flat=True).get(id=self.post.id),
+            UserProfile.objects.values_list('followers_count', flat=True).get(user=self.author),
+        )
+
+    def test_dry_run_reports_without_writing(self):
+        output = self.reconcile('--dry-run')
+        self.assertIn('Post.likes_count: 1 rows off by 2 in total', output)
+        self.assertIn('UserProfile.followers_count: 1 rows off by 2 in total', output)
+        self.assertIn('2 drifted counters, would fix', output)
+        self.assertEqual(self.stored(), (0, 0))
+
+    def test_fix_writes_the_true_counts(self):
+        self.assertIn('2 drifted counters, fixed', self.reconcile())
+        self.assertEqual(self.stored(), (2, 2))
+        self.assertIn('0 drifted counters', self.reconcile())
+
+    def test_pending_deltas_are_neither_counted_twice_nor_wiped(self):
+        # A like whose counter delta is still in the write-behind buffer
+        with self.captureOnCommitCallbacks(execute=True):
+            Reaction.objects.create(user=self.users[3], post=self.post, reaction_type='liked')
+            record_post_counters(self.post.id, likes_count=1)
+
+        self.reconcile()
+        self.assertEqual(self.stored(), (2, 2))
+        self.assertEqual(pending_counter_deltas([self.post.id]), {self.post.id: {'likes_count': 1}})
+
+        # Already in line with the buffer, so a second run finds nothing to fix
+        self.assertIn('0 drifted counters', self.reconcile())
+        flush_post_counters()
+        self.assertEqual(self.stored(), (3, 2))
+
+
+@mock.patch('social_media.post_views.start_view_flusher')
+class PostViewTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        post_views._buffer.drain()
+        self.post = self.create_post(self.users[0])
+
+    def views_count(self):
+        return Post.objects.values_list('views_count', flat=True).get(id=self.post.id)
+
+    def test_sketch_estimates_are_close(self, start_flusher):
+        for viewers in (100, 20000):
+            sketch = post_views.HyperLogLog(precision=11)
+            for viewer in range(viewers):
+                sketch.add_hash(post_views.viewer_hash(self.post.id, viewer, '20261018'))
+            self.assertLess(abs(sketch.count() - viewers) / viewers, 0.05)
+
+    def test_repeat_viewers_count_once(self, start_flusher):
+        for user in (self.users[1], self.users[2], self.users[1]):
+            post_views.record_post_views([str(self.post.id), str(self.post.id)], user.id, '127.0.0.1')
+        post_views.flush_post_views()
+        post_views.record_post_views([str(self.post.id)], self.users[2].id, '127.0.0.1')
+        post_views.flush_post_views()
+        self.assertEqual(self.views_count(), 2)
+
+    def test_failed_sketch_write_is_not_counted_again(self, start_flusher):
+        for user in self.users[1:]:
+            post_views.record_post_views([str(self.post.id)], user.id, '127.0.0.1')
+        with mock.patch.object(post_views.cache, 'set_many', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                post_views.flush_post_views()
+        self.assertEqual(self.views_count(), 3)
+
+        # The restored sketches carry what they already added to views_count
+        post_views.flush_post_views()
+        self.assertEqual(self.views_count(), 3)
+        post_views.record_post_views([str(self.post.id)], self.users[0].id, '127.0.0.1')
+        post_views.flush_post_views()
+        self.assertEqual(self.views_count(), 4)
+
+
+class TrendingHashtagsTests(SocialTestCase):
+    def test_cache_miss_reads_persisted_scores(self):
+        low = Hashtag.objects.create(name='walk', trending_score=1.0)
+        high = Hashtag.objects.create(name='run', trending_score=5.0)
+        Hashtag.objects.create(name='idle')
+        HashtagTrendBucket.objects.create(hashtag=low, bucket_start=timezone.now(), count=3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_trending_hashtags(), [high, low])
+        # No refresh ran inside the request
+        self.assertTrue(HashtagTrendBucket.objects.filter(hashtag=low).exists())
+        self.assertEqual(Hashtag.objects.get(id=low.id).trending_score, 1.0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_trending_hashtags(), [high, low])
+
+
+class KeysetPaginationTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # Two posts share a timestamp, so the id tie-break decides their order
+        for i, minutes_ago in enumerate([0, 1, 1, 2, 3]):
+            post = self.create_post(self.users[i % 2], content=f"Post {i}")
+            Post.objects.filter(id=post.id).update(created_at=now - timezone.timedelta(minutes=minutes_ago))
+        self.newest_first = [
+            str(post_id) for post_id in Post.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        ]
+
+    def get(self, url, params=None):
+        response = self.clients[0].get(url, params)
+        return response.data, [post['id'] for post in response.data['results']]
+
+    def test_cursor_pages_keep_page_number_keys(self):
+        data, ids = self.get('/api/social_media/posts/', {'feed': 'all', 'page_size': 2})
+        self.assertEqual(list(data), ['count', 'next', 'previous', 'results'])
+        self.assertEqual((data['count'], data['previous']), (None, None))
+
+        pages = [ids]
+        while data['next']:
+            data, ids = self.get(data['next'])
+            pages.append(ids)
+        self.assertEqual(sum(pages, []), self.newest_first)
+
+        # Walk back from the last page to the first
+        for page in reversed(pages[:-1]):
+            data, ids = self.get(data['previous'])
+            self.assertEqual(ids, page)
+        self.assertIsNone(data['previous'])
+        self.assertIsNotNone(data['next'])
+
+    def test_page_numbers_still_count(self):
+        data, ids = self.get('/api/social_media/posts/', {'feed': 'all', 'page_size': 2, 'page': 2})
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(ids, self.newest_first[2:4])
+
+
+class ViewerStateTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer, self.author = self.users[:2]
+        for i in range(6):
+            post = self.create_post(self.author, content=f"Run {i}")
+            attach_hashtags(post, ['running', f"day{i}"])
+            Reaction.objects.create(user=self.viewer, post=post, reaction_type='loved')
+            Reaction.objects.create(user=self.users[2], post=post, reaction_type='liked')
+            Bookmark.objects.create(user=self.viewer, post=post)
+            comment = Comment.objects.create(user=self.users[2], post=post, content='Nice')
+            Comment.objects.create(user=self.viewer, post=post, parent=comment, content='Thanks')
+
+    def feed_queries(self, page_size):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.clients[0].get('/api/social_media/posts/', {'feed': 'all', 'page_size': page_size})
+        self.assertEqual(len(response.data['results']), page_size)
+        for post in response.data['results']:
+            self.assertTrue(post['bookmarked'])
+        return len(queries)
+
+    def create_post_queries(self, hashtags):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.clients[0].post('/api/social_media/posts/create/', {
+                'type': 'fitness', 'content': 'Evening swim', 'hashtags': hashtags
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(response.data['tags']), sorted(hashtags))
+        return len(queries)
+
+    def test_feed_page_queries_do_not_grow_with_the_page(self):
+        self.assertEqual(self.feed_queries(2), self.feed_queries(6))
+
+    def test_create_post_response_queries_are_constant(self):
+        # The first post creates the author's profile row
+        self.create_post_queries(['warmup'])
+        self.assertEqual(self.create_post_queries(['swim']), self.create_post_queries(['swim', 'pool', 'cardio']))
+
+
+class CommentLoaderTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer = self.users[0]
+        self.started = timezone.now() - timezone.timedelta(hours=1)
+        self.posts, self.comments = [], {}
+        for i in range(3):
+            post = self.create_post(self.users[1])
+            top = [self.comment(post, None) for _ in range(4)]
+            replies = [self.comment(post, top[0]) for _ in range(4)]
+            self.comment(post, replies[0])
+            CommentLike.objects.create(user=self.viewer, comment=replies[1])
+            self.posts.append(post)
+            self.comments[post.id] = (top, replies)
+
+    def comment(self, post, parent):
+        comment = Comment.objects.create(user=self.users[2], post=post, parent=parent, content='Nice')
+        # Distinct times, so the expected order does not depend on random UUIDs
+        self.started += timezone.timedelta(seconds=1)
+        Comment.objects.filter(id=comment.id).update(created_at=self.started)
+        comment.created_at = self.started
+        return comment
+
+    def test_previews_keep_the_first_comments_of_each_post(self):
+        state = load_comment_state(
+            self.viewer, post_ids=[post.id for post in self.posts], preview_limit=2, reply_limit=3
+        )
+        for post in self.posts:
+            top, replies = self.comments[post.id]
+            self.assertEqual(state.previews[post.id], top[:2])
+            self.assertEqual(state.replies[top[0].id], replies[:3])
+            self.assertEqual(len(state.replies[replies[0].id]), 1)
+            self.assertNotIn(top[1].id, state.replies)
+            self.assertIn(replies[1].id, state.liked)
+
+    def test_queries_per_reply_depth_not_per_post(self):
+        # Previews, two levels of replies, the empty third level and the viewer's likes
+        for posts in (self.posts[:1], self.posts):
+            with self.assertNumQueries(5):
+                load_comment_state(self.viewer, post_ids=[post.id for post in posts])
+
+    def test_comment_page_replies_in_constant_queries(self):
+        for posts in (self.posts[:1], self.posts):
+            page = [comment for post in posts for comment in self.comments[post.id][0]]
+            with self.assertNumQueries(4):
+                state = load_comment_state(self.viewer, comments=page)
+            self.assertTrue({comment.id for comment in page} <= state.comment_ids)
+
+
+class RescoringTests(SocialTestCase):
+    # (hours old, likes, loves, motivates, comments, shares, views)
+    DATASET = [
+        (0, 3, 0, 0, 1, 0, 40), (2, 10, 2, 1, 0, 1, 300), (5, 0, 0, 0, 0, 0, 0), (12, 1, 5, 0, 2, 0, 10),
+        (30, 40, 0, 2, 8, 3, 900), (95, 8, 8, 8, 8, 8, 80), (24 * 8, 100, 0, 0, 0, 0, 0),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        patcher = mock.patch('django.utils.timezone.now', return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.posts = []
+        for hours, *counts in self.DATASET:
+            post = self.create_post(self.users[0], **dict(zip(rescoring.SCORE_FIELDS, counts)))
+            # Scores as they were at the post's last interaction, long before now
+            Post.objects.filter(id=post.id).update(
+                created_at=self.now - timezone.timedelta(hours=hours), engagement_score=0
+            )
+            post.refresh_from_db()
+            self.posts.append(post)
+
+    def test_matches_python_scores_and_order(self):
+        stats = rescoring.rescore_trending_posts(days=7, chunk_size=3)
+        self.assertEqual((stats['scanned'], stats['updated']), (6, 5))
+
+        in_window = self.posts[:-1]
+        scores = dict(Post.objects.values_list('id', 'engagement_score'))
+        for post in in_window:
+            self.assertAlmostEqual(scores[post.id], post.calculate_engagement_score(), places=6)
+        # The post without interactions scores 0 either way; the others rank the same
+        ranked = sorted(in_window, key=lambda post: post.engagement_score, reverse=True)[:5]
+        self.assertEqual(
+            list(Post.objects.order_by('-engagement_score').values_list('id', flat=True)[:5]),
+            [post.id for post in ranked]
+        )
+        # Outside the window scores are left alone
+        self.assertEqual(scores[self.posts[-1].id], 0)
+
+        self.assertEqual(rescoring.rescore_trending_posts(days=7)['updated'], 0)
+
+    def test_command_reports_throughput(self):
+        out = StringIO()
+        call_command('rescore_trending', '--chunk-size', '2', stdout=out)
+        self.assertRegex(out.getvalue(), r"Scanned 6 posts, updated 5 scores in [0-9.]+s \([0-9,]+ rows/sec\)")
+
+
+class SearchTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(search, '_fallback_index', search.InvertedIndex())
+        self.index = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        author = self.users[0]
+        self.content_match = self.create_post(author, content='River run at dawn')
+        self.hashtag_match = self.create_post(author, content='Yoga stretch')
+        attach_hashtags(self.hashtag_match, ['run'])
+        self.create_post(author, content='Quiet walk')
+        self.popular_match = self.create_post(author, content='River run at dusk', engagement_score=100)
+
+    def search_ids(self, text):
+        return list(search.search_posts(Post.objects.all(), text).order_by('-search_score').values_list('id', flat=True))
+
+    def test_content_outranks_hashtags_and_engagement_breaks_ties(self):
+        self.assertEqual(
+            self.search_ids('#Run'), [self.popular_match.id, self.content_match.id, self.hashtag_match.id]
+        )
+        # Every term must match, the last one as a prefix
+        self.assertEqual(self.search_ids('river da'), [self.content_match.id])
+        self.assertEqual(self.search_ids('!!'), [])
+
+    def test_api_pages_by_search_score(self):
+        response = self.clients[1].get('/api/social_media/discover/', {'search': 'run', 'page_size': 2})
+        ids = [post['id'] for post in response.data['results']]
+        self.assertEqual(ids, [str(self.popular_match.id), str(self.content_match.id)])
+
+        response = self.clients[1].get(response.data['next'])
+        self.assertEqual([post['id'] for post in response.data['results']], [str(self.hashtag_match.id)])
+        self.assertIsNone(response.data['next'])
+
+    def test_falls_back_to_the_inverted_index_without_postgres(self):
+        self.assertNotEqual(connection.vendor, 'postgresql')
+        with mock.patch.object(self.index, 'search', wraps=self.index.search) as index_search:
+            self.assertEqual(len(self.search_ids('run')), 3)
+        index_search.assert_called_once_with(['run'])
+
+        # Once loaded, the index follows post writes through update_search_vectors
+        post = self.create_post(self.users[1], content='Run club')
+        search.update_search_vectors([post.id])
+        self.assertIn(post.id, self.search_ids('club'))
+        Post.objects.filter(id=post.id).update(content='Swim club')
+        search.update_search_vectors([post.id])
+        self.assertNotIn(post.id, self.search_ids('run'))
+
+
+class InlineThread:
+    """Runs a background thread's target on start(), so refreshes finish inside the test"""
+
+    def __init__(self, target, **kwargs):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+@override_settings(SOCIAL_AUTOCOMPLETE_TRIE_SIZE=3)
+class AutocompleteTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(autocomplete, 'hashtag_trie', autocomplete.HashtagTrieCache())
+        self.trie_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        for name, posts_count in [('running', 5), ('yoga', 4), ('runner', 3), ('marathonrun', 2), ('rowing', 1)]:
+            Hashtag.objects.create(name=name, posts_count=posts_count)
+
+    def names(self, prefix, limit):
+        return [hashtag['name'] for hashtag in autocomplete.suggest_hashtags(prefix, limit)]
+
+    def test_trie_completes_prefixes_most_used_first(self):
+        trie = autocomplete.HashtagTrie([('rowing', 1), ('running', 5), ('runner', 3)])
+        self.assertEqual(trie.complete('r', 2), [('running', 5), ('runner', 3)])
+        self.assertEqual(trie.complete('ro', 10), [('rowing', 1)])
+        self.assertEqual(trie.complete('x', 10), [])
+
+        self.trie_cache.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('#Ru', 2), ['running', 'runner'])
+
+    def test_short_trie_answers_fall_back_to_the_database(self):
+        self.trie_cache.get()
+        # Prefix matches first, then substring matches; 'rowing' is outside the trie
+        self.assertEqual(self.names('r', 10), ['running', 'runner', 'rowing', 'marathonrun'])
+        self.assertEqual(self.names('run', 10), ['running', 'runner', 'marathonrun'])
+
+    @mock.patch('social_media.autocomplete.threading.Thread', InlineThread)
+    def test_new_hashtags_appear_after_the_refresh(self):
+        self.assertEqual(self.names('run', 2), ['running', 'runner'])
+        Hashtag.objects.create(name='runclub', posts_count=10)
+        # The current trie keeps answering until it is older than the refresh interval
+        self.assertEqual(self.names('run', 2), ['running', 'runner'])
+
+        with override_settings(SOCIAL_AUTOCOMPLETE_REFRESH=0):
+            self.assertEqual(self.names('run', 2), ['runclub', 'running'])
+
+    def test_users_match_name_or_email_without_trigrams(self):
+        rita = User.objects.create_user(email='rita@example.com', password='x', name='Rita Runner', is_active=True)
+        User.objects.create_user(email='ritz@example.com', password='x', name='Gone', is_active=False)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(autocomplete.suggest_users('@Rit', 5)), [rita])
+        self.assertNotIn('similarity', queries[0]['sql'].lower())
+        self.assertEqual(list(autocomplete.suggest_users('runner', 5)), [rita])
+        self.assertEqual(list(autocomplete.suggest_users('rita', 5, exclude_user_id=rita.id)), [])
+        self.assertEqual(
+            [user.id for user in autocomplete.suggest_users('user', 10)], [user.id for user in self.users]
+        )
+
+
+class FollowSuggestionTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users += [
+            User.objects.create_user(email=f"user{i}@example.com", password='x', name=f"User {i}", is_active=True)
+            for i in (4, 5)
+        ]
+        u = self.users
+        for follower, following in [(0, 1), (0, 2), (1, 0), (1, 3), (1, 4), (2, 1), (2, 3), (2, 5), (5, 4)]:
+            Follow.objects.create(follower=u[follower], following=u[following])
+        for user in u:
+            UserProfile.objects.get_or_create(user=user)
+
+    def test_ranks_friends_of_friends_by_mutuals_then_followers(self):
+        out = StringIO()
+        call_command('compute_follow_suggestions', '--block-rows', '2', stdout=out)
+        self.assertIn('Computed suggestions for 6 users', out.getvalue())
+
+        u = self.users
+        # Not themself (via user 1) and not users 1 and 2, whom they already follow
+        self.assertEqual(
+            SuggestedFollows.objects.get(user=u[0]).candidates, [[u[3].id, 2], [u[4].id, 1], [u[5].id, 1]]
+        )
+        self.assertEqual(SuggestedFollows.objects.get(user=u[5]).candidates, [])
+
+    def test_endpoint_skips_users_followed_since_the_run(self):
+        compute_follow_suggestions()
+        u = self.users
+        Follow.objects.create(follower=u[0], following=u[3])
+        invalidate_follow_graph(u[0].id, u[3].id)
+
+        response = self.clients[0].get('/api/social_media/users/suggested/')
+        suggested = [(row['user']['id'], row['mutual_connections']) for row in response.data]
+        self.assertEqual(suggested[:2], [(u[4].id, 1), (u[5].id, 1)])
+        self.assertNotIn(u[3].id, [user_id for user_id, _ in suggested])
+
+
+class RelationshipStateTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        u = self.users
+        for follower, following in [(0, 1), (1, 0), (0, 2), (1, 3), (2, 3), (3, 2)]:
+            Follow.objects.create(follower=u[follower], following=u[following])
+        self.user_ids = [user.id for user in u]
+
+    def assert_state(self, mutual, counts, queries):
+        u = self.users
+        with self.assertNumQueries(queries):
+            state = load_relationship_state(u[0], self.user_ids, mutual=mutual)
+        self.assertEqual(state.following, {u[1].id, u[2].id})
+        self.assertEqual(state.followed_by, {u[1].id})
+        # Users with no mutual connections may be left out or counted as 0
+        self.assertEqual({user_id: state.mutual.get(user_id, 0) for user_id in self.user_ids[1:]}, counts)
+
+    def warm(self):
+        for kind in (FOLLOWING, FOLLOWERS):
+            get_follow_lists(kind, self.user_ids)
+
+    def test_uncached_lists_use_targeted_queries(self):
+        u = self.users
+        # People both follow, then people the viewer follows who follow the user
+        self.assert_state('following', {u[1].id: 0, u[2].id: 0, u[3].id: 1}, queries=2)
+        self.assert_state('followers', {u[1].id: 0, u[2].id: 0, u[3].id: 2}, queries=2)
+        with self.assertNumQueries(1):
+            load_relationship_state(u[0], self.user_ids[:2], mutual=None)
+
+    def test_cached_lists_need_no_queries(self):
+        u = self.users
+        self.warm()
+        self.assert_state('following', {u[1].id: 0, u[2].id: 0, u[3].id: 1}, queries=0)
+        self.assert_state('followers', {u[1].id: 0, u[2].id: 0, u[3].id: 2}, queries=0)
+
+    @override_settings(SOCIAL_FOLLOW_GRAPH_MAX_CACHED=1)
+    def test_lists_over_the_cache_cap_are_not_loaded_in_full(self):
+        u = self.users
+        self.warm()
+        # The viewer follows two users, so their following list is never cached
+        self.assert_state('following', {u[1].id: 0, u[2].id: 0, u[3].id: 1}, queries=2)
+        self.assert_state('followers', {u[1].id: 0, u[2].id: 0, u[3].id: 2}, queries=2)
+
+    def test_anonymous_and_self_have_no_relationship(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(load_relationship_state(None, self.user_ids).following, set())
+            self.assertEqual(load_relationship_state(self.users[0], [self.users[0].id]).mutual, {})
+
+
+class HashtagTests(SocialTestCase):
+    def test_attach_normalizes_and_counts(self):
+        first, second = self.create_post(self.users[0]), self.create_post(self.users[1])
+        attach_hashtags(first, ['#Run', 'yoga', 'run '])
+        attach_hashtags(second, ['RUN'])
+
+        self.assertEqual(dict(Hashtag.objects.values_list('name', 'posts_count')), {'run': 2, 'yoga': 1})
+        self.assertEqual(PostHashtag.objects.count(), 3)
+
+    def test_migration_merges_mixed_case_hashtags(self):
+        first, second = self.create_post(self.users[0]), self.create_post(self.users[1])
+        upper = Hashtag.objects.create(name='Run', posts_count=2, trending_score=3.0)
+        lower = Hashtag.objects.create(name='run', posts_count=1, trending_score=1.0)
+        tagged = Hashtag.objects.create(name='#YOGA', posts_count=1)
+        PostHashtag.objects.bulk_create([
+            PostHashtag(post=first, hashtag=upper), PostHashtag(post=second, hashtag=upper),
+            PostHashtag(post=first, hashtag=lower), PostHashtag(post=first, hashtag=tagged),
+        ])
+        now = timezone.now()
+        HashtagTrendBucket.objects.create(hashtag=upper, bucket_start=now, count=2)
+        HashtagTrendBucket.objects.create(hashtag=lower, bucket_start=now, count=1)
+
+        migration = import_module('social_media.migrations.0012_merge_mixed_case_hashtags')
+        migration.merge_mixed_case_hashtags(apps, None)
+
+        self.assertEqual(
+            list(Hashtag.objects.order_by('name').values_list('id', 'name', 'posts_count')),
+            [(lower.id, 'run', 2), (tagged.id, 'yoga', 1)]
+        )
+        self.assertEqual(Hashtag.objects.get(id=lower.id).trending_score, 3.0)
+        self.assertEqual(set(PostHashtag.objects.filter(hashtag=lower).values_list('post_id', flat=True)),
+                         {first.id, second.id})
+        self.assertEqual(HashtagTrendBucket.objects.get(hashtag=lower).count, 3)
+
+
+@override_settings(SOCIAL_FANOUT_FOLLOWER_LIMIT=2)
+class HomeTimelineTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader, self.author, self.celebrity = self.users[:3]
+        Follow.objects.create(follower=self.reader, following=self.author)
+        Follow.objects.create(follower=self.reader, following=self.celebrity)
+        UserProfile.objects.update_or_create(user=self.celebrity, defaults={'followers_count': 5})
+
+        self.posts = []
+        for i in range(6):
+            post = self.create_post(self.author if i % 2 else self.celebrity, type='fitness' if i < 3 else 'nutrition')
+            Post.objects.filter(id=post.id).update(created_at=timezone.now() - timezone.timedelta(minutes=10 - i))
+            post.refresh_from_db()
+            if post.user == self.author:
+                push_to_timelines(post, [self.reader.id])
+            self.posts.append(post)
+        self.newest_first = self.posts[::-1]
+
+    def test_merges_pushed_and_pulled_posts(self):
+        self.assertEqual(home_timeline_page(self.reader, limit=10), self.newest_first)
+        self.assertEqual(
+            home_timeline_page(self.reader, limit=10, post_type='fitness'), self.posts[:3][::-1]
+        )
+
+    def test_pages_with_a_cursor(self):
+        first = home_timeline_page(self.reader, limit=4)
+        rest = home_timeline_page(self.reader, (first[-1].created_at, first[-1].id), limit=4)
+        self.assertEqual(first + rest, self.newest_first)
+
+    def test_api_pages_over_the_timeline(self):
+        # An author that crossed the limit has both pushed and pulled posts; each shows once
+        push_to_timelines(self.posts[0], [self.reader.id])
+        response = self.clients[0].get('/api/social_media/posts/', {'page_size': 4})
+        ids = [post['id'] for post in response.data['results']]
+        response = self.clients[0].get(response.data['next'])
+        ids += [post['id'] for post in response.data['results']]
+        self.assertEqual(ids, [str(post.id) for post in self.newest_first])
+        self.assertIsNone(response.data['next'])
+
+        response = self.clients[0].get(response.data['previous'])
+        self.assertEqual([post['id'] for post in response.data['results']], ids[:4])
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 4)
+
+
+    @override_settings(SOCIAL_TIMELINE_BACKFILL=2)
+    def test_rebuild_fills_timelines_from_existing_data(self):
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+
+        # The pulled celebrity's posts stay out of followers' timelines; each author keeps their own
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.reader).values_list('post_id', flat=True)),
+            {self.posts[5].id, self.posts[3].id}
+        )
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.celebrity).values_list('post_id', flat=True)),
+            {self.posts[4].id, self.posts[2].id}
+        )
+        self.assertEqual(TimelineEntry.objects.filter(user=self.author).count(), 2)
+
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(TimelineEntry.objects.count(), 6)
+
+
+@override_settings(SOCIAL_FANOUT_CHUNK_SIZE=1, SOCIAL_FANOUT_MAX_ATTEMPTS=2)
+class FanoutJobTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author, *self.followers = self.users
+        for follower in self.followers:
+            Follow.objects.create(follower=follower, following=self.author)
+        self.post = self.create_post(self.author)
+        self.job = FanoutJob.objects.create(post=self.post)
+
+    def notified_ids(self):
+        return sorted(Notification.objects.filter(post=self.post).values_list('user_id', flat=True))
+
+    def expire_lease(self):
+        FanoutJob.objects.filter(id=self.job.id).update(locked_until=timezone.now() - timezone.timedelta(seconds=1))
+
+    def test_resumes_from_the_cursor_after_the_lease_expires(self):
+        # The worker dies during the second chunk; nothing of that chunk is kept
+        with mock.patch('social_media.fanout.publish_notifications', side_effect=[None, SystemExit]):
+            with self.assertRaises(SystemExit):
+                run_fanout_job(self.job.id)
+        job = FanoutJob.objects.get(id=self.job.id)
+        self.assertEqual((job.status, job.processed_count), ('running', 1))
+        self.assertEqual(self.notified_ids(), [self.followers[0].id])
+        self.assertIsNone(run_fanout_job(self.job.id))
+
+        self.expire_lease()
+        run_fanout_job(self.job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.processed_count), ('done', 2, 3))
+        self.assertEqual(self.notified_ids(), [follower.id for follower in self.followers])
+        self.assertEqual(TimelineEntry.objects.filter(post=self.post).count(), 3)
+
+    def test_chunk_rolls_back_when_the_lease_is_lost(self):
+        # Another worker claims the job after its lease expired, just before this chunk is written
+        def take_over(user_ids):
+            FanoutJob.objects.filter(id=self.job.id).update(locked_until=timezone.now() + timezone.timedelta(hours=1))
+            return set()
+
+        with mock.patch('social_media.fanout.digest_user_ids', side_effect=take_over):
+            run_fanout_job(self.job.id)
+        job = FanoutJob.objects.get(id=self.job.id)
+        self.assertEqual((job.status, job.cursor, job.processed_count), ('running', 0, 0))
+        self.assertGreater(job.locked_until, timezone.now() + timezone.timedelta(minutes=30))
+        self.assertEqual(self.notified_ids(), [])
+        self.assertFalse(TimelineEntry.objects.filter(post=self.post).exists())
+
+    def test_fails_after_the_last_attempt(self):
+        with mock.patch('social_media.fanout.publish_notifications', side_effect=RuntimeError('broker down')):
+            for status in ('pending', 'failed'):
+                with self.assertRaises(RuntimeError):
+                    run_fanout_job(self.job.id)
+                self.job.refresh_from_db()
+                self.assertEqual(self.job.status, status)
+        self.assertEqual(self.job.last_error, 'broker down')
+        self.assertIsNone(run_fanout_job(self.job.id))
+
+    def test_digest_followers_get_a_digest_event_instead(self):
+        UserProfile.objects.update_or_create(user=self.followers[1], defaults={'notification_digest': 'daily'})
+        run_fanout_job(self.job.id)
+        self.assertEqual(self.notified_ids(), [self.followers[0].id, self.followers[2].id])
+        self.assertEqual(
+            list(NotificationDigestEvent.objects.filter(post=self.post).values_list('user_id', flat=True)),
+            [self.followers[1].id]
+        )
+        self.assertEqual(TimelineEntry.objects.filter(post=self.post).count(), 3)
+
+    @mock.patch('social_media.management.commands.run_fanout_worker.time.sleep')
+    def test_worker_waits_before_retrying_a_failure(self, sleep):
+        with mock.patch(
+            'social_media.management.commands.run_fanout_worker.run_fanout_job', side_effect=[RuntimeError, None]
+        ):
+            call_command('run_fanout_worker', interval=0.5, stdout=StringIO(), stderr=StringIO())
+        sleep.assert_called_once_with(0.5)
+
+
+class NotificationCoalescingTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = self.users[0]
+        self.post = self.create_post(self.owner)
+
+    def like(self, user):
+        return notify(self.owner.id, 'liked', user, 'New like', 'liked your fitness post', post=self.post)
+
+    def test_events_merge_into_one_aggregate(self):
+        for user in self.users[1:]:
+            self.like(user)
+        # A repeat event from a sampled actor is not counted again
+        aggregate = self.like(self.users[2])
+
+        self.assertEqual(Notification.objects.filter(user=self.owner).count(), 1)
+        self.assertEqual(aggregate.actor_count, 3)
+        self.assertEqual([actor['id'] for actor in aggregate.sample_actors],
+                         [self.users[2].id, self.users[3].id, self.users[1].id])
+        self.assertEqual(aggregate.message, 'User 2, User 3 and 1 other liked your fitness post')
+        self.assertEqual(unread_count(self.owner.id), 1)
+
+    @mock.patch('social_media.counters.start_counter_flusher')
+    def test_reaction_notifies_after_the_counter_transaction(self, start_flusher):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.clients[1].post(
+                f"/api/social_media/posts/{self.post.id}/reaction/", {'reaction_type': 'liked'}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(Notification.objects.filter(user=self.owner).exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Notification.objects.get(user=self.owner).message, 'User 1 liked your fitness post')
+
+    def test_read_aggregate_starts_a_new_one(self):
+        first = self.like(self.users[1])
+        mark_read(self.owner.id, [first.id])
+        second = self.like(self.users[2])
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(second.actor_count, 1)
+
+    def test_closed_window_starts_a_new_one(self):
+        first = self.like(self.users[1])
+        Notification.objects.filter(id=first.id).update(
+            created_at=timezone.now() - timezone.timedelta(days=2)
+        )
+        self.assertNotEqual(self.like(self.users[2]).id, first.id)
+
+    def test_collapse_merges_existing_rows_by_read_state(self):
+        def row(user, is_read=False):
+            return Notification.objects.create(
+                user=self.owner, notification_type='liked', title='New like', post=self.post,
+                from_user=user, message=f"{user.name} liked your fitness post", is_read=is_read
+            )
+        row(self.users[1]), row(self.users[2]), row(self.users[3])
+        read = row(self.users[1], is_read=True)
+
+        report = collapse_notifications()
+
+        self.assertEqual((report['users'], report['kept'], report['deleted']), (1, 2, 2))
+        unread = Notification.objects.get(user=self.owner, is_read=False)
+        self.assertEqual(unread.actor_count, 3)
+        self.assertEqual(unread.message, 'User 3, User 2 and 1 other liked your fitness post')
+        self.assertEqual(Notification.objects.get(id=read.id).group_key, f"liked:{self.post.id}")
+
+
+@override_settings(EMAIL_HOST_USER='digests@example.com', EMAIL_HOST_PASSWORD='secret', TASK_QUEUE_RUN_EAGERLY=True)
+class NotificationDigestTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = self.users[0]
+        UserProfile.objects.update_or_create(
+            user=self.reader, defaults={'notification_digest': 'hourly', 'digest_email': True}
+        )
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+    def buffer(self, author, created_at):
+        buffer_post_events(self.create_post(author), [self.reader.id])
+        NotificationDigestEvent.objects.filter(created_at__gt=created_at).update(created_at=created_at)
+
+    def test_sums_events_of_past_periods_only(self):
+        self.buffer(self.users[1], self.hour - timezone.timedelta(minutes=20))
+        self.buffer(self.users[2], self.hour - timezone.timedelta(minutes=10))
+        # Buffered in the current period: waits for the next digest
+        self.buffer(self.users[3], self.hour + timezone.timedelta(minutes=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = send_notification_digests(now=self.hour + timezone.timedelta(minutes=5))
+
+        self.assertEqual((report['users'], report['events'], report['emails']), (1, 2, 1))
+        digest = Notification.objects.get(user=self.reader, notification_type='digest')
+        self.assertEqual(digest.message, '2 new posts from User 2 and User 1')
+        self.assertEqual(NotificationDigestEvent.objects.get().from_user, self.users[3])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.reader.email])
+
+    def test_first_event_after_a_quiet_spell_waits_for_its_period(self):
+        UserProfile.objects.filter(user=self.reader).update(digest_sent_at=self.hour - timezone.timedelta(days=3))
+        self.buffer(self.users[1], self.hour + timezone.timedelta(minutes=1))
+        report = send_notification_digests(now=self.hour + timezone.timedelta(minutes=5))
+        self.assertEqual(report['users'], 0)
+
+    def test_overlapping_run_is_skipped(self):
+        self.buffer(self.users[1], self.hour - timezone.timedelta(minutes=20))
+        cache.add(RUN_LOCK_NAME, 1)
+        report = send_notification_digests(now=self.hour + timezone.timedelta(minutes=5))
+        self.assertTrue(report['skipped'])
+        self.assertEqual(NotificationDigestEvent.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Declarative partitioning is PostgreSQL only')
+class PartitionTests(SocialTestCase):
+    table = PostView._meta.db_table
+
+    def setUp(self):
+        super().setUp()
+        self.month = month_start(timezone.now())
+        self.post = self.create_post(self.users[0])
+
+    def rows_in(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+            return cursor.fetchone()[0]
+
+    def view_at(self, created_at):
+        view = PostView.objects.create(user=self.users[1], post=self.post, ip_address='127.0.0.1')
+        PostView.objects.filter(id=view.id).update(created_at=created_at)
+        return view
+
+    def test_migration_partitions_tables(self):
+        for model in (Notification, PostView):
+            self.assertTrue(is_partitioned(model._meta.db_table))
+        months = monthly_partitions(self.table)
+        for offset in range(4):
+            self.assertIn(add_months(self.month, offset), months)
+
+    def test_new_partition_takes_its_rows_from_the_default(self):
+        month = add_months(self.month, 6)
+        self.view_at(month + timezone.timedelta(days=2))
+        self.assertEqual(self.rows_in(default_partition_name(self.table)), 1)
+
+        created = create_partitions(months_ahead=6)
+
+        self.assertIn(partition_name(self.table, month), created)
+        self.assertEqual(self.rows_in(partition_name(self.table, month)), 1)
+        self.assertEqual(self.rows_in(default_partition_name(self.table)), 0)
+        self.assertEqual(PostView.objects.count(), 1)
+
+    def test_expired_partitions_are_dropped(self):
+        self.view_at(self.month + timezone.timedelta(days=1))
+        # Six months of post views are kept, so eight months on the first two are gone
+        report = drop_expired_partitions(now=add_months(self.month, 7))
+
+        self.assertEqual(
+            report['PostView']['dropped'],
+            [partition_name(self.table, self.month), partition_name(self.table, add_months(self.month, 1))]
+        )
+        self.assertEqual(report['Notification']['dropped'], [])
+        self.assertNotIn(self.month, monthly_partitions(self.table))
+        self.assertEqual(PostView.objects.count(), 0)
+
+    def test_unpartition_and_partition_keep_rows(self):
+        view = self.view_at(self.month + timezone.timedelta(days=1))
+
+        with connection.schema_editor() as editor:
+            unpartition_table(editor, PostView)
+        self.assertFalse(is_partitioned(self.table))
+        self.assertTrue(PostView.objects.filter(id=view.id).exists())
+
+        with connection.schema_editor() as editor:
+            partition_table(editor, PostView)
+        self.assertTrue(is_partitioned(self.table))
+        self.assertTrue(PostView.objects.filter(id=view.id).exists())
+        # The id sequence continues after the copied rows
+        self.assertGreater(self.view_at(self.month).id, view.id)
+
+
+class UnreadNotificationTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = self.users[0]
+        self.now = timezone.now()
+
+    def notification(self, minutes_ago=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = Notification.objects.create(
+                user=self.owner, notification_type='follow', title='New follower', message='Someone followed you'
+            )
+        if minutes_ago is not None:
+            Notification.objects.filter(id=notification.id).update(
+                created_at=self.now - timezone.timedelta(minutes=minutes_ago)
+            )
+        return notification
+
+    def test_watermark_and_row_reads_combine(self):
+        self.assertEqual(unread_count(self.owner.id), 0)
+        first, second, third = self.notification(10), self.notification(5), self.notification(1)
+        self.assertEqual(unread_count(self.owner.id), 3)
+
+        self.assertEqual(mark_read(self.owner.id, [third.id]), 1)
+        # Already read rows are not counted twice
+        self.assertEqual(mark_read(self.owner.id, [third.id]), 0)
+        self.assertEqual(unread_count(self.owner.id), 2)
+
+        self.assertEqual(mark_all_read(self.owner), 0)
+        self.assertEqual(mark_read(self.owner.id, [first.id]), 0)
+        self.notification()
+        self.assertEqual(unread_count(self.owner.id), 1)
+
+        response = self.clients[0].get('/api/social_media/notifications/')
+        read = {item['id']: item['is_read'] for item in response.data['results']}
+        self.assertEqual([read[str(row.id)] for row in (first, second, third)], [True, True, True])
+        self.assertEqual(list(read.values()).count(False), 1)
+
+    def test_mark_all_read_up_to(self):
+        self.notification(10), self.notification(5), self.notification(1)
+
+        self.assertEqual(mark_all_read(self.owner, self.now - timezone.timedelta(minutes=7)), 2)
+        # The watermark never moves back
+        self.assertEqual(mark_all_read(self.owner, self.now - timezone.timedelta(minutes=20)), 2)
+        self.assertEqual(unread_count(self.owner.id), 2)
+
+        response = self.clients[0].post(
+            '/api/social_media/notifications/mark-read/',
+            {'up_to': (self.now - timezone.timedelta(minutes=3)).isoformat()}, format='json'
+        )
+        self.assertEqual(response.data, {'unread_count': 1})
+        response = self.clients[0].post('/api/social_media/notifications/mark-read/', {'up_to': 'soon'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        # A watermark in the future is clamped to now
+        self.assertEqual(mark_all_read(self.owner, self.now + timezone.timedelta(days=1)), 0)
+        self.assertLessEqual(UserProfile.objects.get(user=self.owner).notifications_read_at, timezone.now())
+
+
+class PeriodicThreadTests(TestCase):
+    def test_failures_are_logged_and_the_loop_goes_on(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError('boom')
+
+        thread = PeriodicThread('test-loop', flaky, 0.01)
+        with self.assertLogs('social_media.background', 'ERROR') as logs:
+            thread.start()
+            deadline = time.monotonic() + 5
+            while len(calls) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            thread.stop()
+        self.assertGreaterEqual(len(calls), 3)
+        self.assertIn('test-loop failed', logs.output[0])
+
+
+class BrokerTests(TestCase):
+    def test_dispatch_reaches_only_the_users_clients(self):
+        async def scenario():
+            local = Broker()
+            subscriptions = [local.subscribe(user_id % 100) for user_id in range(1000)]
+            local.dispatch([(7, 'a'), (7, None), (8, 'b')])
+            await asyncio.sleep(0)
+
+            received = {
+                index: [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+                for index, subscription in enumerate(subscriptions) if not subscription.queue.empty()
+            }
+            self.assertEqual(set(received), {index for index in range(1000) if index % 100 in (7, 8)})
+            self.assertEqual(received[7], ['a', None])
+            self.assertEqual(received[8], ['b'])
+
+            for subscription in subscriptions:
+                local.unsubscribe(subscription)
+            self.assertEqual(local.connection_count(), 0)
+
+        asyncio.run(scenario())
+
+    def test_stalled_client_is_told_to_resync(self):
+        async def scenario():
+            local = Broker()
+            subscription = local.subscribe(1)
+            local.dispatch([(1, str(i)) for i in range(QUEUE_SIZE + 1)])
+            await asyncio.sleep(0)
+            self.assertEqual(subscription.queue.qsize(), 1)
+            self.assertIs(subscription.queue.get_nowait(), RESYNC)
+
+        asyncio.run(scenario())
+
+
+class StreamClient:
+    """Drives one request through the stream app, as an ASGI server would"""
+
+    def __init__(self, app, query_string=''):
+        self.disconnect = asyncio.Event()
+        self.messages = asyncio.Queue()
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': STREAM_PATH, 'headers': [],
+            'query_string': query_string.encode(),
+        }
+        self.task = asyncio.create_task(app(scope, self.receive, self.messages.put))
+
+    async def receive(self):
+        await self.disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def status(self):
+        return (await asyncio.wait_for(self.messages.get(), 10))['status']
+
+    async def next_event(self):
+        """The next SSE event name and data, skipping the retry hint and keepalives"""
+        while True:
+            body = (await asyncio.wait_for(self.messages.get(), 10))['body'].decode()
+            if body.startswith('event: '):
+                name, data = body.split('\n')[:2]
+                return name[len('event: '):], data[len('data: '):]
+
+    async def close(self):
+        self.disconnect.set()
+        await self.task
+
+
+class NotificationStreamTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create_user(email=f"user{i}@example.com", name=f"User {i}", password='pw', is_active=True)
+            for i in range(3)
+        ]
+        self.app = NotificationStreamApp(None)
+
+    def ticket(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post('/api/social_media/notifications/stream/ticket/').data['ticket']
+
+    def test_tokens_in_the_query_string_are_refused(self):
+        async def scenario():
+            client = StreamClient(self.app, 'token=abc')
+            self.assertEqual(await client.status(), 401)
+            await client.task
+
+        asyncio.run(scenario())
+
+    def test_ticket_opens_one_stream(self):
+        ticket = self.ticket(self.users[0])
+
+        async def scenario():
+            first = StreamClient(self.app, f"ticket={ticket}")
+            self.assertEqual(await first.status(), 200)
+            again = StreamClient(self.app, f"ticket={ticket}")
+            self.assertEqual(await again.status(), 401)
+            await again.task
+            await first.close()
+
+        asyncio.run(scenario())
+
+    def test_many_idle_streams_get_only_their_events(self):
+        tickets = [(user, self.ticket(user)) for user in self.users for _ in range(100)]
+
+        async def scenario():
+            clients = [(user, StreamClient(self.app, f"ticket={ticket}")) for user, ticket in tickets]
+            for _, client in clients:
+                self.assertEqual(await client.status(), 200)
+                self.assertEqual(await client.next_event(), ('unread_count', '{"unread_count": 0}'))
+            self.assertEqual(broker.connection_count(), 300)
+
+            await sync_to_async(Notification.objects.create)(
+                user=self.users[1], notification_type='follow', title='New follower', message='User 2 followed you'
+            )
+            for user, client in clients:
+                if user == self.users[1]:
+                    name, data = await client.next_event()
+                    self.assertEqual(name, 'notification')
+                    self.assertIn('User 2 followed you', data)
+                    self.assertEqual(await client.next_event(), ('unread_count', '{"unread_count": 1}'))
+            # Checked once every recipient has its events, so nothing can still be on the way
+            for user, client in clients:
+                if user != self.users[1]:
+                    self.assertTrue(client.messages.empty())
+
+            await asyncio.gather(*(client.close() for _, client in clients))
+            self.assertEqual(broker.connection_count(), 0)
+
+        asyncio.run(scenario())
@@ -0,0 +1,156 @@
+"""
+Follow-based home timelines.
+
+Posts are pushed into a per-user ``TimelineEntry`` table when they are created
+(fan-out on write, done in the background by ``fanout.py``). Authors above
+``SOCIAL_FANOUT_FOLLOWER_LIMIT`` followers are skipped at write time and their
+posts are pulled in when the timeline is read (fan-out on read), so a single
+celebrity post never turns into millions of rows.
+
+The newest-first home feed pages over the ``TimelineEntry(user, -created_at)``
+index, merges in the same page of pulled authors' posts and only then loads the
+posts of that page.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Post, Follow, TimelineEntry, UserProfile
+from .pagination import KeysetPagination
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def is_high_fanout_author(user_id):
+    """Authors whose posts are merged in at read time instead of being pushed"""
+    followers_count = UserProfile.objects.filter(user_id=user_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    return (followers_count or 0) >= settings.SOCIAL_FANOUT_FOLLOWER_LIMIT
+
+
+def push_to_timelines(post, user_ids):
+    """Insert the post into the given users' timelines, skipping users who already have it"""
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post.id, created_at=post.created_at) for user_id in user_ids],
+        batch_size=FANOUT_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill_timeline(user, author):
+    """Copy an author's recent posts into a new follower's timeline"""
+    if is_high_fanout_author(author.id):
+        return
+
+    recent_posts = Post.objects.filter(user=author).order_by('-created_at').values_list(
+        'id', 'created_at'
+    )[:settings.SOCIAL_TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user=user, post_id=post_id, created_at=created_at) for post_id, created_at in recent_posts],
+        ignore_conflicts=True
+    )
+
+
+def rebuild_timelines(post_model, follow_model, profile_model, entry_model):
+    """Fill timelines from existing follows and posts; takes models so migrations can pass theirs.
+
+    Each author's latest ``SOCIAL_TIMELINE_BACKFILL`` posts go to the author and,
+    unless they are a high-fanout author, to their followers. Existing entries are
+    kept, so the rebuild can be re-run. Returns the number of authors processed.
+    """
+    pulled_ids = set(profile_model.objects.filter(
+        followers_count__gte=settings.SOCIAL_FANOUT_FOLLOWER_LIMIT
+    ).values_list('user_id', flat=True))
+    author_ids = post_model.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+
+    processed = 0
+    for author_id in author_ids.iterator():
+        recent_posts = list(post_model.objects.filter(user_id=author_id).order_by('-created_at').values_list(
+            'id', 'created_at'
+        )[:settings.SOCIAL_TIMELINE_BACKFILL])
+        reader_ids = [author_id]
+        if author_id not in pulled_ids:
+            reader_ids += list(follow_model.objects.filter(following_id=author_id).values_list('follower_id', flat=True))
+
+        # Chunked by readers so a large follower list never builds one huge list of rows
+        step = max(1, FANOUT_BATCH_SIZE // max(1, len(recent_posts)))
+        for start in range(0, len(reader_ids), step):
+            entry_model.objects.bulk_create(
+                [
+                    entry_model(user_id=user_id, post_id=post_id, created_at=created_at)
+                    for user_id in reader_ids[start:start + step]
+                    for post_id, created_at in recent_posts
+                ],
+                batch_size=FANOUT_BATCH_SIZE,
+                ignore_conflicts=True
+            )
+        processed += 1
+    return processed
+
+
+def remove_author_from_timeline(user, author):
+    """Drop an unfollowed author's posts from a user's timeline"""
+    TimelineEntry.objects.filter(user=user, post__user=author).delete()
+
+
+def pulled_author_ids(user):
+    """High-fanout authors the user follows, whose posts are not pushed to the timeline"""
+    return list(Follow.objects.filter(
+        follower=user,
+        following__social_profile__followers_count__gte=settings.SOCIAL_FANOUT_FOLLOWER_LIMIT
+    ).values_list('following_id', flat=True))
+
+
+def home_timeline_queryset(user):
+    """Posts pushed to the user's timeline plus posts pulled from high-fanout authors they follow"""
+    pushed_posts = TimelineEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(Q(id__in=pushed_posts) | Q(user_id__in=pulled_author_ids(user)))
+
+
+def _beyond(created_at_field, id_field, position, reverse):
+    created_at, post_id = position
+    lookup = 'gt' if reverse else 'lt'
+    return Q(**{f"{created_at_field}__{lookup}": created_at}) | Q(
+        **{created_at_field: created_at, f"{id_field}__{lookup}": post_id}
+    )
+
+
+def home_timeline_page(user, position=None, limit=20, post_type=None, reverse=False):
+    """
+    Up to limit posts of the user's home timeline, newest first, after position
+    (the (created_at, id) of the last post of the previous page). With reverse,
+    the posts before position, oldest first.
+    """
+    entry_order = ('created_at', 'post_id') if reverse else ('-created_at', '-post_id')
+    post_order = ('created_at', 'id') if reverse else ('-created_at', '-id')
+
+    entries = TimelineEntry.objects.filter(user=user)
+    if post_type:
+        entries = entries.filter(post__type=post_type)
+    if position is not None:
+        entries = entries.filter(_beyond('created_at', 'post_id', position, reverse))
+    rows = list(entries.order_by(*entry_order).values_list('created_at', 'post_id')[:limit])
+
+    author_ids = pulled_author_ids(user)
+    if author_ids:
+        pulled = Post.objects.filter(user_id__in=author_ids)
+        if post_type:
+            pulled = pulled.filter(type=post_type)
+        if position is not None:
+            pulled = pulled.filter(_beyond('created_at', 'id', position, reverse))
+        rows += pulled.order_by(*post_order).values_list('created_at', 'id')[:limit]
+
+    # A post can be both pushed and pulled when its author crossed the follower limit
+    rows = sorted(set(rows), reverse=not reverse)[:limit]
+    posts = Post.objects.in_bulk([post_id for _, post_id in rows])
+    return [posts[post_id] for _, post_id in rows if post_id in posts]
+
+
+class HomeTimelinePagination(KeysetPagination):
+    """Keyset pagination of the newest-first home feed, read from the timeline table"""
+
+    def get_page_rows(self, queryset, position, limit, reverse=False):
+        post_type = self.request.query_params.get('type')
+        return home_timeline_page(
+            self.request.user, position, limit, post_type if post_type != 'all' else None, reverse
+        )
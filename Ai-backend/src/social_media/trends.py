@@ -0,0 +1,128 @@
+"""
+Sliding-window hashtag trends.
+
+Each hashtag use increments an hourly ``HashtagTrendBucket`` when the post is
+created. ``refresh_hashtag_trends`` sums the buckets of the current
+``SOCIAL_TREND_WINDOW_HOURS`` window and the one before it, and stores velocity
+(uses per hour) and growth on ``Hashtag``. It also caches the top-K hashtag ids,
+so the trending endpoint reads K rows instead of grouping a week of
+``PostHashtag`` rows. The refresh runs from the ``refresh_hashtag_trends``
+command (cron), never inside a request.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import Hashtag, HashtagTrendBucket, PostHashtag
+
+TREND_BUCKET = timedelta(hours=1)
+TRENDING_IDS_CACHE_KEY = 'trending_hashtag_ids'
+TRENDING_TOPICS_CACHE_KEY = 'trending_topics'  # Serialized topics, cached by the trending endpoint
+TRENDING_CACHE_TIMEOUT = 60 * 10
+
+
+def bucket_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def record_hashtag_uses(hashtag_ids, at=None):
+    """Count one use of each hashtag in the bucket for `at` (now by default)"""
+    hashtag_ids = list(hashtag_ids)
+    if not hashtag_ids:
+        return
+    start = bucket_start(at or timezone.now())
+
+    # Create missing buckets, then increment in place so concurrent posts never lose a count
+    HashtagTrendBucket.objects.bulk_create(
+        [HashtagTrendBucket(hashtag_id=hashtag_id, bucket_start=start, count=0) for hashtag_id in hashtag_ids],
+        ignore_conflicts=True
+    )
+    HashtagTrendBucket.objects.filter(
+        hashtag_id__in=hashtag_ids, bucket_start=start
+    ).update(count=F('count') + 1)
+
+
+def rebuild_trend_buckets(now=None):
+    """Recreate the buckets of the last two windows from PostHashtag rows"""
+    now = now or timezone.now()
+    since = bucket_start(now) - 2 * timedelta(hours=settings.SOCIAL_TREND_WINDOW_HOURS)
+
+    counts = {}
+    for hashtag_id, created_at in PostHashtag.objects.filter(created_at__gte=since).values_list(
+        'hashtag_id', 'created_at'
+    ).iterator(chunk_size=5000):
+        key = (hashtag_id, bucket_start(created_at))
+        counts[key] = counts.get(key, 0) + 1
+
+    HashtagTrendBucket.objects.filter(bucket_start__gte=since).delete()
+    HashtagTrendBucket.objects.bulk_create(
+        [HashtagTrendBucket(hashtag_id=hashtag_id, bucket_start=start, count=count)
+         for (hashtag_id, start), count in counts.items()],
+        batch_size=1000
+    )
+    return len(counts)
+
+
+def refresh_hashtag_trends(now=None, limit=None):
+    """
+    Recompute velocity and growth for hashtags used in the last two windows and
+    cache the top `limit` hashtag ids. Returns the number of hashtags scored.
+    """
+    now = now or timezone.now()
+    limit = limit or settings.SOCIAL_TRENDING_TOPICS_LIMIT
+    window = timedelta(hours=settings.SOCIAL_TREND_WINDOW_HOURS)
+    # The current hour's bucket is still filling, so it belongs to the current window
+    current_start = bucket_start(now) + TREND_BUCKET - window
+    previous_start = current_start - window
+
+    HashtagTrendBucket.objects.filter(bucket_start__lt=previous_start).delete()
+
+    totals = HashtagTrendBucket.objects.filter(bucket_start__gte=previous_start).values('hashtag_id').annotate(
+        current=Sum('count', filter=Q(bucket_start__gte=current_start), default=0),
+        previous=Sum('count', filter=Q(bucket_start__lt=current_start), default=0),
+    )
+
+    window_hours = window.total_seconds() / 3600
+    scored = []
+    for row in totals:
+        velocity = row['current'] / window_hours
+        previous_velocity = row['previous'] / window_hours
+        # Rising hashtags rank above ones that are merely steady at the same volume
+        trending_score = velocity + max(velocity - previous_velocity, 0)
+        growth_rate = (row['current'] - row['previous']) * 100.0 / max(row['previous'], 1)
+        scored.append(Hashtag(id=row['hashtag_id'], trending_score=trending_score, growth_rate=growth_rate))
+
+    scored_ids = [hashtag.id for hashtag in scored]
+    Hashtag.objects.exclude(id__in=scored_ids).filter(
+        Q(trending_score__gt=0) | ~Q(growth_rate=0)
+    ).update(trending_score=0, growth_rate=0)
+    Hashtag.objects.bulk_update(scored, ['trending_score', 'growth_rate'], batch_size=1000)
+
+    top = sorted((hashtag for hashtag in scored if hashtag.trending_score > 0),
+                 key=lambda hashtag: hashtag.trending_score, reverse=True)[:limit]
+    cache.set(TRENDING_IDS_CACHE_KEY, [hashtag.id for hashtag in top], TRENDING_CACHE_TIMEOUT)
+    cache.delete(TRENDING_TOPICS_CACHE_KEY)
+    return len(scored)
+
+
+def get_trending_hashtags():
+    """
+    Top-K hashtags in rank order. When the cached list has expired, the scores the
+    last refresh_hashtag_trends run stored are read through the trending_score index;
+    requests never run the refresh themselves.
+    """
+    hashtag_ids = cache.get(TRENDING_IDS_CACHE_KEY)
+    if hashtag_ids is None:
+        hashtags = list(
+            Hashtag.objects.filter(trending_score__gt=0)
+            .order_by('-trending_score', 'id')[:settings.SOCIAL_TRENDING_TOPICS_LIMIT]
+        )
+        # add, not set: a list written meanwhile by a refresh is newer than this one
+        cache.add(TRENDING_IDS_CACHE_KEY, [hashtag.id for hashtag in hashtags], TRENDING_CACHE_TIMEOUT)
+        return hashtags
+
+    hashtags = Hashtag.objects.in_bulk(hashtag_ids)
+    return [hashtags[hashtag_id] for hashtag_id in hashtag_ids if hashtag_id in hashtags]
@@ -0,0 +1,93 @@
+"""
+Unread notification counts.
+
+A notification is unread while its ``is_read`` flag is off and it was created
+after the user's ``UserProfile.notifications_read_at`` watermark. "Mark all as
+read" moves the watermark with one UPDATE instead of flipping every row. The
+unread count is cached per user. It goes up as notifications are created, goes
+down as single ones are read, and is recounted (over rows newer than the
+watermark only) when the watermark moves. A badge lookup is one cache read.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification, UserProfile
+from .partitions import within_retention
+
+
+def _count_key(user_id):
+    return f"notifications_unread:{user_id}"
+
+
+def get_read_watermark(user_id):
+    return UserProfile.objects.filter(user_id=user_id).values_list('notifications_read_at', flat=True).first()
+
+
+def unread_notifications(user_id, watermark):
+    queryset = within_retention(Notification.objects.filter(user_id=user_id, is_read=False))
+    if watermark is not None:
+        queryset = queryset.filter(created_at__gt=watermark)
+    return queryset
+
+
+def unread_count(user_id):
+    count = cache.get(_count_key(user_id))
+    if count is None:
+        count = unread_notifications(user_id, get_read_watermark(user_id)).count()
+        # add, not set: a count written meanwhile by mark_all_read is newer than this one
+        cache.add(_count_key(user_id), count, settings.SOCIAL_UNREAD_COUNT_TIMEOUT)
+    return max(count, 0)
+
+
+def _adjust(user_id, delta):
+    # Users without a cached count are recounted on their next lookup
+    try:
+        cache.incr(_count_key(user_id), delta)
+    except ValueError:
+        pass
+
+
+def record_new_notifications(notifications):
+    """Count new notifications as unread once the transaction that created them commits"""
+    per_user = {}
+    for notification in notifications:
+        per_user[notification.user_id] = per_user.get(notification.user_id, 0) + 1
+
+    def apply():
+        for user_id, created in per_user.items():
+            _adjust(user_id, created)
+
+    if per_user:
+        transaction.on_commit(apply)
+
+
+def forget_unread_counts(user_ids):
+    """Drop cached counts after bulk changes; they are recounted on the next lookup"""
+    cache.delete_many([_count_key(user_id) for user_id in user_ids])
+
+
+def mark_read(user_id, notification_ids):
+    """Flag single notifications read; returns how many were unread"""
+    updated = unread_notifications(user_id, get_read_watermark(user_id)).filter(
+        id__in=notification_ids
+    ).update(is_read=True)
+    if updated:
+        _adjust(user_id, -updated)
+    return updated
+
+
+def mark_all_read(user, up_to=None):
+    """Move the read watermark forward to up_to (default now); returns the new unread count"""
+    now = timezone.now()
+    up_to = min(up_to or now, now)
+    UserProfile.objects.get_or_create(user=user)
+    UserProfile.objects.filter(
+        Q(notifications_read_at__isnull=True) | Q(notifications_read_at__lt=up_to), user=user
+    ).update(notifications_read_at=up_to)
+
+    count = unread_notifications(user.id, get_read_watermark(user.id)).count()
+    cache.set(_count_key(user.id), count, settings.SOCIAL_UNREAD_COUNT_TIMEOUT)
+    return count
@@ -8,6 +8,7 @@ urlpatterns = [
     path('posts/<uuid:post_id>/reaction/', views.toggle_reaction, name='toggle_reaction'),
     path('posts/<uuid:post_id>/bookmark/', views.toggle_bookmark, name='toggle_bookmark'),
     path('posts/<uuid:post_id>/share/', views.share_post, name='share_post'),
+    path('posts/views/', views.record_views, name='record_views'),
     
     # Comment endpoints
     path('posts/<uuid:post_id>/comments/', views.get_post_comments, name='post_comments'),
@@ -23,8 +24,12 @@ urlpatterns = [
     
     # Discover endpoints
     path('discover/', views.discover_posts, name='discover_posts'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     
     # Notification endpoints
     path('notifications/', views.get_notifications, name='notifications'),
     path('notifications/unread-count/', views.get_unread_count, name='unread_count'),
+    path('notifications/mark-read/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
+    path('notifications/preferences/', views.notification_preferences, name='notification_preferences'),
+    path('notifications/stream/ticket/', views.notification_stream_ticket, name='notification_stream_ticket'),
 ]
@@ -3,57 +3,68 @@ from django.http import HttpResponse
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Count, Avg, Case, When, IntegerField, Prefetch, F
+from django.db.models import Case, When, IntegerField, F
 from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.core.cache import cache
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 
+from analytics.rollups import community_stats
 from .models import (
-    Post, PostMedia, PostMetrics, Hashtag, PostHashtag, Reaction, Comment,
+    Post, PostMedia, PostMetrics, Comment,
     CommentLike, Follow, Bookmark, Share, Message, UserProfile, Report,
-    Notification, PostView
+    Notification, PostView, SuggestedFollows
 )
+from .autocomplete import suggest_hashtags, suggest_users
+from .coalescing import notify_on_commit
+from .counters import PostCounters, record_post_counters, reaction_deltas, toggle_reaction_row
+from .fragments import serialize_posts
+from .loaders import load_viewer_state, load_comment_state
+from .pagination import KeysetPagination
+from .partitions import within_retention
+from .post_views import record_post_views
+from .realtime import issue_stream_ticket, publish_unread_changed
+from .search import search_posts
+from .fanout import fan_out_post
+from .follow_graph import get_following, invalidate_follow_graph
+from .timeline import (
+    HomeTimelinePagination, backfill_timeline, remove_author_from_timeline, home_timeline_queryset
+)
+from .unread import get_read_watermark, mark_all_read, mark_read, unread_count
+from .trends import TRENDING_TOPICS_CACHE_KEY, TRENDING_CACHE_TIMEOUT, get_trending_hashtags
 from .serializers import (
     PostSerializer, CreatePostSerializer, ReactionSerializer, CommentSerializer,
     FollowSerializer, MessageSerializer, CreateMessageSerializer, UserProfileSerializer,
     NotificationSerializer, TrendingTopicSerializer, SuggestedUserSerializer,
-    CommunityStatsSerializer, UserBasicSerializer
+    CommunityStatsSerializer, UserBasicSerializer, NotificationPreferencesSerializer
 )
 
 User = get_user_model()
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
 # ===================== POST VIEWS =====================
 
 class PostListView(generics.ListAPIView):
     serializer_class = PostSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         user = self.request.user
         post_type = self.request.query_params.get('type', None)
         sort_by = self.request.query_params.get('sort', 'recent')  # recent, trending, popular
+        feed = self.request.query_params.get('feed', 'home')  # home, all
         
-        # Optimized queryset with prefetch
-        queryset = Post.objects.select_related('user').prefetch_related(
-            'media',
-            'metrics',
-            Prefetch('posthashtag_set', queryset=PostHashtag.objects.select_related('hashtag')),
-            Prefetch('reactions', queryset=Reaction.objects.filter(user=user)),
-            Prefetch('bookmarks', queryset=Bookmark.objects.filter(user=user)),
-            Prefetch('comments', queryset=Comment.objects.filter(parent=None).select_related('user'))
-        )
+        # Home feed reads the user's materialized timeline; 'all' is the global feed
+        if feed == 'all':
+            queryset = Post.objects.all()
+        else:
+            queryset = home_timeline_queryset(user)
         
         # Filter by type
         if post_type and post_type != 'all':
@@ -74,7 +85,16 @@ class PostListView(generics.ListAPIView):
         cache_key = f"user_activity_{request.user.id}"
         cache.set(cache_key, timezone.now(), 300)  # 5 minutes
         
-        return super().list(request, *args, **kwargs)
+        # The newest-first home feed pages over the timeline table instead of the posts table
+        feed = request.query_params.get('feed', 'home')
+        sort_by = request.query_params.get('sort', 'recent')
+        paginator = (
+            HomeTimelinePagination() if feed != 'all' and sort_by not in ('trending', 'popular') else self.paginator
+        )
+        
+        # Post bodies come from the fragment cache, so the page query needs no joins or prefetches
+        page = paginator.paginate_queryset(self.filter_queryset(self.get_queryset()), request, view=self)
+        return paginator.get_paginated_response(serialize_posts(page, self.get_serializer_context()))
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -92,25 +112,14 @@ def create_post(request):
                 profile.posts_count = F('posts_count') + 1
                 profile.save()
                 
-                # Create notification for followers
-                followers = Follow.objects.filter(following=request.user).select_related('follower')
-                notifications = []
-                for follow in followers:
-                    user_name = request.user.name.split()[0] if request.user.name else request.user.email.split('@')[0]
-                    notifications.append(Notification(
-                        user=follow.follower,
-                        notification_type='post',
-                        title=f"New post from {user_name}",
-                        message=f"{user_name} shared a new {post.type} post",
-                        post=post,
-                        from_user=request.user
-                    ))
-                
-                if notifications:
-                    Notification.objects.bulk_create(notifications)
+                # Follower timelines and notifications are written in the background after commit
+                fan_out_post(post)
                 
                 # Return created post
-                response_serializer = PostSerializer(post, context={'request': request})
+                response_serializer = PostSerializer(post, context={
+                    'request': request,
+                    'viewer_state': load_viewer_state(request.user, [post])
+                })
                 return Response(response_serializer.data, status=status.HTTP_201_CREATED)
                 
         except Exception as e:
@@ -136,82 +145,20 @@ def toggle_reaction(request, post_id):
             )
         
         with transaction.atomic():
-            # Check if user already reacted
-            existing_reaction = Reaction.objects.filter(user=request.user, post=post).first()
+            # One upsert on the (user, post) key, then one UPDATE for counters and score
+            previous_type, current_type = toggle_reaction_row(request.user.id, post.id, reaction_type)
+            record_post_counters(post.id, **reaction_deltas(previous_type, current_type))
             
-            if existing_reaction:
-                if existing_reaction.reaction_type == reaction_type:
-                    # Remove reaction
-                    existing_reaction.delete()
-                    
-                    # Update post counts
-                    if reaction_type == 'liked':
-                        post.likes_count = F('likes_count') - 1
-                    elif reaction_type == 'loved':
-                        post.loves_count = F('loves_count') - 1
-                    elif reaction_type == 'motivated':
-                        post.motivates_count = F('motivates_count') - 1
-                    
-                    post.save()
-                    post.refresh_from_db()
-                    
-                    # Recalculate engagement score
-                    post.calculate_engagement_score()
-                    post.save()
-                    
-                    return Response({'message': 'Reaction removed'}, status=status.HTTP_200_OK)
-                else:
-                    # Update existing reaction
-                    # First decrease old count
-                    if existing_reaction.reaction_type == 'liked':
-                        post.likes_count = F('likes_count') - 1
-                    elif existing_reaction.reaction_type == 'loved':
-                        post.loves_count = F('loves_count') - 1
-                    elif existing_reaction.reaction_type == 'motivated':
-                        post.motivates_count = F('motivates_count') - 1
-                    
-                    # Then increase new count
-                    if reaction_type == 'liked':
-                        post.likes_count = F('likes_count') + 1
-                    elif reaction_type == 'loved':
-                        post.loves_count = F('loves_count') + 1
-                    elif reaction_type == 'motivated':
-                        post.motivates_count = F('motivates_count') + 1
-                    
-                    existing_reaction.reaction_type = reaction_type
-                    existing_reaction.save()
-            else:
-                # Create new reaction
-                Reaction.objects.create(
-                    user=request.user,
-                    post=post,
-                    reaction_type=reaction_type
-                )
-                
-                # Update post counts
-                if reaction_type == 'liked':
-                    post.likes_count = F('likes_count') + 1
-                elif reaction_type == 'loved':
-                    post.loves_count = F('loves_count') + 1
-                elif reaction_type == 'motivated':
-                    post.motivates_count = F('motivates_count') + 1
-            
-            post.save()
-            post.refresh_from_db()
-            
-            # Recalculate engagement score
-            post.calculate_engagement_score()
-            post.save()
+            if current_type is None:
+                return Response({'message': 'Reaction removed'}, status=status.HTTP_200_OK)
             
             # Create notification for post owner (if not self)
-            if post.user != request.user:
-                Notification.objects.create(
-                    user=post.user,
-                    notification_type=reaction_type,
+            if post.user_id != request.user.id:
+                notify_on_commit(
+                    post.user_id, reaction_type, request.user,
                     title=f"Your post was {reaction_type}!",
-                    message=f"{request.user.name} {reaction_type} your {post.type} post",
-                    post=post,
-                    from_user=request.user
+                    action=f"{reaction_type} your {post.type} post",
+                    post=post
                 )
             
             return Response({'message': 'Reaction updated'}, status=status.HTTP_200_OK)
@@ -238,12 +185,10 @@ def toggle_bookmark(request, post_id):
         
         if not created:
             bookmark.delete()
-            post.bookmarks_count = F('bookmarks_count') - 1
-            post.save()
+            record_post_counters(post.id, bookmarks_count=-1)
             return Response({'message': 'Bookmark removed', 'bookmarked': False})
         else:
-            post.bookmarks_count = F('bookmarks_count') + 1
-            post.save()
+            record_post_counters(post.id, bookmarks_count=1)
             return Response({'message': 'Post bookmarked', 'bookmarked': True})
             
     except Post.DoesNotExist:
@@ -259,24 +204,16 @@ def share_post(request, post_id):
         # Create share record
         Share.objects.create(user=request.user, post=post)
         
-        # Update post count
-        post.shares_count = F('shares_count') + 1
-        post.save()
-        post.refresh_from_db()
-        
-        # Recalculate engagement score
-        post.calculate_engagement_score()
-        post.save()
+        # Update post count and engagement score
+        record_post_counters(post.id, shares_count=1)
         
         # Create notification for post owner (if not self)
-        if post.user != request.user:
-            Notification.objects.create(
-                user=post.user,
-                notification_type='share',
+        if post.user_id != request.user.id:
+            notify_on_commit(
+                post.user_id, 'share', request.user,
                 title=f"Your post was shared!",
-                message=f"{request.user.name} shared your {post.type} post",
-                post=post,
-                from_user=request.user
+                action=f"shared your {post.type} post",
+                post=post
             )
         
         return Response({'message': 'Post shared successfully'})
@@ -284,6 +221,18 @@ def share_post(request, post_id):
     except Post.DoesNotExist:
         return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def record_views(request):
+    """Record a batch of post views reported by the client"""
+    post_ids = request.data.get('post_ids')
+    if not isinstance(post_ids, list):
+        return Response({'error': 'post_ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Deduplicated and written in the background, see post_views
+    accepted = record_post_views(post_ids, request.user.id, request.META.get('REMOTE_ADDR') or '0.0.0.0')
+    return Response({'accepted': accepted}, status=status.HTTP_202_ACCEPTED)
+
 # ===================== COMMENT VIEWS =====================
 
 @api_view(['GET'])
@@ -292,15 +241,18 @@ def get_post_comments(request, post_id):
     """Get comments for a specific post"""
     try:
         post = Post.objects.get(id=post_id)
-        comments = Comment.objects.filter(post=post, parent=None).select_related('user').prefetch_related(
-            Prefetch('replies', queryset=Comment.objects.select_related('user'))
+        comments = Comment.objects.filter(post=post, parent=None).select_related(
+            'user', 'user__social_profile'
         ).order_by('created_at')
         
-        page = request.query_params.get('page', 1)
-        paginator = StandardResultsSetPagination()
+        paginator = KeysetPagination()
         result_page = paginator.paginate_queryset(comments, request)
         
-        serializer = CommentSerializer(result_page, many=True, context={'request': request})
+        # Replies and like state for the whole page in a fixed number of queries
+        serializer = CommentSerializer(result_page, many=True, context={
+            'request': request,
+            'comment_state': load_comment_state(request.user, comments=result_page)
+        })
         return paginator.get_paginated_response(serializer.data)
         
     except Post.DoesNotExist:
@@ -333,25 +285,17 @@ def create_comment(request, post_id):
                 content=content.strip()
             )
             
-            # Update post comment count
-            post.comments_count = F('comments_count') + 1
-            post.save()
-            post.refresh_from_db()
-            
-            # Recalculate engagement score
-            post.calculate_engagement_score()
-            post.save()
+            # Update post comment count and engagement score
+            PostCounters.apply(post.id, comments_count=1)
             
             # Create notification for post owner (if not self)
-            if post.user != request.user:
-                Notification.objects.create(
-                    user=post.user,
-                    notification_type='comment',
+            if post.user_id != request.user.id:
+                notify_on_commit(
+                    post.user_id, 'comment', request.user,
                     title=f"New comment on your post",
-                    message=f"{request.user.name} commented on your {post.type} post",
+                    action=f"commented on your {post.type} post",
                     post=post,
-                    comment=comment,
-                    from_user=request.user
+                    comment=comment
                 )
             
             serializer = CommentSerializer(comment, context={'request': request})
@@ -378,6 +322,7 @@ def toggle_follow(request, user_id):
         )
         
         with transaction.atomic():
+            transaction.on_commit(lambda: invalidate_follow_graph(request.user.id, target_user.id))
             if not created:
                 # Unfollow
                 follow.delete()
@@ -392,6 +337,8 @@ def toggle_follow(request, user_id):
                 follower_profile.save()
                 following_profile.save()
                 
+                remove_author_from_timeline(request.user, target_user)
+                
                 return Response({'message': 'Unfollowed successfully', 'following': False})
             else:
                 # Follow
@@ -405,13 +352,13 @@ def toggle_follow(request, user_id):
                 follower_profile.save()
                 following_profile.save()
                 
-                # Create notification
-                Notification.objects.create(
-                    user=target_user,
-                    notification_type='follow',
+                backfill_timeline(request.user, target_user)
+                
+                # Create notification, merged with other recent follows
+                notify_on_commit(
+                    target_user.id, 'follow', request.user,
                     title=f"New follower!",
-                    message=f"{request.user.name} started following you",
-                    from_user=request.user
+                    action="started following you"
                 )
                 
                 return Response({'message': 'Followed successfully', 'following': True})
@@ -423,16 +370,31 @@ def toggle_follow(request, user_id):
 @permission_classes([permissions.IsAuthenticated])
 def get_suggested_users(request):
     """Get suggested users to follow"""
-    # Get users that current user is not following
-    following_ids = Follow.objects.filter(follower=request.user).values_list('following_id', flat=True)
-    excluded_ids = list(following_ids) + [request.user.id]
+    # Follows made since the last suggestion run are filtered out here
+    following_ids = get_following(request.user.id)
+    excluded_ids = set(following_ids) | {request.user.id}
+    
+    # Precomputed friends-of-friends candidates with their mutual connection counts
+    suggestions = SuggestedFollows.objects.filter(user=request.user).values_list('candidates', flat=True).first()
+    mutual_counts = {}
+    for user_id, mutual_count in suggestions or []:
+        if user_id not in excluded_ids:
+            mutual_counts[user_id] = mutual_count
+        if len(mutual_counts) == 10:
+            break
+    
+    rank = {user_id: position for position, user_id in enumerate(mutual_counts)}
+    profiles = UserProfile.objects.select_related('user').filter(user_id__in=rank)
+    suggested_users = sorted(profiles, key=lambda profile: rank[profile.user_id])
     
-    # Find users with mutual connections
-    suggested_users = UserProfile.objects.select_related('user').exclude(
-        user_id__in=excluded_ids
-    ).annotate(
-        mutual_count=Count('user__followers', filter=Q(user__followers__follower__in=following_ids))
-    ).order_by('-mutual_count', '-followers_count')[:10]
+    # Top up with popular users when there are not enough friends of friends
+    if len(suggested_users) < 10:
+        suggested_users += list(UserProfile.objects.select_related('user').exclude(
+            user_id__in=excluded_ids | set(mutual_counts)
+        ).order_by('-followers_count')[:10 - len(suggested_users)])
+    
+    for profile in suggested_users:
+        profile.mutual_count = mutual_counts.get(profile.user_id, 0)
     
     serializer = SuggestedUserSerializer(suggested_users, many=True, context={'request': request})
     return Response(serializer.data)
@@ -447,56 +409,8 @@ def get_community_stats(request):
     stats = cache.get(cache_key)
     
     if not stats:
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-        
-        total_posts = Post.objects.count()
-        total_users = User.objects.count()
-        posts_today = Post.objects.filter(created_at__date=today).count()
-        posts_this_week = Post.objects.filter(created_at__date__gte=week_ago).count()
-        posts_last_week = Post.objects.filter(
-            created_at__date__gte=week_ago - timedelta(days=7),
-            created_at__date__lt=week_ago
-        ).count()
-        
-        # Calculate engagement rate
-        recent_posts = Post.objects.filter(created_at__gte=timezone.now() - timedelta(days=7))
-        if recent_posts.exists():
-            avg_engagement = recent_posts.aggregate(
-                avg_likes=Avg('likes_count'),
-                avg_comments=Avg('comments_count'),
-                avg_shares=Avg('shares_count')
-            )
-            engagement_rate = (
-                (avg_engagement['avg_likes'] or 0) + 
-                (avg_engagement['avg_comments'] or 0) * 2 + 
-                (avg_engagement['avg_shares'] or 0) * 3
-            ) / 10
-        else:
-            engagement_rate = 0
-        
-        # Find trending category
-        trending_category = Post.objects.filter(
-            created_at__gte=timezone.now() - timedelta(days=7)
-        ).values('type').annotate(
-            count=Count('id')
-        ).order_by('-count').first()
-        
-        # Calculate weekly growth
-        if posts_last_week > 0:
-            growth_rate = ((posts_this_week - posts_last_week) / posts_last_week) * 100
-            weekly_growth = f"+{growth_rate:.1f}%" if growth_rate > 0 else f"{growth_rate:.1f}%"
-        else:
-            weekly_growth = "+100%" if posts_this_week > 0 else "0%"
-        
-        stats = {
-            'total_posts': total_posts,
-            'total_users': total_users,
-            'posts_today': posts_today,
-            'engagement_rate': round(engagement_rate, 1),
-            'trending_category': trending_category['type'].title() if trending_category else 'Wellness',
-            'weekly_growth': weekly_growth
-        }
+        # A few pre-aggregated daily rows, however large posts and users grow
+        stats = community_stats()
         
         # Cache for 5 minutes
         cache.set(cache_key, stats, 300)
@@ -508,21 +422,12 @@ def get_community_stats(request):
 @permission_classes([permissions.IsAuthenticated])
 def get_trending_topics(request):
     """Get trending hashtags"""
-    cache_key = 'trending_topics'
-    topics = cache.get(cache_key)
+    topics = cache.get(TRENDING_TOPICS_CACHE_KEY)
     
-    if not topics:
-        # Get hashtags from recent posts
-        recent_hashtags = Hashtag.objects.filter(
-            posthashtag__created_at__gte=timezone.now() - timedelta(days=7)
-        ).annotate(
-            recent_posts=Count('posthashtag')
-        ).order_by('-recent_posts', '-posts_count')[:10]
-        
-        topics = TrendingTopicSerializer(recent_hashtags, many=True).data
-        
-        # Cache for 10 minutes
-        cache.set(cache_key, topics, 600)
+    if topics is None:
+        # Top-K list kept by the trend engine; refresh_hashtag_trends clears this cache
+        topics = TrendingTopicSerializer(get_trending_hashtags(), many=True).data
+        cache.set(TRENDING_TOPICS_CACHE_KEY, topics, TRENDING_CACHE_TIMEOUT)
     
     return Response(topics)
 
@@ -536,27 +441,21 @@ def discover_posts(request):
     category = request.query_params.get('category', 'all')
     sort_by = request.query_params.get('sort', 'trending')
     
-    queryset = Post.objects.select_related('user').prefetch_related(
-        'media',
-        'metrics',
-        Prefetch('posthashtag_set', queryset=PostHashtag.objects.select_related('hashtag')),
-        Prefetch('reactions', queryset=Reaction.objects.filter(user=request.user)),
-        Prefetch('bookmarks', queryset=Bookmark.objects.filter(user=request.user)),
-    )
+    queryset = Post.objects.all()
     
-    # Apply search
+    # Apply search: full-text match ranked by relevance blended with engagement
     if search_query:
-        queryset = queryset.filter(
-            Q(content__icontains=search_query) |
-            Q(posthashtag__hashtag__name__icontains=search_query.replace('#', ''))
-        ).distinct()
+        queryset = search_posts(queryset, search_query)
+        sort_by = request.query_params.get('sort', 'relevance')
     
     # Apply category filter
     if category != 'all':
         queryset = queryset.filter(type=category)
     
     # Apply sorting
-    if sort_by == 'trending':
+    if sort_by == 'relevance' and search_query:
+        queryset = queryset.order_by('-search_score')
+    elif sort_by == 'trending':
         queryset = queryset.order_by('-engagement_score', '-created_at')
     elif sort_by == 'popular':
         queryset = queryset.order_by('-likes_count', '-loves_count', '-created_at')
@@ -565,11 +464,37 @@ def discover_posts(request):
     else:  # recent
         queryset = queryset.order_by('-created_at')
     
-    paginator = StandardResultsSetPagination()
+    paginator = KeysetPagination()
     result_page = paginator.paginate_queryset(queryset, request)
-    serializer = PostSerializer(result_page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serialize_posts(result_page, {'request': request}))
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def autocomplete(request):
+    """Suggest hashtags and people as the user types; '#' or '@' restricts the kind"""
+    query = request.query_params.get('q', '').strip()
+    kind = request.query_params.get('type', 'all')
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 8)), 20))
+    except ValueError:
+        limit = 8
     
-    return paginator.get_paginated_response(serializer.data)
+    if query.startswith('#'):
+        kind = 'hashtags'
+    elif query.startswith('@'):
+        kind = 'users'
+    
+    results = {'hashtags': [], 'users': []}
+    if not query:
+        return Response(results)
+    
+    if kind in ('all', 'hashtags'):
+        results['hashtags'] = suggest_hashtags(query, limit)
+    if kind in ('all', 'users'):
+        users = suggest_users(query, limit, exclude_user_id=request.user.id)
+        results['users'] = UserBasicSerializer(users, many=True).data
+    
+    return Response(results)
 
 # ===================== REAL-TIME NOTIFICATIONS =====================
 
@@ -577,27 +502,68 @@ def discover_posts(request):
 @permission_classes([permissions.IsAuthenticated])
 def get_notifications(request):
     """Get user notifications"""
-    notifications = Notification.objects.filter(user=request.user).select_related(
+    # The created_at bound lets PostgreSQL skip expired monthly partitions
+    notifications = within_retention(Notification.objects.filter(user=request.user)).select_related(
         'from_user', 'post', 'comment'
     ).order_by('-created_at')
     
     # Mark as read
     unread_ids = request.query_params.get('mark_read', '').split(',')
     if unread_ids and unread_ids[0]:
-        Notification.objects.filter(
-            id__in=unread_ids, 
-            user=request.user
-        ).update(is_read=True)
+        if mark_read(request.user.id, unread_ids):
+            publish_unread_changed(request.user.id)
     
-    paginator = StandardResultsSetPagination()
+    paginator = KeysetPagination()
     result_page = paginator.paginate_queryset(notifications, request)
-    serializer = NotificationSerializer(result_page, many=True, context={'request': request})
+    serializer = NotificationSerializer(result_page, many=True, context={
+        'request': request,
+        'notifications_read_at': get_read_watermark(request.user.id)
+    })
     
     return paginator.get_paginated_response(serializer.data)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def mark_all_notifications_read(request):
+    """Mark every notification created up to `up_to` (default now) as read"""
+    up_to = None
+    if request.data.get('up_to'):
+        up_to = parse_datetime(str(request.data['up_to']))
+        if up_to is None:
+            return Response({'error': 'up_to must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(up_to):
+            up_to = timezone.make_aware(up_to)
+    
+    # One watermark write however many notifications it covers
+    count = mark_all_read(request.user, up_to)
+    publish_unread_changed(request.user.id)
+    return Response({'unread_count': count})
+
+@api_view(['GET', 'PATCH'])
+@permission_classes([permissions.IsAuthenticated])
+def notification_preferences(request):
+    """Get or update the new-post digest preference"""
+    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    if request.method == 'GET':
+        return Response(NotificationPreferencesSerializer(profile).data)
+    
+    serializer = NotificationPreferencesSerializer(profile, data=request.data, partial=True)
+    if serializer.is_valid():
+        serializer.save()
+        return Response(serializer.data)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def notification_stream_ticket(request):
+    """Issue a short-lived single-use ticket for opening the notification stream"""
+    return Response({
+        'ticket': issue_stream_ticket(request.user.id),
+        'expires_in': settings.SOCIAL_REALTIME_TICKET_TIMEOUT
+    })
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_unread_count(request):
     """Get count of unread notifications"""
-    count = Notification.objects.filter(user=request.user, is_read=False).count()
-    return Response({'unread_count': count})
\ No newline at end of file
+    return Response({'unread_count': unread_count(request.user.id)})
\ No newline at end of file
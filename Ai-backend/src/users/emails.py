@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.mail import send_mail
+
+
+def send_otp_email(user_email, otp):
+    subject = 'WellZO - Your Account Verification OTP'
+    message = f'''
+Hello!
+
+Your OTP code for WellZO account verification is: {otp}
+
+This code is valid for {settings.OTP_EXPIRY_MINUTES} minutes.
+
+If you didn't request this code, please ignore this email.
+
+Best regards,
+WellZO Team
+    '''
+    email_from = settings.DEFAULT_FROM_EMAIL
+    recipient_list = [user_email]
+    
+    try:
+        # Check if email settings are configured
+        if not settings.EMAIL_HOST_PASSWORD or settings.EMAIL_HOST_PASSWORD == 'xxxx xxxx xxxx xxxx':
+            print("Email password not configured. Please set EMAIL_APP_PASSWORD with the Gmail App Password.")
+            return False
+            
+        if not settings.EMAIL_HOST_USER:
+            print("Email user not configured. Please set EMAIL_HOST_USER.")
+            return False
+
+        print(f"Attempting to send email from {email_from} to {recipient_list}")
+        print(f"Using SMTP server: {settings.EMAIL_HOST}:{settings.EMAIL_PORT}")
+        
+        send_mail(
+            subject,
+            message,
+            email_from,
+            recipient_list,
+            fail_silently=False
+        )
+        print(f"✓ OTP email sent successfully to {user_email}")
+        return True
+    except Exception as e:
+        print(f"✗ Error sending OTP email to {user_email}")
+        print(f"Error details: {str(e)}")
+        print("Email configuration:")
+        print(f"- HOST: {settings.EMAIL_HOST}")
+        print(f"- PORT: {settings.EMAIL_PORT}")
+        print(f"- USER: {settings.EMAIL_HOST_USER}")
+        print(f"- TLS: {settings.EMAIL_USE_TLS}")
+        print(f"- FROM: {email_from}")
+        return False
+
+# You might want to customize the email content for password reset
+def send_password_reset_otp_email(user_email, otp):
+    subject = 'WellZO - Your Password Reset Code'
+    message = f'''
+Hello!
+
+A request has been made to reset the password for your WellZO account.
+Your OTP code for password reset is: {otp}
+
+This code is valid for {settings.OTP_EXPIRY_MINUTES if hasattr(settings, 'OTP_EXPIRY_MINUTES') else 10} minutes.
+
+If you didn't request this code, please ignore this email or contact support if you have concerns.
+
+Best regards,
+WellZO Team
+    '''
+    email_from = settings.DEFAULT_FROM_EMAIL
+    recipient_list = [user_email]
+    
+    # Reusing the try-except block from your existing send_otp_email
+    try:
+        if not settings.EMAIL_HOST_PASSWORD or settings.EMAIL_HOST_PASSWORD == 'xxxx xxxx xxxx xxxx':
+            print("Email password not configured. Please set EMAIL_APP_PASSWORD.")
+            return False
+        if not settings.EMAIL_HOST_USER:
+            print("Email user not configured. Please set EMAIL_HOST_USER.")
+            return False
+        
+        send_mail(
+            subject, message, email_from, recipient_list, fail_silently=False
+        )
+        print(f"✓ Password Reset OTP email sent successfully to {user_email}")
+        return True
+    except Exception as e:
+        print(f"✗ Error sending Password Reset OTP email to {user_email}: {str(e)}")
+        return False
@@ -0,0 +1,39 @@
+import logging
+
+from core.task_queue import task
+
+from .emails import send_otp_email, send_password_reset_otp_email
+from .models import User, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+@task(queue='email')
+def send_verification_otp(user_id):
+    """Email the user's current verification OTP, so a deduplicated resend sends the newest code"""
+    user = User.objects.filter(id=user_id).first()
+    if user is None or not user.otp:
+        return
+    if not send_otp_email(user.email, user.otp):
+        raise RuntimeError(f"Failed to send OTP email to {user.email}")
+
+
+@task(queue='email')
+def send_password_reset_otp(user_id):
+    """Email the user's current password reset OTP"""
+    user = User.objects.filter(id=user_id, is_active=True).first()
+    if user is None or not user.otp:
+        return
+    if not send_password_reset_otp_email(user.email, user.otp):
+        raise RuntimeError(f"Failed to send password reset OTP email to {user.email}")
+
+
+@task(queue='maintenance')
+def delete_user_account(user_id):
+    """Delete an account deactivated by DeleteUserAccountView, with everything that cascades from it"""
+    user = User.objects.filter(id=user_id, is_active=False).first()
+    if user is None:
+        return
+    UserProfile.objects.filter(user=user).delete()
+    user.delete()
+    logger.info("User %s deleted successfully.", user.email)
@@ -7,10 +7,11 @@ from django.shortcuts import get_object_or_404
 from google.oauth2 import id_token
 from google.auth.transport import requests
 from django.conf import settings
-from django.core.mail import send_mail
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 from .models import User, UserProfile, UserSession
+from .tasks import send_verification_otp, send_password_reset_otp, delete_user_account
 from .serializers import (
     UserRegistrationSerializer,
     VerifyOTPSerializer,
@@ -19,56 +20,6 @@ from .serializers import (
     RequestPasswordResetOTPSerializer, ConfirmPasswordResetSerializer
 )
 
-def send_otp_email(user_email, otp):
-    subject = 'WellZO - Your Account Verification OTP'
-    message = f'''
-Hello!
-
-Your OTP code for WellZO account verification is: {otp}
-
-This code is valid for {settings.OTP_EXPIRY_MINUTES} minutes.
-
-If you didn't request this code, please ignore this email.
-
-Best regards,
-WellZO Team
-    '''
-    email_from = settings.DEFAULT_FROM_EMAIL
-    recipient_list = [user_email]
-    
-    try:
-        # Check if email settings are configured
-        if not settings.EMAIL_HOST_PASSWORD or settings.EMAIL_HOST_PASSWORD == 'xxxx xxxx xxxx xxxx':
-            print("Email password not configured. Please set EMAIL_APP_PASSWORD with the Gmail App Password.")
-            return False
-            
-        if not settings.EMAIL_HOST_USER:
-            print("Email user not configured. Please set EMAIL_HOST_USER.")
-            return False
-
-        print(f"Attempting to send email from {email_from} to {recipient_list}")
-        print(f"Using SMTP server: {settings.EMAIL_HOST}:{settings.EMAIL_PORT}")
-        
-        send_mail(
-            subject,
-            message,
-            email_from,
-            recipient_list,
-            fail_silently=False
-        )
-        print(f"✓ OTP email sent successfully to {user_email}")
-        return True
-    except Exception as e:
-        print(f"✗ Error sending OTP email to {user_email}")
-        print(f"Error details: {str(e)}")
-        print("Email configuration:")
-        print(f"- HOST: {settings.EMAIL_HOST}")
-        print(f"- PORT: {settings.EMAIL_PORT}")
-        print(f"- USER: {settings.EMAIL_HOST_USER}")
-        print(f"- TLS: {settings.EMAIL_USE_TLS}")
-        print(f"- FROM: {email_from}")
-        return False
-
 def get_tokens_for_user(user):
     refresh = RefreshToken.for_user(user)
     return {
@@ -97,9 +48,11 @@ class UserRegistrationView(APIView):
                         }
                     }, status=status.HTTP_400_BAD_REQUEST)
                 else:
-                    # User exists but not verified, regenerate OTP and send email
+                    # User exists but not verified, regenerate OTP and queue the email
                     existing_user.generate_otp()
-                    if send_otp_email(existing_user.email, existing_user.otp):
+                    if send_verification_otp.enqueue(
+                        args=[existing_user.id], dedupe_key=f"verification_otp:{existing_user.id}"
+                    ):
                         return Response({
                             'success': True,
                             'message': 'OTP resent successfully. Please check your email for verification.',
@@ -121,8 +74,8 @@ class UserRegistrationView(APIView):
                 user = serializer.save()
                 user.generate_otp()
 
-                # Try to send OTP email
-                if send_otp_email(user.email, user.otp):
+                # Queue the OTP email so registration does not wait on SMTP
+                if send_verification_otp.enqueue(args=[user.id], dedupe_key=f"verification_otp:{user.id}"):
                     return Response({
                         'success': True,
                         'message': 'User registered successfully. Please check your email for OTP verification.',
@@ -386,43 +339,6 @@ class GoogleLoginView(APIView):
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-# You might want to customize the email content for password reset
-def send_password_reset_otp_email(user_email, otp):
-    subject = 'WellZO - Your Password Reset Code'
-    message = f'''
-Hello!
-
-A request has been made to reset the password for your WellZO account.
-Your OTP code for password reset is: {otp}
-
-This code is valid for {settings.OTP_EXPIRY_MINUTES if hasattr(settings, 'OTP_EXPIRY_MINUTES') else 10} minutes.
-
-If you didn't request this code, please ignore this email or contact support if you have concerns.
-
-Best regards,
-WellZO Team
-    '''
-    email_from = settings.DEFAULT_FROM_EMAIL
-    recipient_list = [user_email]
-    
-    # Reusing the try-except block from your existing send_otp_email
-    try:
-        if not settings.EMAIL_HOST_PASSWORD or settings.EMAIL_HOST_PASSWORD == 'xxxx xxxx xxxx xxxx':
-            print("Email password not configured. Please set EMAIL_APP_PASSWORD.")
-            return False
-        if not settings.EMAIL_HOST_USER:
-            print("Email user not configured. Please set EMAIL_HOST_USER.")
-            return False
-        
-        send_mail(
-            subject, message, email_from, recipient_list, fail_silently=False
-        )
-        print(f"✓ Password Reset OTP email sent successfully to {user_email}")
-        return True
-    except Exception as e:
-        print(f"✗ Error sending Password Reset OTP email to {user_email}: {str(e)}")
-        return False
-
 class RequestPasswordResetOTPView(APIView):
     def post(self, request):
         serializer = RequestPasswordResetOTPSerializer(data=request.data)
@@ -438,7 +354,9 @@ class RequestPasswordResetOTPView(APIView):
                     }, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
                 if user.generate_otp(): # This saves the user model with new OTP
-                    if send_password_reset_otp_email(user.email, user.otp):
+                    if send_password_reset_otp.enqueue(
+                        args=[user.id], dedupe_key=f"password_reset_otp:{user.id}"
+                    ):
                         return Response({
                             'success': True,
                             'message': f'If an account with {email} exists and is active, an OTP has been sent.'
@@ -502,27 +420,15 @@ class DeleteUserAccountView(APIView):
         user_to_delete = request.user
 
         try:
-            # Attempt to delete the associated UserProfile first (if it exists)
-            # This is good practice to avoid issues if UserProfile has restrictive delete policies
-            # or signals that need to fire before the User is deleted.
-            user_profile = UserProfile.objects.filter(user=user_to_delete).first()
-            if user_profile:
-                user_profile.delete()
-                print(f"UserProfile for {user_to_delete.email} deleted.")
-            
-            # Now delete the User object
-            user_to_delete.delete()
-            print(f"User {user_to_delete.email} deleted successfully.")
+            # Deactivate now so the account is locked out immediately; the profile, posts
+            # and everything else that cascades from the user are deleted by a background task
+            with transaction.atomic():
+                user_to_delete.is_active = False
+                user_to_delete.save(update_fields=['is_active'])
+                delete_user_account.enqueue(args=[user_to_delete.id], dedupe_key=f"delete_user:{user_to_delete.id}")
+            print(f"User {user_to_delete.email} deactivated and queued for deletion.")
             
             return Response({"success": True, "message": "Account deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
-        
-        except UserProfile.DoesNotExist:
-            # If UserProfile does not exist, we can proceed to delete the user
-            # This block might be redundant if .first() is used, as it won't raise DoesNotExist
-            print(f"No UserProfile found for {user_to_delete.email}, proceeding to delete user.")
-            user_to_delete.delete()
-            print(f"User {user_to_delete.email} deleted successfully (no profile was found).")
-            return Response({"success": True, "message": "Account deleted successfully (no profile was found)."}, status=status.HTTP_204_NO_CONTENT)
             
         except Exception as e:
             print(f"Error deleting account for {user_to_delete.email}: {str(e)}")
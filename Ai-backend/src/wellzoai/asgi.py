@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wellzoai.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Long-lived notification streams are served beside Django, see social_media.realtime
+from social_media.realtime import NotificationStreamApp  # noqa: E402
+
+application = NotificationStreamApp(django_application)
@@ -56,7 +56,8 @@ INSTALLED_APPS = [
     'users',
     'rest_framework_simplejwt',
     'corsheaders',
-    'social_media'
+    'social_media',
+    'analytics'
 ]
 
 MIDDLEWARE = [
@@ -128,6 +129,25 @@ DATABASES = {
     }
 }
 
+# Post fragments, counter buffers, the follow graph, view sketches and unread counts
+# are kept in the cache and must be shared by every worker process, so production
+# sets REDIS_URL. The in-memory fallback is private to one process and is only
+# allowed with SOCIAL_REQUIRE_SHARED_CACHE off (development and tests).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+SOCIAL_REQUIRE_SHARED_CACHE = os.getenv('SOCIAL_REQUIRE_SHARED_CACHE', str(not DEBUG)).lower() == 'true'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -206,4 +226,99 @@ if DEBUG:
 # OTP settings
 OTP_EXPIRY_MINUTES = 10
 
+# Background task queue (core.task_queue), worked by `manage.py run_task_worker`
+# Set TASK_QUEUE_WORKER=true where `run_task_worker` runs. Without a worker, tasks of TASK_QUEUE_EAGER_QUEUES
+# run in-process after commit, so OTP and password-reset emails still go out; fan-out and maintenance
+# tasks wait for a worker, so a request never blocks on delivering a post to every follower.
+TASK_QUEUE_WORKER = os.getenv('TASK_QUEUE_WORKER', 'false').lower() == 'true'
+TASK_QUEUE_RUN_EAGERLY = os.getenv('TASK_QUEUE_RUN_EAGERLY', str(not TASK_QUEUE_WORKER)).lower() == 'true'
+TASK_QUEUE_EAGER_QUEUES = ['email']
+TASK_QUEUE_MAX_ATTEMPTS = 5
+TASK_QUEUE_RETRY_BACKOFF = 10  # seconds before the first retry, doubled on each attempt
+TASK_QUEUE_MAX_BACKOFF = 60 * 60
+TASK_QUEUE_LEASE_SECONDS = 60  # renewed while a task runs; an expired lease means the worker died
+# Most tasks of each queue running at once across all workers; queues not listed are unlimited
+TASK_QUEUE_CONCURRENCY = {
+    'email': 4,
+    'fanout': 8,
+    'maintenance': 1,
+}
 
+# Social feed settings
+# Authors with more followers than this are not fanned out on write; their posts
+# are merged into followers' home timelines at read time instead.
+SOCIAL_FANOUT_FOLLOWER_LIMIT = 10000
+# Number of recent posts copied into a timeline when a user follows someone
+SOCIAL_TIMELINE_BACKFILL = 50
+# Follower timeline entries and notifications for a new post are written by a
+# background fan-out job in chunks of this many followers
+SOCIAL_FANOUT_CHUNK_SIZE = 1000
+SOCIAL_FANOUT_LEASE_SECONDS = 60  # A running job whose lease expires is picked up again
+SOCIAL_FANOUT_MAX_ATTEMPTS = 5
+
+# Write-behind post counters: buffer likes/loves/motivates/shares/bookmarks/views
+# deltas and apply them in batched UPDATEs instead of locking the post row per request
+SOCIAL_COUNTER_WRITE_BEHIND = os.getenv('SOCIAL_COUNTER_WRITE_BEHIND', 'false').lower() == 'true'
+SOCIAL_COUNTER_BUFFER = 'cache'  # 'cache' (shared between workers through CACHES) or 'local' (single process, tests)
+SOCIAL_COUNTER_FLUSH_INTERVAL = 0.25  # seconds
+
+# Hashtag trends: hourly use counters summed over a sliding window and compared
+# with the window before it
+SOCIAL_TREND_WINDOW_HOURS = 24
+SOCIAL_TRENDING_TOPICS_LIMIT = 10
+
+# Autocomplete: the top hashtags by posts_count are kept in an in-memory prefix
+# trie, rebuilt in the background every SOCIAL_AUTOCOMPLETE_REFRESH seconds
+SOCIAL_AUTOCOMPLETE_TRIE_SIZE = 5000
+SOCIAL_AUTOCOMPLETE_REFRESH = 300
+
+# Friends-of-friends follow suggestions kept per user by compute_follow_suggestions
+SOCIAL_SUGGESTIONS_PER_USER = 50
+
+# Follow graph: per-user following/follower id arrays cached for an hour; lists
+# longer than SOCIAL_FOLLOW_GRAPH_MAX_CACHED (8 bytes per id) are not cached
+SOCIAL_FOLLOW_GRAPH_TIMEOUT = 60 * 60
+SOCIAL_FOLLOW_GRAPH_MAX_CACHED = 50000
+
+# Post views: unique viewers per post per day are counted with HyperLogLog sketches
+# (2 ** precision bytes each), buffered per process and flushed into views_count
+# every SOCIAL_VIEW_FLUSH_INTERVAL seconds; a sample of views is kept as PostView rows
+SOCIAL_VIEW_HLL_PRECISION = 11
+SOCIAL_VIEW_SAMPLE_RATE = 0.01
+SOCIAL_VIEW_FLUSH_INTERVAL = 5  # seconds
+SOCIAL_VIEW_BATCH_LIMIT = 100  # Post ids accepted per report
+
+# Real-time notifications: GET /api/social_media/notifications/stream/ is a Server-Sent
+# Events stream and must be served by an ASGI server (wellzoai.asgi:application).
+# 'local' delivers within one process; 'postgres' uses LISTEN/NOTIFY across workers
+ASGI_APPLICATION = 'wellzoai.asgi.application'
+SOCIAL_REALTIME_BACKEND = os.getenv('SOCIAL_REALTIME_BACKEND', 'local')
+SOCIAL_REALTIME_HEARTBEAT = 20  # seconds between keepalive comments on an idle stream
+SOCIAL_REALTIME_RETRY_MS = 5000  # Reconnect delay suggested to EventSource clients
+SOCIAL_REALTIME_TICKET_TIMEOUT = 30  # seconds a stream ticket stays valid; each ticket opens one stream
+
+# Unread notification badge counts are cached per user and kept current on
+# writes; the timeout bounds drift from any missed update
+SOCIAL_UNREAD_COUNT_TIMEOUT = 60 * 60
+
+# Reaction, comment, share and follow notifications of one type on one target are
+# merged into one unread aggregate while it is younger than the window (seconds)
+SOCIAL_NOTIFICATION_COALESCE_WINDOW = 60 * 60 * 24
+SOCIAL_NOTIFICATION_SAMPLE_ACTORS = 3  # Latest actors kept on an aggregate
+
+# Notification and PostView are partitioned by month on PostgreSQL; maintain_partitions
+# creates months ahead of time and drops months past retention
+SOCIAL_PARTITION_MONTHS_AHEAD = 3
+SOCIAL_PARTITION_RETENTION_MONTHS = {
+    'Notification': 12,
+    'PostView': 6,
+}
+
+# Digest mode: followers with a digest preference get new posts summarized once per
+# period by send_notification_digests (run from cron every few minutes). Periods are
+# aligned to the epoch in UTC: every hour on the hour, every day at midnight.
+SOCIAL_NOTIFICATION_DIGEST_WINDOWS = {
+    'hourly': 60 * 60,
+    'daily': 60 * 60 * 24,
+}
+SOCIAL_NOTIFICATION_DIGEST_BATCH = 500  # Users summarized per write transaction